@@ -0,0 +1,304 @@
+""" yotools200.yoCrypt 效能基準(無GUI)
+每個案例在獨立的spawn子行程執行 peak RSS互不干擾 結果以JSON輸出方便比較
+
+    python bench_yoCrypt.py --output base.json
+    python bench_yoCrypt.py --quick --compare base.json --tolerance 0.15
+    python bench_yoCrypt.py --api indexed --compression none --compression zlib --compression lzma
+
+indexed的列有stored_bytes/ratio(壓縮後的大小) 並多量一次write_fsync(寫入密文+fsync)
+比較各壓縮方式的encrypt/decrypt(CPU)與write_fsync(I/O)即可看出壓縮是否划算
+"""
+from typing import Callable
+import multiprocessing
+import subprocess
+import platform
+import tempfile
+import argparse
+import random
+import time
+import json
+import math
+import sys
+import os
+
+try: import resource # 只有POSIX有
+except ImportError: resource = None
+
+from yotools200.yoCrypt import yoCrypt_init, hash_password, verify_password, yoAES, STREAM_CHUNK_SIZE, COMPRESSIONS
+from yotools200.yoKDF import KDF
+
+_units = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+_printable = bytes(ord(" ") + i % 95 for i in range(256)) # urandom -> 可列印ASCII(舊格式需要str)
+_words = ("the", "note", "password", "chunk", "value", "error", "line", "save", "open", "file", "key", "index", 
+          "import", "def", "return", "self", "print", "if", "else", "for", "in", "with", "as", "None", "True")
+
+DEFAULT_SIZES = "1K,32K,1M,32M,1G"
+QUICK_SIZES = "1K,64K,1M,16M"
+DEFAULT_KDFS = ["pbkdf2_sha256$100000", "pbkdf2_sha256$200000", "pbkdf2_sha256$400000", "pbkdf2_sha256$800000",
+                "scrypt$16384$8$1", "scrypt$32768$8$1", "scrypt$65536$8$1"]
+QUICK_KDFS = ["pbkdf2_sha256$100000", "scrypt$16384$8$1"]
+APIS = ("legacy", "container", "indexed", "stream")
+PAYLOADS = ("text", "random")
+COMPRESSION_CHOICES = tuple(compression or "none" for compression in COMPRESSIONS)
+LEGACY_COUNT = 360000 # 與main.py相同
+
+def parse_size(text: str) -> int:
+    """ 1K / 32M / 1G -> 位元組數 """
+    text = text.strip().upper().removesuffix("B")
+    unit = text[-1:] if text[-1:] in _units else ""
+    return int(float(text[:len(text)-len(unit)]) * _units[unit])
+
+def format_size(size: int) -> str:
+    for unit in ("G", "M", "K"):
+        if size >= _units[unit] and size % _units[unit] == 0: return f"{size // _units[unit]}{unit}"
+    return str(size)
+
+def percentile(samples: list[float], q: float) -> float:
+    """ nearest-rank百分位數 """
+    ordered = sorted(samples)
+    return ordered[max(0, min(len(ordered)-1, math.ceil(q * len(ordered)) - 1))]
+
+def _payload(size: int, kind: str = "random") -> bytes:
+    """ random: 隨機可列印字元(幾乎不能壓縮) text: 類似程式碼/日誌的ASCII文字 """
+    if kind == "random": return os.urandom(size).translate(_printable)
+    rng = random.Random(size)
+    lines, total = [], 0
+    while total < min(size, 1 << 20): # 1MB的樣本重複 壓縮是逐區塊的 看不到重複
+        line = f"{rng.randint(0, 99999):05d} " + " ".join(rng.choices(_words, k=rng.randint(3, 14))) + "\n"
+        lines.append(line)
+        total += len(line)
+    block = "".join(lines).encode("ascii")
+    return (block * (size // len(block) + 1))[:size]
+
+def _peak_rss_mb(who: int) -> float|None:
+    """ ru_maxrss(Linux為KB macOS為位元組) """
+    if resource is None: return None
+    peak = resource.getrusage(who).ru_maxrss
+    return round(peak / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)
+
+def _measure(func: Callable[[], object], repeat: int, min_repeat: int, budget: float) -> list[float]:
+    """ 先暖身一次 再重複到repeat次或超過budget秒(至少min_repeat次) 回傳每次秒數 """
+    func()
+    samples = []
+    deadline = time.perf_counter() + budget
+    while len(samples) < repeat and (len(samples) < min_repeat or time.perf_counter() < deadline):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def _summary(samples: list[float], size: int|None) -> dict:
+    p50 = percentile(samples, 0.5)
+    row = {"samples": len(samples), "p50_ms": round(p50 * 1000, 3), "p99_ms": round(percentile(samples, 0.99) * 1000, 3),
+           "mean_ms": round(sum(samples) / len(samples) * 1000, 3)}
+    if size is not None: row["mb_per_s"] = round(size / (1 << 20) / p50, 2)
+    return row
+
+# --- 各案例(在子行程中執行) ---
+def _case_kdf(case: dict) -> list[dict]:
+    """ hash_password/verify_password延遲 關閉金鑰快取 """
+    yoCrypt_init(LEGACY_COUNT, 16, 32, "utf-8", key_cache_size=0, kdf=case["kdf"])
+    stored = hash_password(case["password"])
+    timing = (case["repeat"], case["min_repeat"], case["budget"])
+    return [{"op": "hash_password", **_summary(_measure(lambda: hash_password(case["password"]), *timing), None)},
+            {"op": "verify_password", **_summary(_measure(lambda: verify_password(case["password"], stored), *timing), None)}]
+
+def _case_cipher(case: dict) -> list[dict]:
+    """ 單檔加解密吞吐量 固定salt+金鑰快取(同編輯器 KDF另外量) """
+    yoCrypt_init(LEGACY_COUNT, 16, 32, "utf-8", key_cache_size=4, kdf=case["kdf"])
+    password, size, api = case["password"], case["size"], case["api"]
+    salt = yoAES.new_salt()
+    timing = (case["repeat"], case["min_repeat"], case["budget"])
+    plain = _payload(size, case["payload"])
+    if api == "legacy":
+        plain = plain.decode("ascii")
+        encrypt = lambda: yoAES.encrypt(plain, password, salt)
+        encrypted = encrypt()
+        decrypt = lambda: yoAES.decrypt(encrypted, password)
+    elif api == "container":
+        encrypt = lambda: yoAES.encrypt_bytes(plain, password, case["chunk_size"], salt)
+        encrypted = encrypt()
+        decrypt = lambda: yoAES.decrypt_bytes(encrypted, password)
+    elif api == "indexed":
+        compression = case.get("compression", "")
+        encrypt = lambda: yoAES.encrypt_indexed(plain, password, case["chunk_size"], salt, compression)
+        encrypted = encrypt()
+        decrypt = lambda: yoAES.decrypt_bytes(encrypted, password)
+        stored = {"stored_bytes": len(encrypted), "ratio": round(len(encrypted) / size, 4)}
+        with tempfile.TemporaryDirectory() as temp_dir:
+            def write():
+                with open(os.path.join(temp_dir, "crypt"), "wb") as file:
+                    file.write(encrypted)
+                    file.flush()
+                    os.fsync(file.fileno())
+            return [{"op": "encrypt", **_summary(_measure(encrypt, *timing), size), **stored},
+                    {"op": "decrypt", **_summary(_measure(decrypt, *timing), size), **stored},
+                    {"op": "write_fsync", **_summary(_measure(write, *timing), size), **stored}]
+    else:
+        # 串流經過暫存檔 只有一個區塊在記憶體中
+        with tempfile.TemporaryDirectory() as temp_dir:
+            plain_path, crypt_path = os.path.join(temp_dir, "plain"), os.path.join(temp_dir, "crypt")
+            with open(plain_path, "wb") as file: file.write(plain)
+            del plain
+            def encrypt():
+                with open(plain_path, "rb") as src, open(crypt_path, "wb") as dst:
+                    yoAES.encrypt_stream(src, dst, password, case["chunk_size"], salt)
+            def decrypt():
+                with open(crypt_path, "rb") as src, open(os.devnull, "wb") as dst: yoAES.decrypt_stream(src, dst, password)
+            return [{"op": "encrypt", **_summary(_measure(encrypt, *timing), size)},
+                    {"op": "decrypt", **_summary(_measure(decrypt, *timing), size)}]
+    return [{"op": "encrypt", **_summary(_measure(encrypt, *timing), size)},
+            {"op": "decrypt", **_summary(_measure(decrypt, *timing), size)}]
+
+def _case_batch(case: dict) -> list[dict]:
+    """ encrypt_many/decrypt_many 每次含行程池啟動 """
+    yoCrypt_init(LEGACY_COUNT, 16, 32, "utf-8", key_cache_size=4, kdf=case["kdf"])
+    password, workers = case["password"], case["workers"]
+    items = [_payload(case["size"], case["payload"]) for _ in range(case["items"])]
+    salt = yoAES.new_salt()
+    def run(results) -> list:
+        values = [result.value for result in results]
+        if None in values: raise RuntimeError("batch item failed")
+        return values
+    encrypted = run(yoAES.encrypt_many(items, password, max_workers=workers, salt=salt))
+    timing = (case["repeat"], case["min_repeat"], case["budget"])
+    total = case["size"] * case["items"]
+    return [{"op": "encrypt_many", **_summary(_measure(lambda: run(yoAES.encrypt_many(items, password, max_workers=workers, salt=salt)), *timing), total)},
+            {"op": "decrypt_many", **_summary(_measure(lambda: run(yoAES.decrypt_many(encrypted, password, max_workers=workers)), *timing), total)}]
+
+_case_runners = {"kdf": _case_kdf, "cipher": _case_cipher, "batch": _case_batch}
+
+def _case_main(case: dict, conn):
+    """ 子行程進入點 回傳(rows, error) """
+    try:
+        case["kdf"] = KDF.from_string(case["kdf"])
+        rows = _case_runners[case["kind"]](case)
+        peak = {"peak_rss_mb": _peak_rss_mb(resource.RUSAGE_SELF) if resource else None}
+        if case["kind"] == "batch": peak["peak_rss_children_mb"] = _peak_rss_mb(resource.RUSAGE_CHILDREN) if resource else None
+        conn.send(([{**row, **peak} for row in rows], None))
+    except BaseException as error: conn.send(([], f"{type(error).__name__}: {error}"))
+    finally: conn.close()
+
+def run_case(case: dict) -> list[dict]:
+    """ 在新的spawn子行程執行一個案例 """
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_case_main, args=(case, sender))
+    process.start()
+    sender.close()
+    try: rows, error = receiver.recv()
+    except EOFError: rows, error = [], None
+    process.join()
+    if not rows and error is None: error = f"case process exited with code {process.exitcode}"
+    keys = {key: case[key] for key in ("kind", "api", "compression", "size", "kdf", "workers", "items") if case.get(key)}
+    if error: return [{**keys, "error": error}]
+    return [{**keys, **row} for row in rows]
+
+def build_cases(args) -> list[dict]:
+    timing = {"repeat": args.repeat, "min_repeat": args.min_repeat, "budget": args.budget, "password": args.password, "payload": args.payload}
+    cipher_kdf = args.kdf[0]
+    cases = []
+    for kdf in args.kdf: cases.append({"kind": "kdf", "kdf": kdf, **timing})
+    for api in args.api:
+        # 只有indexed(v3)支援壓縮
+        for compression in (args.compression if api == "indexed" else [""]):
+            for size in args.sizes:
+                cases.append({"kind": "cipher", "api": api, "compression": compression, "size": size, "kdf": cipher_kdf, 
+                              "chunk_size": args.chunk_size, **timing})
+    for workers in args.workers:
+        cases.append({"kind": "batch", "size": args.batch_size, "items": args.batch_items, "workers": workers, "kdf": cipher_kdf, **timing})
+    return cases
+
+def _git_commit() -> str|None:
+    try: return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError): return None
+
+def _meta(args) -> dict:
+    import Crypto
+    return {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "commit": _git_commit(), "python": platform.python_version(),
+            "platform": platform.platform(), "machine": platform.machine(), "cpu_count": os.cpu_count(),
+            "pycryptodome": Crypto.__version__, "chunk_size": args.chunk_size, "legacy_count": LEGACY_COUNT,
+            "sizes": [format_size(size) for size in args.sizes], "kdfs": args.kdf, "workers": args.workers,
+            "payload": args.payload, "compressions": [compression or "none" for compression in args.compression],
+            "repeat": args.repeat, "min_repeat": args.min_repeat, "budget_s": args.budget}
+
+def _row_key(row: dict) -> tuple:
+    return tuple(row.get(key) for key in ("kind", "api", "compression", "op", "size", "kdf", "workers", "items"))
+
+def compare(baseline: dict, current: dict, tolerance: float) -> list[str]:
+    """ 與基準比較p50 變慢超過tolerance的列出來 """
+    old_rows = {_row_key(row): row for row in baseline["results"] if "p50_ms" in row}
+    regressions = []
+    for row in current["results"]:
+        old = old_rows.get(_row_key(row))
+        if old is None or "p50_ms" not in row or old["p50_ms"] <= 0: continue
+        change = row["p50_ms"] / old["p50_ms"] - 1
+        if change > tolerance:
+            label = " ".join(str(value) for value in _row_key(row) if value is not None)
+            regressions.append(f"{label}: p50 {old['p50_ms']}ms -> {row['p50_ms']}ms (+{change:.0%})")
+    return regressions
+
+def main(argv: list[str]|None = None) -> int:
+    parser = argparse.ArgumentParser(description="yoCrypt throughput / KDF latency benchmark")
+    parser.add_argument("--quick", action="store_true", help=f"small sweep ({QUICK_SIZES}, {len(QUICK_KDFS)} KDFs)")
+    parser.add_argument("--sizes", help=f"comma separated payload sizes (default {DEFAULT_SIZES})")
+    parser.add_argument("--max-size", type=parse_size, help="drop sizes above this (e.g. 64M)")
+    parser.add_argument("--api", action="append", choices=APIS, help="cipher APIs to run (default all)")
+    parser.add_argument("--compression", action="append", choices=COMPRESSION_CHOICES, 
+                        help="compression for the indexed API (repeatable, default all)")
+    parser.add_argument("--payload", choices=PAYLOADS, default="text", help="text compresses like real notes, random barely compresses")
+    parser.add_argument("--kdf", action="append", help="KDF string, e.g. scrypt$16384$8$1 (repeatable); the first one is used for cipher cases")
+    parser.add_argument("--workers", help="comma separated worker counts for encrypt_many/decrypt_many")
+    parser.add_argument("--batch-size", type=parse_size, default=parse_size("1M"), help="payload size per batch item")
+    parser.add_argument("--batch-items", type=int, default=32)
+    parser.add_argument("--chunk-size", type=parse_size, default=STREAM_CHUNK_SIZE)
+    parser.add_argument("--repeat", type=int, default=30, help="max samples per operation")
+    parser.add_argument("--min-repeat", type=int, default=3)
+    parser.add_argument("--budget", type=float, default=3.0, help="seconds per operation before stopping at --min-repeat")
+    parser.add_argument("--password", default="benchmark-password")
+    parser.add_argument("--output", "-o", help="write JSON here instead of stdout")
+    parser.add_argument("--compare", help="baseline JSON; exit 1 if any p50 regressed more than --tolerance")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    args.sizes = [parse_size(size) for size in (args.sizes or (QUICK_SIZES if args.quick else DEFAULT_SIZES)).split(",")]
+    if args.max_size: args.sizes = [size for size in args.sizes if size <= args.max_size]
+    args.api = args.api or list(APIS)
+    args.compression = [compression.replace("none", "") for compression in (args.compression or COMPRESSION_CHOICES)]
+    args.kdf = [KDF.from_string(kdf).to_string() for kdf in (args.kdf or (QUICK_KDFS if args.quick else DEFAULT_KDFS))]
+    cpu_count = os.cpu_count() or 1
+    default_workers = sorted({1, 2, 4, cpu_count}) if not args.quick else sorted({1, min(2, cpu_count)})
+    args.workers = [int(workers) for workers in args.workers.split(",")] if args.workers else default_workers
+
+    cases = build_cases(args)
+    results = []
+    for index, case in enumerate(cases, 1):
+        label = " ".join(str(case[key]) for key in ("kind", "api", "compression", "kdf", "workers") if case.get(key))
+        if "size" in case: label += f" {format_size(case['size'])}"
+        print(f"[{index}/{len(cases)}] {label}", file=sys.stderr, flush=True)
+        rows = run_case(case)
+        for row in rows:
+            if "error" in row: print(f"    error: {row['error']}", file=sys.stderr)
+            else: print(f"    {row['op']:<16} p50 {row['p50_ms']:>10.3f} ms  p99 {row['p99_ms']:>10.3f} ms"
+                        + (f"  {row['mb_per_s']:>9.2f} MB/s" if "mb_per_s" in row else "")
+                        + (f"  ratio {row['ratio']:.3f}" if "ratio" in row else ""), file=sys.stderr)
+        results.extend(rows)
+
+    report = {"meta": _meta(args), "results": results}
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file: file.write(text + "\n")
+    else: print(text)
+
+    failed = any("error" in row for row in results)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as file: baseline = json.load(file)
+        if baseline["meta"].get("payload", "random") != args.payload: print(f"warning: baseline payload is {baseline['meta'].get('payload', 'random')}", file=sys.stderr)
+        regressions = compare(baseline, report, args.tolerance)
+        for line in regressions: print(f"REGRESSION {line}", file=sys.stderr)
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,64 @@
-import sys, os, qdarktheme 
+import sys, os, re, time, json, shutil, hashlib, difflib, mmap, codecs, bisect, itertools, threading, multiprocessing, qdarktheme 
 from enum import Enum
 from abc import abstractmethod, ABCMeta
+from typing import Any, Callable, Iterator
 from PyQt5.QtWidgets import * # pyright: ignore[reportWildcardImportFromLibrary]
-from PyQt5.QtCore import QTimer, Qt, QRegExp
-from PyQt5.QtGui import QTextCursor, QTextDocument, QSyntaxHighlighter, QKeyEvent
+from PyQt5.QtCore import QTimer, Qt, QRegExp, QEvent, QEventLoop, QObject, QRunnable, QThreadPool, QLockFile, QFileSystemWatcher, pyqtSignal
+from PyQt5.QtGui import QTextCursor, QTextDocument, QSyntaxHighlighter, QKeyEvent, QPainter, QKeySequence, QIntValidator
 from PyQt5.QtGui import QTextCharFormat, QColor, QFont
-from yotools200.yoCrypt import yoCrypt_init, hash_password, verify_password, yoAES
-from yotools200.utils import resource_path, Code_Timer
-yoCrypt_init(360000, 16, 32, "utf-8")
+from yotools200.yoCrypt import yoCrypt_init, yoCrypt_set_kdf, hash_password, verify_password, yoAES, key_cache, IndexedContainer, split_chunks
+from yotools200.yoCrypt import COMPRESSIONS, compression_for
+from yotools200.yoKDF import KDF, calibrate_kdf
+from yotools200.yoRekey import RekeyJob, recover_rekey
+from yotools200.yoFindFiles import FindFilesJob, list_files
+from yotools200.yoSearch import LineIndex, MatchIndex, find_bytes, search_line, search_pattern, match_at, replace_all
+from yotools200.yoText import ENCODING_SAMPLE_SIZE, utf16_len, detect_encoding, encoding_candidates, decode_plain, check_journal
+from yotools200.yoJournal import Op, journal_path, journal_stamp, create_journal, pack_record, read_journal, append_record
+from yotools200.utils import resource_path, atomic_write, file_digest, Code_Timer
+
+kdf_file = resource_path("kdf.txt")
+kdf_kind = "pbkdf2"  # 首次執行時校準的kdf ("pbkdf2" 或 "scrypt")
+kdf_target_ms = 250  # 校準的目標延遲
+
+def _load_kdf() -> KDF|None:
+    """ 讀取kdf設定 還沒校準時None(使用預設的PBKDF2-SHA256 360000次) """
+    try:
+        with open(kdf_file, "r", encoding="utf-8") as file:
+            return KDF.from_string(file.read())
+    except FileNotFoundError: return None
+
+def _calibrate_kdf():
+    """ 首次執行時依本機速度校準kdf並儲存(由MainWindow執行 import時不執行 行程池的子行程也不會) """
+    if os.path.exists(kdf_file): return
+    kdf = calibrate_kdf(kdf_kind, kdf_target_ms)
+    yoCrypt_set_kdf(kdf)
+    try: atomic_write(kdf_file, lambda file: file.write(kdf.to_string().encode("utf-8")))
+    except OSError: pass
+
+yoCrypt_init(360000, 16, 32, "utf-8", key_cache_size=16, kdf=_load_kdf())
 
 encoding = "utf-8"
 password_file = resource_path("password.txt")
 welcome_file = resource_path("Welcome.txt")
+recovery_dir = resource_path("Recovery") # 未儲存分頁的復原快照(每次執行一個子資料夾 正常關閉時刪除)
 filedirname = os.path.dirname(os.path.abspath(__file__))
+rekey_log = os.path.join(filedirname, "rekey.log") # 更改主密碼的提交紀錄(改名途中中斷時 下次啟動完成提交)
 default_font_size = 4
+load_batch_chars = 1 << 20 # 背景載入時每次附加到分頁的字數
+first_batch_chars = 64 * 1024 # 背景載入的第一批(先顯示第一個畫面)
+progressive_load_bytes = 4 << 20 # 超過此大小的普通檔案在背景逐批載入
+viewer_suggest_bytes = 256 << 20 # 開啟超過此大小的普通檔案時 建議改用唯讀檢視
+compact_min_bytes = 1 << 20 # 加密檔的浪費空間超過此值且超過有效資料時壓實
+plain_encodings = ("utf-8", "gbk", "cp950") # 普通檔案依序嘗試的編碼(都不符時用latin-1)
+default_compression = "zlib" # 新加密檔的壓縮方式(見COMPRESSIONS ""為不壓縮) 可在File > Compression逐檔更改
+journal_compact_ratio = 0.25 # 日誌模式: 日誌超過檔案大小的此比例時 存檔改為完整寫入(壓實成新的base)
+journal_compact_min_bytes = 256 * 1024 # 日誌小於此大小時不壓實
+auto_save_delay_ms = 3000 # 停止輸入多久後寫入復原快照
+auto_save_max_delay_ms = 30000 # 持續輸入時 最久多久寫一次復原快照
+watch_debounce_ms = 300 # 開啟的檔案被外部修改: 連續的變化停止多久後才一次檢查
+watch_hash_max_bytes = 64 << 20 # 不超過此大小的檔案記錄雜湊(大小不變只有修改時間變了時比對內容)
+find_debounce_ms = 150 # 尋找欄停止輸入多久後才計算總數
+replace_all_dense = 32 # 全部取代: 結果數*這個超過範圍的長度時整段一次換掉(比逐個取代快)
 window: "MainWindow"
 
 # 函數
@@ -22,6 +67,332 @@ def _clear_dialog_input(dialog: QDialog):
     for widget in dialog.findChildren(QLineEdit):
         widget.clear()
 
+def _store_password_hash(hashed_password: str, file_path: str = password_file):
+    """ 原子寫入密碼雜湊 """
+    atomic_write(file_path, lambda file: file.write(hashed_password.encode("utf-8")))
+
+def _cursor_text(cursor: QTextCursor) -> str:
+    """ 選取的文字(同toPlainText的轉換) """
+    return cursor.selectedText().replace("\u2029", "\n").replace("\u2028", "\n").replace("\u00a0", " ")
+
+def _file_stamp(file_path: str) -> tuple[int, int]:
+    """ (大小, 修改時間) 用來判斷檔案是否被外部修改 """
+    stat = os.stat(file_path)
+    return stat.st_size, stat.st_mtime_ns
+
+def _load_plain_file(file_path: str, task: "CryptoTask") -> tuple[str, str]:
+    """ (背景)逐批讀取並解碼普通檔案 以task.report送出每批文字與進度(第一批較小 先顯示第一個畫面)
+    回傳(剩下的文字, 編碼) 樣本之後才發現編碼不符時送出None(清空) 以下一個編碼重讀 """
+    size = os.path.getsize(file_path)
+    with open(file_path, "rb") as file: sample = file.read(ENCODING_SAMPLE_SIZE)
+    for name in encoding_candidates(detect_encoding(sample, len(sample) == size, plain_encodings), plain_encodings):
+        try:
+            # 文字模式: 增量解碼 跨批次的\r\n也能正確轉換
+            with open(file_path, "r", encoding=name) as file:
+                batch = first_batch_chars
+                while text := file.read(batch):
+                    task.check()
+                    task.report(text, file.buffer.tell() / size)
+                    batch = load_batch_chars
+            return "", name
+        except UnicodeDecodeError: task.report(None)
+    raise RuntimeError("latin-1 should decode anything")
+
+def _write_plain_file(file_path: str, plain_text: str, encoding: str, task: "CryptoTask|None" = None):
+    """ (背景)以encoding原子寫入普通檔案(換行同文字模式的open) 逐批編碼 可取消
+    無法編碼時UnicodeEncodeError 取消或失敗都不會動到原檔 """
+    def write(file):
+        encoder = codecs.getincrementalencoder(encoding)() # BOM只寫一次
+        for start in range(0, len(plain_text), load_batch_chars):
+            if task is not None: task.check()
+            file.write(encoder.encode(plain_text[start:start + load_batch_chars].replace("\n", os.linesep)))
+        file.write(encoder.encode("", final=True))
+    atomic_write(file_path, write)
+
+class ChunkMap:
+    """ 加密檔(v3)區塊與文件位置的對應 由contentsChange維護 
+    存檔時只重新加密變更過的段落 其餘沿用容器中的區塊 """
+    def __init__(self, file_path: str, lengths: list[int], sequence: int, compression: str = ""):
+        self.file_path = file_path
+        self.compression = compression # 容器的壓縮方式(不同時需完整存檔)
+        self.lengths = lengths # 每段在文件中的長度(UTF-16單位 同QTextDocument位置)
+        self.sources: list[int|None] = list(range(len(lengths))) # 對應的容器區塊 None代表已變更
+        self.sequence = sequence # 容器manifest的序號(檔案被外部改寫時不同)
+        self.stamp = _file_stamp(file_path)
+
+    @property
+    def total(self) -> int:
+        return sum(self.lengths)
+
+    @property
+    def is_dirty(self) -> bool:
+        return None in self.sources or len(self.sources) == 0
+
+    def change(self, position: int, removed: int, added: int) -> bool:
+        """ 套用文件變更 把涉及的段落合併成一個已變更的段落 對不上時回傳False """
+        starts = list(itertools.accumulate(self.lengths, initial=0))
+        end = position + removed
+        if end > starts[-1]: return False
+        if not self.lengths:
+            self.lengths, self.sources = [added], [None]
+            return True
+        first = min(bisect.bisect_right(starts, position) - 1, len(self.lengths) - 1)
+        last = max(first, bisect.bisect_left(starts, end) - 1)
+        self.lengths[first:last+1] = [starts[last+1] - starts[first] - removed + added]
+        self.sources[first:last+1] = [None]
+        return True
+
+def _crypt_file_salt(file_path: str) -> bytes:
+    """ 加密檔的salt """
+    with open(file_path, "rb") as file:
+        return yoAES.salt_of(file.read(4096)) # 足以包含容器header
+
+def _iter_crypt_text(file_path: str, password: bytearray, task: "CryptoTask|None" = None) -> Iterator[str]:
+    """ 逐塊解密加密檔並解碼(舊base64格式一次解密) 有task時每塊之間檢查是否取消 """
+    with open(file_path, "rb") as file:
+        if not yoAES.is_stream(file.read(4)):
+            file.seek(0)
+            yield yoAES.decrypt_auto(file.read(), password).decode("utf-8")
+            return
+        file.seek(0)
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        for chunk in yoAES.decrypt_chunks(file, password):
+            if task is not None: task.check()
+            yield decoder.decode(chunk)
+        yield decoder.decode(b"", final=True)
+
+def _read_crypt_file(file_path: str, password: bytearray, task: "CryptoTask|None" = None) -> tuple[str, bytes]:
+    """ 解密整個加密檔(自動辨識格式) 回傳(明文, salt) """
+    return "".join(_iter_crypt_text(file_path, password, task)), _crypt_file_salt(file_path)
+
+def _iter_indexed_text(file_path: str, password: bytearray, task: "CryptoTask", lengths: list[int]) -> Iterator[str]:
+    """ 逐塊解密v3加密檔 並記錄每塊的長度 結束時lengths[-1]為manifest序號(區塊沒有對齊字元時為-1) """
+    with open(file_path, "rb") as file, IndexedContainer.open(file, password) as container:
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        aligned = True
+        for chunk in container:
+            task.check()
+            text = decoder.decode(chunk)
+            aligned = aligned and not decoder.getstate()[0]
+            lengths.append(utf16_len(text))
+            yield text
+        yield decoder.decode(b"", final=True)
+        lengths.append(container.sequence if aligned else -1)
+
+def _load_crypt_file(file_path: str, password: bytearray, task: "CryptoTask") -> tuple[str, bytes, ChunkMap|None, str]:
+    """ (背景)解密加密檔 以task.report分批送出文字(第一塊立即送出 先顯示第一個畫面) 
+    回傳(剩下的文字, salt, v3的區塊對應, 壓縮方式) """
+    salt = _crypt_file_salt(file_path)
+    with open(file_path, "rb") as file:
+        head = file.read(4096)
+    indexed = IndexedContainer.is_indexed(head)
+    compression = yoAES.compression_of(head)
+    lengths: list[int] = []
+    texts = _iter_indexed_text(file_path, password, task, lengths) if indexed else _iter_crypt_text(file_path, password, task)
+    parts, size, first = [], 0, True
+    for text in texts:
+        parts.append(text)
+        size += len(text)
+        if first or size >= load_batch_chars:
+            task.report("".join(parts))
+            parts, size, first = [], 0, False
+    chunk_map = ChunkMap(file_path, lengths[:-1], lengths[-1], compression) if indexed and lengths[-1] >= 0 else None
+    return "".join(parts), salt, chunk_map, compression
+
+def _encode_chunks(text: str, task: "CryptoTask|None", lengths: list[int]) -> Iterator[memoryview]:
+    """ 把文字切成區塊(見split_chunks) 並記錄每塊的長度 """
+    for chunk in split_chunks(text.encode("utf-8")):
+        if task is not None: task.check()
+        lengths.append(utf16_len(str(chunk, "utf-8")))
+        yield chunk
+
+def _write_crypt_file(file_path: str, plain_text: str, password: bytearray, salt: bytes|None = None, 
+                      task: "CryptoTask|None" = None, compression: str = "") -> ChunkMap:
+    """ 以可隨機存取的容器格式(v3)原子寫入加密檔 取消時不會動到原檔 回傳區塊對應 
+    compression: 壓縮方式 內容太短時不壓縮(見compression_for) """
+    lengths: list[int] = []
+    compression = compression_for(len(plain_text), compression)
+    atomic_write(file_path, lambda file: IndexedContainer.create(file, _encode_chunks(plain_text, task, lengths), password, 
+                                                                 salt=salt, compression=compression))
+    return ChunkMap(file_path, lengths, 1, compression)
+
+def _commit_crypt_chunks(file_path: str, layout: list[tuple[int, int|str]], password: bytearray, 
+                         sequence: int, task: "CryptoTask|None" = None) -> ChunkMap:
+    """ 增量存檔: 只加密變更過的段落 附加到檔尾並提交新的manifest 
+    layout: (長度, 沿用的區塊編號 或 變更後的文字) 浪費空間過多時壓實(只複製密文) 回傳新的區塊對應 """
+    lengths: list[int] = []
+    with open(file_path, "r+b") as file, IndexedContainer.open(file, password) as container:
+        if container.sequence != sequence: raise ValueError("檔案已被外部修改 請重新儲存(將完整寫入)")
+        items: list[int|memoryview] = []
+        for length, item in layout:
+            if isinstance(item, int):
+                items.append(item)
+                lengths.append(length)
+            else: items.extend(_encode_chunks(item, task, lengths))
+        if task is not None: task.check() # 提交之後不能取消
+        container.commit(items)
+        sequence, compression = container.sequence, container.compression
+        compact = container.wasted > max(container.live_size, compact_min_bytes)
+    if compact:
+        # 舊區塊含有已刪除的內容 不留在檔案中
+        def write(dst):
+            nonlocal sequence
+            with open(file_path, "rb") as src, IndexedContainer.open(src, password) as container:
+                sequence = container.compact(dst)
+        atomic_write(file_path, write)
+    return ChunkMap(file_path, lengths, sequence, compression)
+
+_RECOVERY_EXTENSIONS = (".json", ".txt", ".yoc") # 中繼資料/普通分頁的內容/加密分頁的內容
+
+def _write_recovery(directory: str, snapshots: dict[str, tuple[dict, str|None, bytes|None]], hashes: dict[str, bytes], 
+                    password: bytearray, task: "CryptoTask") -> dict[str, bytes]:
+    """ (背景)寫入復原快照 snapshots: 分頁代號 -> (中繼資料, 文字 None代表沒有變更, 加密分頁的salt)
+    普通分頁存成utf-8的.txt 加密分頁以v3加密存成.yoc 內容寫完才寫中繼資料(.json)
+    內容與上次寫入的相同(雜湊)就跳過 不在snapshots中的快照刪除 回傳新的雜湊 """
+    hashes = {name: digest for name, digest in hashes.items() if name in snapshots}
+    for name, (meta, text, salt) in snapshots.items():
+        if text is None: continue
+        task.check()
+        info = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+        data = text.encode("utf-8", "surrogatepass")
+        digest = hashlib.blake2b(info + b"\0" + data, digest_size=16).digest()
+        if hashes.get(name) == digest: continue
+        path = os.path.join(directory, name)
+        extension = ".yoc" if meta["is_crypt"] else ".txt"
+        if meta["is_crypt"]: _write_crypt_file(path + extension, text, password, salt, task, default_compression)
+        else: atomic_write(path + extension, lambda file: file.write(data))
+        atomic_write(path + ".json", lambda file: file.write(info))
+        for other in _RECOVERY_EXTENSIONS[1:]:
+            if other != extension and os.path.exists(path + other): os.remove(path + other)
+        hashes[name] = digest
+    for entry in os.listdir(directory):
+        name, extension = os.path.splitext(entry)
+        if extension in _RECOVERY_EXTENSIONS and name not in snapshots: os.remove(os.path.join(directory, entry))
+    return hashes
+
+DiskState = tuple[str, tuple[int, int]|None, bytes|None] # 讀取/儲存時檔案的(絕對路徑, stamp 已刪除時None, 雜湊 沒算時None)
+
+def _file_fingerprint(file_path: str, task: "CryptoTask") -> tuple[tuple[int, int], bytes|None]:
+    """ (背景)檔案的(stamp, 雜湊) 超過watch_hash_max_bytes或計算期間被修改時雜湊為None """
+    stamp = _file_stamp(file_path)
+    if stamp[0] > watch_hash_max_bytes: return stamp, None
+    digest = file_digest(file_path, task.check)
+    return stamp, (digest if _file_stamp(file_path) == stamp else None)
+
+def _check_files(states: list[DiskState], task: "CryptoTask") -> list[tuple[tuple[int, int]|None, bool]]:
+    """ (背景)逐一比對檔案與記錄的狀態 回傳[(目前的stamp, 內容是否變更)]
+    先比大小與修改時間 只有大小不變而修改時間變了(且有記錄雜湊)時才重新計算雜湊比對內容 """
+    results: list[tuple[tuple[int, int]|None, bool]] = []
+    for file_path, stamp, digest in states:
+        task.check()
+        try: current = _file_stamp(file_path)
+        except OSError: current = None # 被刪除/移動
+        if current is None or current == stamp: results.append((current, current != stamp))
+        elif stamp is None or digest is None or current[0] != stamp[0]: results.append((current, True))
+        else:
+            try: current, new_digest = _file_fingerprint(file_path, task)
+            except OSError: current, new_digest = None, None
+            results.append((current, new_digest != digest))
+    return results
+
+def _merge_insertions(ours: str, theirs: str) -> list[tuple[int, str]]:
+    """ 以行為單位合併外部版本(union: 保留分頁的每一行 再加入外部版本新增/修改的行 不會遺失任何一方的內容)
+    回傳要插入分頁的[(位置(UTF-16), 文字)] 依位置排序 """
+    our_lines, their_lines = ours.split("\n"), theirs.split("\n")
+    starts = list(itertools.accumulate((utf16_len(line) + 1 for line in our_lines), initial=0))
+    insertions: list[tuple[int, str]] = []
+    for tag, _, end, start, stop in difflib.SequenceMatcher(None, our_lines, their_lines).get_opcodes():
+        if tag not in ("insert", "replace"): continue
+        lines = "\n".join(their_lines[start:stop])
+        if end < len(our_lines): insertions.append((starts[end], lines + "\n"))
+        else: insertions.append((starts[-1] - 1, "\n" + lines)) # 最後一行之後
+    return insertions
+
+# 背景加解密
+class TaskCancelled(Exception):
+    """ 背景工作被使用者取消 """
+
+class _TaskSignals(QObject):
+    """ CryptoTask的signal(QRunnable不是QObject) """
+    done = pyqtSignal()             # (工作執行緒) 執行結束
+    ended = pyqtSignal()            # (UI執行緒) 結束 不論結果 在以下三者之前發出
+    finished = pyqtSignal(object)   # 回傳值
+    failed = pyqtSignal(object)     # 例外
+    cancelled = pyqtSignal()
+    progress = pyqtSignal(object)   # 部分結果(task.report)
+
+_running_tasks: set["CryptoTask"] = set() # 執行中的工作(避免被回收)
+
+class CryptoTask(QRunnable):
+    """ 在QThreadPool執行func(task) 結果以signal傳回UI執行緒 
+    func應在區塊之間呼叫task.check() 才能中途取消 """
+    max_backlog = 1 # report()最多領先UI幾批(限制記憶體 也不會塞滿事件佇列)
+
+    def __init__(self, func: Callable[["CryptoTask"], Any], label: str = "", cancel_on_close: bool = False):
+        super().__init__()
+        self.setAutoDelete(False) # 由Python端持有
+        self.func = func
+        self.label = label
+        self.cancel_on_close = cancel_on_close # 關閉分頁時直接取消(讀檔) 或等待完成(存檔)
+        self.signals = _TaskSignals()
+        self.signals.done.connect(self._handle_done)
+        self.running = False
+        self.result: Any = None
+        self.error: Exception|None = None
+        self.cancelled = False
+        self.fraction: float|None = None # 進度(0~1) 由report提供 None為不定進度
+        self._cancel_event = threading.Event()
+        self._backlog = threading.Semaphore(self.max_backlog)
+        self._loop: QEventLoop|None = None
+
+    @property
+    def ok(self) -> bool:
+        return not self.running and not self.cancelled and self.error is None
+
+    def start(self):
+        self.signals.progress.connect(self._handle_progress) # 最後連接 在其他slot處理完之後才放行下一批
+        self.running = True
+        _running_tasks.add(self)
+        QThreadPool.globalInstance().start(self) # pyright: ignore[reportOptionalMemberAccess]
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def check(self):
+        """ (工作執行緒) 已取消就中斷 """
+        if self._cancel_event.is_set(): raise TaskCancelled()
+
+    def report(self, value: Any, fraction: float|None = None):
+        """ (工作執行緒) 送出部分結果 UI還沒處理完之前的批次時等待(仍可取消) """
+        while not self._backlog.acquire(timeout=0.1): self.check()
+        if fraction is not None: self.fraction = min(fraction, 1.0)
+        self.signals.progress.emit(value)
+
+    def wait(self):
+        """ 以區域事件迴圈等待結束(視窗不會凍結) """
+        if not self.running: return
+        self._loop = QEventLoop()
+        self._loop.exec_()
+        self._loop = None
+
+    def run(self):
+        try: self.result = self.func(self)
+        except TaskCancelled: self.cancelled = True
+        except Exception as e: self.error = e
+        self.signals.done.emit()
+
+    def _handle_progress(self, value: Any):
+        QTimer.singleShot(0, self._backlog.release) # 下一輪事件迴圈才放行 批次之間先處理輸入/重繪
+
+    def _handle_done(self):
+        self.running = False
+        _running_tasks.discard(self)
+        self.signals.ended.emit()
+        if self.cancelled: self.signals.cancelled.emit()
+        elif self.error is not None: self.signals.failed.emit(self.error)
+        else: self.signals.finished.emit(self.result)
+        if self._loop is not None: self._loop.quit()
+
 # 密碼驗證
 class PasswordPrompt(QDialog):
     """ Verifying Master Password """
@@ -35,9 +406,14 @@ class PasswordPrompt(QDialog):
         self.input = QLineEdit()
         self.input.setEchoMode(QLineEdit.Password)
         self.button = QPushButton("確定")
+        self.busy_bar = QProgressBar() # 驗證中(kdf在背景執行)
+        self.busy_bar.setRange(0, 0)
+        self.busy_bar.setTextVisible(False)
+        self.busy_bar.hide()
 
         layout.addWidget(self.label)
         layout.addWidget(self.input)
+        layout.addWidget(self.busy_bar)
         layout.addWidget(self.button)
         self.setLayout(layout)
 
@@ -50,8 +426,10 @@ class PasswordPrompt(QDialog):
         self.timer = QTimer()
         self.timer.setSingleShot(True)
         self.timer.timeout.connect(self.unlock)
+        self.task: CryptoTask|None = None
 
     def try_login(self):
+        if self.task is not None: return # 驗證中
         if self.locked:
             QMessageBox.warning(self, "請稍候", "您輸入錯誤太多次 請等待30秒後再試")
             return
@@ -62,24 +440,46 @@ class PasswordPrompt(QDialog):
             hash_file = open(password_file, "r")
             stored_hash = hash_file.read().strip()
             hash_file.close()
-            # 驗證成功
-            if verify_password(password, stored_hash):
-                self.success = True
-                self.password = bytearray(password, encoding)
-                self.accept()
-            # 驗證失敗
-            else:
-                self.fail_count += 1
-                if self.fail_count >= 5:
-                    self.locked = True
-                    self.label.setText("錯誤達5次 請等待30秒後再試")
-                    self.button.setEnabled(False)
-                    self.timer.start(30 * 1000)  # 30秒
-                else: QMessageBox.warning(self, "錯誤", f"密碼錯誤，您還有{5 - self.fail_count}次機會")
         except FileNotFoundError:
             QMessageBox.critical(self, "錯誤", f"找不到 {password_file}")
-        except Exception as e:
-            QMessageBox.critical(self, "錯誤", f"驗證密碼失敗: {e}")
+            return
+        # 在背景驗證(雜湊的kdf成本過時 -> 自動升級)
+        self.task = CryptoTask(lambda task: verify_password(password, stored_hash, on_rehash=_store_password_hash), "驗證密碼")
+        self.task.signals.ended.connect(self._handle_verify_end)
+        self.task.signals.finished.connect(lambda verified: self._handle_verified(verified, password))
+        self.task.signals.failed.connect(lambda e: QMessageBox.critical(self, "錯誤", f"驗證密碼失敗: {e}"))
+        self.label.setText("驗證中...")
+        self.button.setEnabled(False)
+        self.busy_bar.show()
+        self.task.start()
+
+    def _handle_verify_end(self):
+        self.task = None
+        self.busy_bar.hide()
+        if self.locked: return
+        self.label.setText("請輸入主密碼")
+        self.button.setEnabled(True)
+
+    def _handle_verified(self, verified: bool, password: str):
+        # 驗證成功
+        if verified:
+            self.success = True
+            self.password = bytearray(password, encoding)
+            self.accept()
+        # 驗證失敗
+        else:
+            self.fail_count += 1
+            if self.fail_count >= 5:
+                self.locked = True
+                self.label.setText("錯誤達5次 請等待30秒後再試")
+                self.button.setEnabled(False)
+                self.timer.start(30 * 1000)  # 30秒
+            else: QMessageBox.warning(self, "錯誤", f"密碼錯誤，您還有{5 - self.fail_count}次機會")
+
+    def reject(self):
+        """ 驗證中關閉 -> 丟棄結果 """
+        if self.task is not None: self.task.cancel()
+        super().reject()
 
     def unlock(self):
         self.fail_count = 0
@@ -95,6 +495,8 @@ class Theme(Enum):
     origin = "origin"
 
 # 分頁
+_tab_serial = itertools.count(1)
+
 class Tab:
     """ Information of a Tab """
     def __init__(self, main_window: "MainWindow", index: int, text_edit: "CodeEditor", 
@@ -106,6 +508,21 @@ class Tab:
         self.file_path = file_path
         self.is_dirty = is_dirty
         self.is_crypt = is_crypt
+        self.salt: bytes|None = None # 加密檔的salt(存檔時重用快取的金鑰)
+        self.task: CryptoTask|None = None # 背景加解密工作
+        self.save_changes: list[tuple[int, int, int]]|None = None # 存檔期間的文件變更(完成後套用到新的區塊對應) None代表沒有在存檔
+        self.pending_save: tuple[str, str, bool]|None = None # 存檔期間再次要求的存檔(file_path, hint, encrypt) 完成後合併成一次
+        self.recovery_id = f"tab{next(_tab_serial)}" # 復原快照的檔名
+        self.recovery_state: tuple[int, dict]|None = None # 上次復原快照時的(文件revision, 中繼資料) 都沒變就不必再取快照
+        self.chunk_map: ChunkMap|None = None # 加密檔(v3)的區塊對應(增量存檔用)
+        self.journal = False # 日誌模式: 存檔只把編輯操作附加到<檔案>.yoj(開啟有日誌的檔案時自動啟用)
+        self.journal_ops: list[Op]|None = None # 日誌模式: 上次存檔之後的編輯操作 None代表下次需完整存檔
+        self.journal_tail = -1 # 最後一個插入操作的結尾(連續輸入合併成一個操作)
+        self.journal_state: tuple[str, bool, tuple[int, int], int]|None = None # 目前日誌對應的(檔案, 是否加密, 檔案的stamp, 日誌有效結尾)
+        self.disk_state: DiskState|None = None # 讀取/儲存時檔案的狀態 偵測外部修改用
+        self.compression = default_compression # 存成加密檔時的壓縮方式(開啟加密檔時沿用檔案的設定)
+        self.encoding = "utf-8" # 存成普通檔案時的編碼(開啟普通檔案時沿用偵測到的編碼)
+        self.viewer: FileViewer|None = None # 唯讀檢視分頁(大檔案) 此時text_edit不顯示 只保存字型設定
         self.font_size = default_font_size
         self.highlighter = highlighter
         # 字型大小
@@ -116,6 +533,7 @@ class Tab:
         self.default_point_size = self.default_font.pointSize() # 紀錄預設大小
         # 綁定事件
         self.text_edit.textChanged.connect(self._handle_text_change)
+        self.text_edit.document().contentsChange.connect(self._handle_contents_change) # pyright: ignore[reportOptionalMemberAccess]
 
     def _handle_text_change(self):
         """ 處理文字變更事件 """
@@ -123,20 +541,64 @@ class Tab:
         self.is_dirty = True
         self.update_title()
 
+    def _handle_contents_change(self, position: int, removed: int, added: int):
+        """ 記錄變更的區塊 對不上時放棄對應(下次完整存檔) 排程復原快照 """
+        self.main._schedule_recovery()
+        if self.save_changes is not None: self.save_changes.append((position, removed, added))
+        if self.journal_ops is not None: self._record_edit(position, removed, added)
+        if self.chunk_map is None: return
+        doc = self.text_edit.document()
+        if not self.chunk_map.change(position, removed, added) or self.chunk_map.total != doc.characterCount() - 1: # pyright: ignore[reportOptionalMemberAccess]
+            self.chunk_map = None
+
+    def _record_edit(self, position: int, removed: int, added: int):
+        """ 日誌模式: 記錄編輯操作(插入的文字在變更當下取出) """
+        if self.journal_ops is None: return
+        doc = self.text_edit.document()
+        end = min(position + added, doc.characterCount() - 1) # pyright: ignore[reportOptionalMemberAccess]
+        text = ""
+        if end > position:
+            cursor = QTextCursor(doc)
+            cursor.setPosition(position)
+            cursor.setPosition(end, QTextCursor.MoveMode.KeepAnchor)
+            text = _cursor_text(cursor)
+        ops = self.journal_ops
+        if removed == 0 and ops and ops[-1][1] == 0 and position == self.journal_tail: ops[-1] = (ops[-1][0], 0, ops[-1][2] + text)
+        else: ops.append((position, removed, text))
+        self.journal_tail = end if removed == 0 else -1
+
+    def chunk_layout(self) -> list[tuple[int, int|str]]:
+        """ 存檔用: 每段的(長度, 沿用的區塊編號 或 變更後的文字) """
+        if self.chunk_map is None: raise RuntimeError("no chunk map")
+        cursor = QTextCursor(self.text_edit.document())
+        layout: list[tuple[int, int|str]] = []
+        position = 0
+        for length, source in zip(self.chunk_map.lengths, self.chunk_map.sources):
+            if source is not None: layout.append((length, source))
+            elif length > 0:
+                cursor.setPosition(position)
+                cursor.setPosition(position + length, QTextCursor.MoveMode.KeepAnchor)
+                layout.append((length, _cursor_text(cursor)))
+            position += length
+        return layout
+
     def zoom_in(self, size: int = 1):
         """ 放大字體 """
         self.font_size += size
         self.text_edit.zoomIn(size)
+        if self.viewer is not None: self.viewer.view.setFont(self.text_edit.font())
     
     def zoom_out(self, size: int = 1):
         """ 縮小字體 """
         self.font_size -= size
         self.text_edit.zoomOut(size)
+        if self.viewer is not None: self.viewer.view.setFont(self.text_edit.font())
 
     def reset_zoom(self):
         """ 還原預設字體大小 """
         self.font_size = default_font_size
         self.text_edit.setFont(self.default_font)
+        if self.viewer is not None: self.viewer.view.setFont(self.text_edit.font())
 
     def update_zoom(self):
         """ 同步字型大小 """
@@ -150,6 +612,7 @@ class Tab:
         """ 更新title """
         base_title = os.path.basename(self.file_path) if self.file_path else "untitled"
         final_title = base_title + " ●" if self.is_dirty else base_title
+        if self.task is not None: final_title = ("⏳ " if self.task.fraction is None else f"⏳ {self.task.fraction:.0%} ") + final_title
         self.main.tabs.setTabText(self.index, final_title)
 
 # 尋找/取代
@@ -165,9 +628,21 @@ class FR_Bar(QWidget):
         self.setSizePolicy(QSizePolicy.Policy.Preferred, QSizePolicy.Policy.Preferred)
         # 屬性
         self.case_sensitive = True # 預設區分大小寫
+        self.regex = False         # 正規表示式
+        self.whole_word = False    # 全字拼寫須相符
         self.match_count = 0       # 總匹配數
         self.match_index = 0       # 匹配索引 
         self.search_range: QTextCursor | None = None
+        self.document: QTextDocument|None = None # 搜尋結果所屬的文件
+        self.matches: MatchIndex|None = None     # 搜尋結果(文件變更時作廢)
+        self.matches_key: tuple = ()             # 搜尋結果的(搜尋文字, 大小寫, regex, 全字) 範圍/條件改變時直接作廢
+        self.count_task: CryptoTask|None = None  # 背景計算總數
+        self.count_key: tuple = ()
+        self.count_changes: tuple[int, int, int]|None = None # 計算期間文件變更的範圍
+        self.count_timer = QTimer(self)          # 停止輸入後才計算
+        self.count_timer.setSingleShot(True)
+        self.count_timer.setInterval(find_debounce_ms)
+        self.count_timer.timeout.connect(self.update_search_results)
 
     def init_find_bar(self):
         """ 尋找欄 """ 
@@ -180,21 +655,27 @@ class FR_Bar(QWidget):
         self.find_input.setFixedWidth(180)         # 寬度
         # 查詢結果
         self.find_result = QLabel("-/-")
-        self.find_result.setFixedWidth(50)
+        self.find_result.setFixedWidth(90)
         # 按鈕
         self.next_button = QPushButton("👇") # 找下一個
         self.prev_button = QPushButton("👆") # 找上一個    
         self.case_button = QPushButton("Aa") # 大小寫需相符
+        self.word_button = QPushButton("ab") # 全字拼寫須相符
+        self.regex_button = QPushButton(".*") # 正規表示式
         self.area_button = QPushButton("☰") # 範圍內尋找
         self.next_button.setFixedWidth(27)   # 設定按鈕寬度
         self.prev_button.setFixedWidth(27)   # 設定按鈕寬度
         self.case_button.setFixedWidth(32)   # 設定按鈕寬度
+        self.word_button.setFixedWidth(32)   # 設定按鈕寬度
+        self.regex_button.setFixedWidth(32)  # 設定按鈕寬度
         self.area_button.setFixedWidth(27)   # 設定按鈕寬度
         self.next_button.clicked.connect(self.action_find_next) # 連接事件
         self.prev_button.clicked.connect(self.action_find_prev) # 連接事件
         self.case_button.clicked.connect(self.action_same_case) # 連接事件
+        self.word_button.clicked.connect(self.action_whole_word) # 連接事件
+        self.regex_button.clicked.connect(self.action_regex) # 連接事件
         self.area_button.clicked.connect(self.action_find_area) # 連接事件
-        self.find_input.textChanged.connect(self.update_search_results)
+        self.find_input.textChanged.connect(self._handle_find_input)
         # 排版
         self.find_layout.setContentsMargins(0, 0, 0, 0)
         self.find_layout.addWidget(self.find_label)
@@ -203,6 +684,8 @@ class FR_Bar(QWidget):
         self.find_layout.addWidget(self.prev_button)
         self.find_layout.addWidget(self.next_button)
         self.find_layout.addWidget(self.case_button)
+        self.find_layout.addWidget(self.word_button)
+        self.find_layout.addWidget(self.regex_button)
         self.find_layout.addWidget(self.area_button)
         self.find_layout.addStretch(1)
 
@@ -216,7 +699,7 @@ class FR_Bar(QWidget):
         self.replace_input.setFixedWidth(180)         # 寬度
         # 對齊用
         self.padding_label = QLabel("")
-        self.padding_label.setFixedWidth(50)
+        self.padding_label.setFixedWidth(90)
         # 按鈕
         self.replace_one_button = QPushButton("取代")     # 取代
         self.replace_all_button = QPushButton("全部取代")  # 全部取代
@@ -241,146 +724,212 @@ class FR_Bar(QWidget):
             self.replace_all_button.setDisabled(a0)
         except: pass
 
-    def _calculate_match_count(self, text, flags):
-        """ 遍歷文件計算總匹配數 """
-        self.match_count = 0
-        # 原始光標
-        original_cursor = self.main_window.text_edit.textCursor()
-
-        if self.search_range:
-            # 進入範圍搜尋
-            range_cursor = QTextCursor(self.search_range)
-            start_pos = range_cursor.selectionStart()
-            end_pos = range_cursor.selectionEnd() 
-            # 設置臨時光標從範圍起點開始
-            temp_cursor = QTextCursor(self.main_window.text_edit.document())
-            temp_cursor.setPosition(start_pos)
-            self.main_window.text_edit.setTextCursor(temp_cursor)
-            # 遍歷計數
-            while self.main_window.text_edit.find(text, flags):
-                match_cursor = self.main_window.text_edit.textCursor()
-                # 匹配項超出範圍 停止計數
-                if match_cursor.selectionEnd() > end_pos: break
-                self.match_count += 1
-        else:
-            # 整體搜尋
-            temp_cursor = QTextCursor(self.main_window.text_edit.document())
-            temp_cursor.movePosition(QTextCursor.MoveOperation.Start)
-            self.main_window.text_edit.setTextCursor(temp_cursor)
-            # 遍歷計數
-            while self.main_window.text_edit.find(text, flags):
-                self.match_count += 1
-
-        # 恢復光標位置
-        self.main_window.text_edit.setTextCursor(original_cursor)
-
-    def _find_current_index(self, text):
-        """ 計算當前被選取匹配項是總數中的第幾個 """
-        flags = QTextDocument.FindFlag()
-        if self.case_sensitive: flags |= QTextDocument.FindFlag.FindCaseSensitively # 區分大小寫
-        current_selection_start = self.main_window.text_edit.textCursor().selectionStart()
-        original_cursor = self.main_window.text_edit.textCursor() 
-        temp_cursor = QTextCursor(self.main_window.text_edit.document()) # 臨時光標
-        
-        current_index = 0
-        # 範圍搜尋模式
-        if self.search_range:
-            # 從範圍上方開始
-            range_cursor = QTextCursor(self.search_range)
-            start_pos = range_cursor.selectionStart()
-            end_pos = range_cursor.selectionEnd()
-            temp_cursor.setPosition(start_pos) 
-            self.main_window.text_edit.setTextCursor(temp_cursor)
-            # 遍歷計數
-            while self.main_window.text_edit.find(text, flags): # pyright: ignore[reportCallIssue, reportArgumentType]
-                match_cursor = self.main_window.text_edit.textCursor()
-                # 超出範圍停止
-                if match_cursor.selectionEnd() > end_pos: break
-                current_index += 1
-                if match_cursor.selectionStart() == current_selection_start: break
-        # 整體搜尋模式
-        else: 
-            temp_cursor.movePosition(QTextCursor.MoveOperation.Start)
-            self.main_window.text_edit.setTextCursor(temp_cursor)
-            # 遍歷計數
-            while self.main_window.text_edit.find(text, flags): # pyright: ignore[reportCallIssue, reportArgumentType]
-                current_index += 1
-                if self.main_window.text_edit.textCursor().selectionStart() == current_selection_start: break
-                
-        # 恢復光標位置
-        self.main_window.text_edit.setTextCursor(original_cursor)
-        return current_index
-
-    def _action_find_base(self, flags: QTextDocument.FindFlag, move_operation: QTextCursor.MoveOperation):  
-        """ 尋找功能基底 """
-        search_text = self.find_input.text()
-        if (not search_text) or (not self.match_count): 
+    def _search_pattern(self, text: str) -> re.Pattern[str]:
+        """ 搜尋文字的pattern(依大小寫/全字/regex 編譯過的會快取) 無效的regex時re.error """
+        return search_pattern(text, self.case_sensitive, self.regex, self.whole_word)
+
+    def _check_pattern(self) -> bool:
+        """ 搜尋文字是否為有效的regex 無效時顯示錯誤 """
+        try: self._search_pattern(self.find_input.text())
+        except re.error as e:
+            self._cancel_count()
+            self.matches, self.match_count = None, 0
+            self.find_result.setText("regex錯誤")
+            self.find_result.setToolTip(str(e))
+            self._disable_buttons(True)
+            return False
+        self.find_result.setToolTip("")
+        return True
+
+    def _replacement(self, start: int, end: int) -> str|None:
+        """ 文件的[start, end)正好是結果時 取代成的文字(regex可用\\1 \\g<name>等反向參照) 不是結果時None """
+        doc = self._current_document()
+        block = doc.findBlock(start)
+        if end > block.position() + block.length() - 1: return None
+        match = match_at(block.text().replace("\u00a0", " "), self._search_pattern(self.find_input.text()), start - block.position(), end - block.position())
+        if match is None: return None
+        return match.expand(self.replace_input.text()) if self.regex else self.replace_input.text()
+
+    def _search_bounds(self, doc: QTextDocument) -> tuple[int, int]:
+        """ 搜尋範圍的(起點, 終點) 沒有設定範圍時為整份文件 """
+        if self.search_range is None: return 0, doc.characterCount() - 1
+        return self.search_range.selectionStart(), self.search_range.selectionEnd()
+
+    def _watch_document(self, doc: QTextDocument):
+        """ 文件(分頁)變了就改監看新的文件 原本的結果/計算作廢 """
+        if doc is self.document: return
+        if self.document is not None:
+            try: self.document.contentsChange.disconnect(self._handle_contents_change)
+            except (TypeError, RuntimeError): pass # 分頁已關閉
+        self._cancel_count()
+        self.document, self.matches = doc, None
+        doc.contentsChange.connect(self._handle_contents_change)
+
+    def _handle_contents_change(self, position: int, removed: int, added: int):
+        """ 文件變更: 更新搜尋結果 背景計算中時記下變更的範圍(完成後再更新) """
+        if self.count_task is not None:
+            self.count_changes = self._merge_change(self.count_changes, position, removed, added)
+            return
+        if self.matches is None: return
+        self._update_matches(position, position + added, added - removed)
+        QTimer.singleShot(0, self._show_count)
+
+    @staticmethod
+    def _merge_change(window: tuple[int, int, int]|None, position: int, removed: int, added: int) -> tuple[int, int, int]:
+        """ 累積變更的範圍: (起點, 終點, 長度變化) 位置都是目前文件中的位置 """
+        if window is None: return position, position + added, added - removed
+        low, high, delta = window
+        if high >= position: high = position + added if high < position + removed else high + added - removed
+        return min(low, position), max(high, position + added), delta + added - removed
+
+    def _update_matches(self, low: int, high: int, delta: int):
+        """ 文件中[low, high)是變更過的(長度變化delta): 只重新搜尋所在的段落(純文字的結果不會跨段落) 之後的結果平移
+        對不上時作廢(下次完整搜尋) """
+        matches, doc = self.matches, self.document
+        if matches is None or doc is None: return
+        length = doc.characterCount() - 1
+        first, last = doc.findBlock(min(low, length)), doc.findBlock(min(high, length))
+        start, end = first.position(), last.position() + last.length() - 1
+        if end - delta < start: 
+            self.matches = None
+            return
+        bounds = self._search_bounds(doc)
+        matches.replace(start, end - delta + 1, delta, self._scan(doc, max(start, bounds[0]), min(end, bounds[1])))
+        if matches.length != length: self.matches = None
+
+    def _text(self, doc: QTextDocument, start: int, end: int) -> str:
+        """ 文件[start, end)的文字(同toPlainText) """
+        if start == 0 and end == doc.characterCount() - 1: return doc.toPlainText()
+        cursor = QTextCursor(doc)
+        cursor.setPosition(start)
+        cursor.setPosition(max(start, end), QTextCursor.MoveMode.KeepAnchor)
+        return _cursor_text(cursor)
+
+    def _scan(self, doc: QTextDocument, start: int, end: int) -> MatchIndex:
+        """ 搜尋文件的[start, end) """
+        return MatchIndex.scan(self._text(doc, start, end), self._search_pattern(self.find_input.text()), start, doc.characterCount() - 1)
+
+    def _current_document(self) -> QTextDocument:
+        doc = self.main_window.text_edit.document()
+        if doc is None: raise RuntimeError("text_edit.document() is None")
+        self._watch_document(doc)
+        return doc
+
+    def _cancel_count(self):
+        if self.count_task is not None: self.count_task.cancel()
+        self.count_task, self.count_changes = None, None
+
+    def _find_direct(self, backward: bool) -> tuple[int, int]|None:
+        """ 總數還沒算完時: 從游標所在的段落逐段往後(前)找 範圍內環繞 回傳起訖 找不到時None """
+        doc = self._current_document()
+        pattern = self._search_pattern(self.find_input.text())
+        low, high = self._search_bounds(doc)
+        cursor = self.main_window.text_edit.textCursor()
+        position = min(max(cursor.selectionStart() if backward else cursor.selectionEnd(), low), high)
+        for start, end in ((low, position) if backward else (position, high), (low, high)):
+            block = doc.findBlock(end if backward else start)
+            while block.isValid() and (block.position() + block.length() > start if backward else block.position() < end):
+                base = block.position()
+                found = search_line(block.text().replace("\u00a0", " "), pattern, max(start - base, 0), min(end - base, block.length() - 1), backward)
+                if found is not None: return base + found[0], base + found[1]
+                block = block.previous() if backward else block.next()
+        return None
+
+    def _action_find_base(self, backward: bool):  
+        """ 尋找功能基底: 從目前的選取往前/往後選取下一個結果(在範圍內環繞) 總數還沒算完時直接搜尋 """
+        if not self.find_input.text(): 
             self.find_result.setText("-/-")
             return
-        # 向flags方向尋找
-        if self.case_sensitive: flags |= QTextDocument.FindFlag.FindCaseSensitively # type: ignore
-        is_forward_search = not bool(flags & QTextDocument.FindFlag.FindBackward)
-        found = self.main_window.text_edit.find(search_text, flags)
-
-        # 範圍搜尋 (範圍內環繞)
-        if self.search_range:
-            range_cursor = QTextCursor(self.search_range)
-            start_pos = range_cursor.selectionStart()
-            end_pos = range_cursor.selectionEnd()
-            # 檢查是否需要環繞
-            if found:
-                match_cursor = self.main_window.text_edit.textCursor()
-                # Case: 向前找超過範圍終點
-                if is_forward_search and match_cursor.selectionEnd() > end_pos:
-                    found = False
-                # Case: 向後找超過範圍起點
-                elif not is_forward_search and match_cursor.selectionStart() < start_pos:
-                    found = False
-            # 範圍內環繞
-            if not found:
-                cursor = self.main_window.text_edit.textCursor()
-                # 向前找/向後找
-                if is_forward_search: cursor.setPosition(start_pos)
-                else: cursor.setPosition(end_pos)
-                self.main_window.text_edit.setTextCursor(cursor)
-                # 重新搜尋
-                if not self.main_window.text_edit.find(search_text, flags):
-                    raise RuntimeError("text !found in action_find_next but found in _update_search_results")
-        # 整體環繞
-        elif not found:
-            # 從move_operation環繞
-            cursor = self.main_window.text_edit.textCursor()
-            cursor.movePosition(move_operation)
-            self.main_window.text_edit.setTextCursor(cursor)
-            # 發生 -> bug
-            if not self.main_window.text_edit.find(search_text, flags):
-                raise RuntimeError("text !found in action_find_next but found in _update_search_results")
-            
+        if not self._check_pattern(): return
+        self._current_document()
+        if self.matches is None and self.count_task is None and not self.count_timer.isActive(): self.count_timer.start()
+        matches = self.matches
+        text_edit = self.main_window.text_edit
+        cursor = text_edit.textCursor()
+        if matches is not None:
+            if not len(matches):
+                self.find_result.setText("查無結果")
+                return
+            i = matches.prev_before(cursor.selectionStart()) if backward else matches.next_after(cursor.selectionEnd())
+            found = matches.span(i)
+        elif (found := self._find_direct(backward)) is None:
+            self.find_result.setText("查無結果")
+            return
+        cursor.setPosition(found[0])
+        cursor.setPosition(found[1], QTextCursor.MoveMode.KeepAnchor)
+        text_edit.setTextCursor(cursor)
+        text_edit.ensureCursorVisible()
         # 聚焦mainwindow
         self.main_window.focus_text_edit()
-        # 重新計算self.match_index
-        self.match_index = self._find_current_index(search_text)
-        text = f"{self.match_index}/{self.match_count}" if self.match_count else "查無結果"
-        self.find_result.setText(text)
+        self._show_count()
+
+    def _handle_find_input(self, text: str):
+        """ 輸入中: 取消目前的計算 停止輸入find_debounce_ms後才計算總數(可以直接找下一個) """
+        self.main_window.last_find_text = text
+        self._cancel_count()
+        self.matches = None
+        if not text: return self.update_search_results()
+        self._disable_buttons(False)
+        self.find_result.setText("…")
+        self.count_timer.start()
 
     def update_search_results(self):
-        """ 變更時計算總數 """
+        """ 計算總數: 在背景搜尋文件(或範圍)的快照 逐段顯示目前的數量 新的搜尋取消舊的 
+        計算期間的編輯記下範圍 完成後只重新搜尋那段 """
         search_text = self.find_input.text()
         self.main_window.last_find_text = search_text
+        self.count_timer.stop()
         if not search_text:
+            self._cancel_count()
+            self.matches = None
             self.match_count = 0
             self.find_result.setText("-/-")
             self._disable_buttons(True)
             return
-        # 計算總數
-        flags = QTextDocument.FindFlags() 
-        if self.case_sensitive: flags |= QTextDocument.FindFlag.FindCaseSensitively
-        self._calculate_match_count(search_text, flags)
+        if not self._check_pattern(): return
+        doc = self._current_document()
+        key = (search_text, self.case_sensitive, self.regex, self.whole_word)
+        if self.matches is not None and self.matches_key == key: return self._show_count()
+        if self.count_task is not None and self.count_key == key: return # 已在計算
+        self._cancel_count()
+        self.matches = None
+        start, end = self._search_bounds(doc)
+        text, pattern, length = self._text(doc, start, end), self._search_pattern(search_text), doc.characterCount() - 1
+        task = CryptoTask(lambda task: MatchIndex.scan(text, pattern, start, length, task.check, task.report), "計算搜尋結果")
+        def progress(count: int):
+            if task is self.count_task: self.find_result.setText(f"{count}+ …")
+        def finished(matches: MatchIndex):
+            if task is not self.count_task: return
+            changes, self.count_task, self.count_changes = self.count_changes, None, None
+            if self.main_window.text_edit.document() is not self.document: return self.update_search_results() # 已切換分頁
+            self.matches, self.matches_key = matches, key
+            if changes is not None: self._update_matches(*changes)
+            if self.matches is None: return self.update_search_results() # 對不上 重新計算
+            self._show_count()
+        def failed(e: Exception):
+            if task is not self.count_task: return
+            self.count_task, self.count_changes = None, None
+            self.find_result.setText("錯誤")
+            self.find_result.setToolTip(str(e))
+        task.signals.progress.connect(progress)
+        task.signals.finished.connect(finished)
+        task.signals.failed.connect(failed)
+        self.count_task, self.count_key = task, key
+        self._disable_buttons(False)
+        self.find_result.setText("…")
+        task.start()
+
+    def _show_count(self):
+        """ 顯示總數(目前選取的正好是結果時 顯示是第幾個) 不重新搜尋 """
+        if self.matches is None or not self.find_input.text(): return
+        self.match_count = len(self.matches)
         if self.match_count == 0:
             text = "查無結果"
             self._disable_buttons(True)
         else:
-            text = f"-/{self.match_count}"
+            cursor = self.main_window.text_edit.textCursor()
+            self.match_index = self.matches.index_of(cursor.selectionStart(), cursor.selectionEnd()) + 1
+            text = f"{self.match_index or '-'}/{self.match_count}"
             self._disable_buttons(False)
         self.find_result.setText(text)
 
@@ -390,6 +939,25 @@ class FR_Bar(QWidget):
         # 視覺回饋(綠->區分)
         if not self.case_sensitive: self.case_button.setStyleSheet("")
         else: self.case_button.setStyleSheet("background-color: lightgreen;")
+        self._cancel_count()
+        self.matches = None
+        self.update_search_results()
+
+    def action_whole_word(self):
+        """ 全字拼寫須相符 """
+        self.whole_word = not self.whole_word
+        self.word_button.setStyleSheet("background-color: lightgreen;" if self.whole_word else "")
+        self._cancel_count()
+        self.matches = None
+        self.update_search_results()
+
+    def action_regex(self):
+        """ 正規表示式(取代時可用反向參照) """
+        self.regex = not self.regex
+        self.regex_button.setStyleSheet("background-color: lightgreen;" if self.regex else "")
+        self._cancel_count()
+        self.matches = None
+        self.update_search_results()
 
     def action_find_area(self): 
         """ 設定尋找範圍 """
@@ -400,18 +968,19 @@ class FR_Bar(QWidget):
         else: # 有選取文字
             self.search_range = QTextCursor(current_cursor)
             self.area_button.setStyleSheet("background-color: lightgreen;")
+        self._cancel_count()
+        self.matches = None
         # 更新結果
         self.update_search_results()
         self.action_find_next()
 
     def action_find_next(self):
         """ 找下一個 """
-        flags = QTextDocument.FindFlag() # 預設為向前尋找 (FindBackward=False)
-        self._action_find_base(flags, QTextCursor.MoveOperation.Start)
+        self._action_find_base(backward=False)
 
     def action_find_prev(self):
-        flags = QTextDocument.FindFlag.FindBackward # 向後尋找 
-        self._action_find_base(flags, QTextCursor.MoveOperation.End)
+        """ 找上一個 """
+        self._action_find_base(backward=True)
 
     def action_replace_one(self):
         """ 取代 """
@@ -419,13 +988,19 @@ class FR_Bar(QWidget):
         replace_text = self.replace_input.text()
         cursor = self.main_window.text_edit.textCursor()
         # 尋找欄為空則返回
-        if not search_text: return
+        if not search_text or not self._check_pattern(): return
         if not cursor.hasSelection(): 
             return self.action_find_next()
+        # 選取的是結果時才取代(純文字模式同以前 直接取代選取的文字)
+        start = cursor.selectionStart()
+        try: replacement = self._replacement(start, cursor.selectionEnd())
+        except re.error as e: return self._show_replace_error(e)
+        if replacement is None:
+            if self.regex or self.whole_word: return self.action_find_next()
+            replacement = replace_text
         # 替換並設定光標位置
-        origin_pos = cursor.position()
-        cursor.insertText(replace_text)
-        cursor.setPosition(origin_pos+len(replace_text))
+        cursor.insertText(replacement)
+        cursor.setPosition(start + utf16_len(replacement))
         self.main_window.text_edit.setTextCursor(cursor)
         self.action_find_next()
         self.update_search_results()
@@ -433,55 +1008,47 @@ class FR_Bar(QWidget):
         self.main_window.tab.is_dirty = True
         self.main_window.tab.update_title()
 
+    def _show_replace_error(self, e: re.error):
+        """ 取代文字中的反向參照無效 """
+        self.find_result.setText("取代錯誤")
+        self.find_result.setToolTip(str(e))
+
     def action_replace_all(self):
-        """ 全部取代 """
+        """ 全部取代: 一次掃過搜尋範圍(的快照)算出所有取代 再在一個編輯區塊中套用(結果密集時整段一次換掉 否則由後往前逐個取代)
+        區塊結束時才發出一次合併的變更 排版/語法上色/分頁的變更紀錄都只處理一次 復原也只有一步 """
         search_text = self.find_input.text()
-        replace_text = self.replace_input.text()
-        if not search_text: return
-        flags = QTextDocument.FindFlags()
-        if self.case_sensitive: flags |= QTextDocument.FindFlag.FindCaseSensitively
-        original_cursor = self.main_window.text_edit.textCursor()
-        temp_cursor = QTextCursor(self.main_window.text_edit.document())
-        
-        # 範圍取代
-        if self.search_range:
-            range_cursor = QTextCursor(self.search_range)
-            temp_cursor.setPosition(range_cursor.selectionStart())
-            end_pos = range_cursor.selectionEnd() # 範圍終點
-        # 整體取代
-        else:
-            temp_cursor.movePosition(QTextCursor.MoveOperation.Start)
-            end_pos = -1
-        # 迴圈遍歷
-        replace_count = 0
-        last_position = -1
-        self.main_window.text_edit.setTextCursor(temp_cursor)
-        while self.main_window.text_edit.find(search_text, flags):
-            match_cursor = self.main_window.text_edit.textCursor()
-            # 超出範圍->停止替換
-            if self.search_range and match_cursor.selectionEnd() > end_pos: break 
-            # 替換選取的文字
-            match_cursor.insertText(replace_text)
-            self.main_window.text_edit.setTextCursor(match_cursor)
-            replace_count += 1
-            last_position = match_cursor.position()
-
-        # 恢復並更新
-        self.main_window.text_edit.setTextCursor(original_cursor)
-        if replace_count > 0:
-            # 光標位置設定與反白
-            final_cursor = self.main_window.text_edit.textCursor()
-            final_cursor.setPosition(last_position)
-            final_cursor.movePosition(
-                QTextCursor.MoveOperation.Left, 
-                QTextCursor.MoveMode.KeepAnchor, 
-                len(replace_text)
-            )
-            final_cursor.setPosition(last_position)
-            self.main_window.text_edit.setTextCursor(final_cursor)
+        if not search_text or not self._check_pattern(): return
+        text_edit = self.main_window.text_edit
+        if text_edit.isReadOnly(): return # 背景工作中
+        doc = self._current_document()
+        start, end = self._search_bounds(doc)
+        length = doc.characterCount() - 1
+        try: text, matches, replacements = replace_all(self._text(doc, start, end), self._search_pattern(search_text), self.replace_input.text(), start, length, self.regex)
+        except re.error as e: return self._show_replace_error(e)
+        if matches:
+            # 結果作廢(取代完在背景重新計算) 不在變更當下重新搜尋整段
+            self._cancel_count()
+            self.matches = None
+            cursor = QTextCursor(doc)
+            cursor.beginEditBlock()
+            if len(matches) * replace_all_dense > end - start:
+                cursor.setPosition(start)
+                cursor.setPosition(end, QTextCursor.MoveMode.KeepAnchor)
+                cursor.insertText(text)
+            else:
+                for i in reversed(range(len(matches))):
+                    first, last = matches.span(i)
+                    cursor.setPosition(first)
+                    cursor.setPosition(last, QTextCursor.MoveMode.KeepAnchor)
+                    cursor.insertText(replacements[i])
+            cursor.endEditBlock()
+            # 光標移到最後一個取代的結尾(之後的文字沒變)
+            cursor.setPosition(matches.span(len(matches) - 1)[1] + doc.characterCount() - 1 - length)
+            text_edit.setTextCursor(cursor)
             # dirty
             self.main_window.tab.is_dirty = True
             self.main_window.tab.update_title()
+        self.main_window.statusBar().showMessage(f"已取代 {len(matches)} 個", 4000) # pyright: ignore[reportOptionalMemberAccess]
         self.update_search_results()
 
 class FindBar(FR_Bar):
@@ -499,6 +1066,144 @@ class ReplaceBar(FR_Bar):
         super().init_replace_bar()
         self.main_layout.addStretch(1)
 
+class FindInFilesPanel(QWidget):
+    """ 在檔案中尋找: 在行程池中搜尋資料夾(預設為Files)內的所有檔案 加密檔以主密碼解密(有日誌時重播)
+    結果(檔案:行: 片段)邊搜尋邊加入清單 點選結果開啟檔案並選取 """
+    def __init__(self, main_window: "MainWindow"):
+        super().__init__(main_window)
+        self.main_window = main_window
+        # 屬性
+        self.job: FindFilesJob|None = None
+        self.root = ""          # 搜尋中的資料夾(顯示相對路徑)
+        self.hit_count = 0
+        self.error_count = 0
+        self.poll_timer = QTimer(self) # 輪詢已完成的檔案
+        self.poll_timer.setInterval(50)
+        self.poll_timer.timeout.connect(self._collect_results)
+        # 布局
+        self.main_layout = QVBoxLayout(self)
+        self.main_layout.setSpacing(2)
+        self.main_layout.setContentsMargins(8, 4, 8, 4)
+        # 資料夾
+        self.folder_layout = QHBoxLayout()
+        self.folder_input = QLineEdit(os.path.join(filedirname, "Files"))
+        self.folder_input.setPlaceholderText("資料夾")
+        self.folder_button = QPushButton("…") # 選擇資料夾
+        self.folder_button.setFixedWidth(27)
+        self.folder_button.clicked.connect(self.action_choose_folder)
+        self.folder_layout.addWidget(self.folder_input)
+        self.folder_layout.addWidget(self.folder_button)
+        # 尋找欄
+        self.find_layout = QHBoxLayout()
+        self.find_input = QLineEdit()
+        self.find_input.setPlaceholderText("在檔案中尋找")
+        self.find_input.returnPressed.connect(self.action_search)
+        self.case_button = QPushButton("Aa")  # 大小寫需相符
+        self.word_button = QPushButton("ab")  # 全字拼寫須相符
+        self.regex_button = QPushButton(".*") # 正規表示式
+        for button in (self.case_button, self.word_button, self.regex_button):
+            button.setFixedWidth(32)
+            button.setCheckable(True)
+            button.toggled.connect(lambda checked, button=button: button.setStyleSheet("background-color: lightgreen;" if checked else ""))
+        self.case_button.setChecked(True) # 預設區分大小寫(同尋找欄)
+        self.search_button = QPushButton("搜尋")
+        self.cancel_button = QPushButton("取消")
+        self.search_button.clicked.connect(self.action_search)
+        self.cancel_button.clicked.connect(self.action_cancel)
+        self.cancel_button.setEnabled(False)
+        self.find_layout.addWidget(self.find_input)
+        for widget in (self.case_button, self.word_button, self.regex_button, self.search_button, self.cancel_button):
+            self.find_layout.addWidget(widget)
+        # 結果
+        self.status_label = QLabel("")
+        self.result_list = QListWidget()
+        self.result_list.setUniformItemSizes(True) # 結果很多時不必逐項計算高度
+        self.result_list.itemClicked.connect(self._open_result)
+        self.result_list.itemActivated.connect(self._open_result)
+        # 排版
+        self.main_layout.addLayout(self.folder_layout)
+        self.main_layout.addLayout(self.find_layout)
+        self.main_layout.addWidget(self.status_label)
+        self.main_layout.addWidget(self.result_list)
+
+    def action_choose_folder(self):
+        """ 選擇要搜尋的資料夾 """
+        folder = QFileDialog.getExistingDirectory(self, "搜尋的資料夾", self.folder_input.text())
+        if folder: self.folder_input.setText(folder)
+
+    def action_search(self):
+        """ 開始搜尋(取消上一次) 有主密碼時需先登入才能搜尋加密檔(沒登入時加密檔列為無法讀取) """
+        text = self.find_input.text()
+        if not text: return
+        try: pattern = search_pattern(text, self.case_button.isChecked(), self.regex_button.isChecked(), self.word_button.isChecked())
+        except re.error as e:
+            self.status_label.setText(f"regex錯誤: {e}")
+            return
+        root = self.folder_input.text()
+        if not os.path.isdir(root):
+            self.status_label.setText("資料夾不存在")
+            return
+        self.action_cancel()
+        if os.path.exists(password_file) and not self.main_window.password: self.main_window._ensure_password()
+        self.main_window.last_find_text = text
+        self.root = root
+        self.hit_count, self.error_count = 0, 0
+        self.result_list.clear()
+        self.job = FindFilesJob(list_files(root), pattern, self.main_window.password, plain_encodings)
+        try: self.job.start()
+        except Exception as e:
+            self.job = None
+            QMessageBox.critical(self, "錯誤", f"搜尋失敗: {e}")
+            return
+        self.search_button.setEnabled(False)
+        self.cancel_button.setEnabled(True)
+        self.poll_timer.start()
+        self._collect_results()
+
+    def action_cancel(self):
+        """ 取消搜尋(已找到的結果保留) """
+        if self.job is None: return
+        self.job.cancel()
+        self._finish(" (已取消)")
+
+    def _collect_results(self):
+        """ 把已完成的檔案的結果加入清單 """
+        if self.job is None: return self.poll_timer.stop()
+        for file_path, encrypted, hits, error in self.job.results():
+            name = os.path.relpath(file_path, self.root)
+            if error is not None:
+                self.error_count += 1
+                item = QListWidgetItem(f"{name}: 無法讀取 ({error})")
+                item.setForeground(QColor("gray"))
+                item.setToolTip(file_path)
+                self.result_list.addItem(item)
+                continue
+            for line, start, end, snippet in hits:
+                item = QListWidgetItem(f"{name}:{line + 1}: {snippet.strip()}")
+                item.setData(Qt.ItemDataRole.UserRole, (file_path, encrypted, line, start, end))
+                item.setToolTip(file_path)
+                self.result_list.addItem(item)
+            self.hit_count += len(hits)
+        if self.job.is_done(): self._finish()
+        else: self._show_status()
+
+    def _finish(self, note: str = ""):
+        self.poll_timer.stop()
+        self._show_status(note)
+        self.job = None
+        self.search_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+
+    def _show_status(self, note: str = ""):
+        if self.job is None: return
+        errors = f" {self.error_count} 個無法讀取" if self.error_count else ""
+        self.status_label.setText(f"{self.hit_count} 個結果 已搜尋 {self.job.done_count}/{self.job.total} 個檔案{errors}{note}")
+
+    def _open_result(self, item: QListWidgetItem):
+        """ 開啟結果所在的檔案並選取 """
+        data = item.data(Qt.ItemDataRole.UserRole)
+        if data is not None: self.main_window.open_file_at(*data)
+
 # 高亮器
 class HighlighterMeta(type(QSyntaxHighlighter), ABCMeta): # pyright: ignore[reportGeneralTypeIssues]
     pass
@@ -863,6 +1568,234 @@ class CodeEditor(QPlainTextEdit):
             self.insertPlainText(self.tab)
         else: super().keyPressEvent(e)
 
+# 唯讀檢視(大檔案)
+class FileView(QAbstractScrollArea):
+    """ 只畫出可見的行 行首位置由LineIndex查詢 文字直接從mapping解碼 """
+    max_line_bytes = 4096 # 每行最多顯示的位元組(超長的行截斷)
+
+    def __init__(self, data: bytes|mmap.mmap, index: LineIndex, encoding: str, parent: QWidget|None = None):
+        super().__init__(parent)
+        self.data = data
+        self.index = index
+        self.encoding = encoding
+        self.match: tuple[int, int]|None = None # 目前的搜尋結果(位元組偏移, 長度)
+        self._widest = 0 # 畫過的最寬的行(水平捲軸範圍)
+        self.setFocusPolicy(Qt.FocusPolicy.StrongFocus)
+        self.verticalScrollBar().valueChanged.connect(self.viewport().update)   # pyright: ignore[reportOptionalMemberAccess]
+        self.horizontalScrollBar().valueChanged.connect(self.viewport().update) # pyright: ignore[reportOptionalMemberAccess]
+        self.update_line_count()
+
+    @property
+    def first_line(self) -> int:
+        return self.verticalScrollBar().value() # pyright: ignore[reportOptionalMemberAccess]
+
+    @property
+    def visible_lines(self) -> int:
+        return max(1, self.viewport().height() // self.fontMetrics().lineSpacing()) # pyright: ignore[reportOptionalMemberAccess]
+
+    def update_line_count(self):
+        """ 依目前索引到的行數更新捲軸 """
+        bar = self.verticalScrollBar()
+        bar.setRange(0, max(0, self.index.line_count - self.visible_lines)) # pyright: ignore[reportOptionalMemberAccess]
+        bar.setPageStep(self.visible_lines) # pyright: ignore[reportOptionalMemberAccess]
+        self.viewport().update() # pyright: ignore[reportOptionalMemberAccess]
+
+    def scroll_to_line(self, line: int):
+        """ 捲動到第line行(0起算 置中) """
+        self.verticalScrollBar().setValue(line - self.visible_lines // 2) # pyright: ignore[reportOptionalMemberAccess]
+
+    def _decode(self, start: int, end: int) -> str:
+        return str(self.data[start:end], self.encoding, "replace").expandtabs(4)
+
+    def _line_end(self, start: int, line: int) -> tuple[int, int]:
+        """ (顯示到的位置, 下一行的開頭) """
+        newline = self.data.find(b"\n", start, start + self.max_line_bytes)
+        if newline >= 0: return newline, newline + 1
+        # 超長的行或最後一行
+        if line + 1 < self.index.line_count: return start + self.max_line_bytes, self.index.line_start(line + 1)
+        return min(len(self.data), start + self.max_line_bytes), len(self.data)
+
+    def resizeEvent(self, e):
+        super().resizeEvent(e)
+        self.update_line_count()
+
+    def changeEvent(self, e):
+        super().changeEvent(e)
+        if e is not None and e.type() == QEvent.Type.FontChange: self.update_line_count()
+
+    def keyPressEvent(self, e: QKeyEvent|None):
+        bar = self.verticalScrollBar()
+        if e is not None and e.key() == Qt.Key.Key_Home: bar.setValue(0) # pyright: ignore[reportOptionalMemberAccess]
+        elif e is not None and e.key() == Qt.Key.Key_End: bar.setValue(bar.maximum()) # pyright: ignore[reportOptionalMemberAccess]
+        else: super().keyPressEvent(e) # 方向鍵/PageUp/PageDown
+
+    def paintEvent(self, e):
+        viewport = self.viewport()
+        painter = QPainter(viewport)
+        metrics = self.fontMetrics()
+        height, ascent = metrics.lineSpacing(), metrics.ascent()
+        palette = self.palette()
+        first, count = self.first_line, self.index.line_count
+        gutter = metrics.horizontalAdvance(str(count)) + 16
+        x = gutter - self.horizontalScrollBar().value() # pyright: ignore[reportOptionalMemberAccess]
+        painter.fillRect(0, 0, gutter - 8, viewport.height(), palette.window()) # pyright: ignore[reportOptionalMemberAccess]
+        number_color = QColor(palette.windowText().color())
+        number_color.setAlpha(128)
+        start = self.index.line_start(first) if first < count else len(self.data)
+        widest = self._widest
+        for row in range(self.visible_lines + 1):
+            line = first + row
+            if line >= count: break
+            end, next_start = self._line_end(start, line)
+            y = row * height
+            # 行號
+            painter.setClipping(False)
+            painter.setPen(number_color)
+            painter.drawText(0, y, gutter - 12, height, int(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter), str(line + 1))
+            painter.setClipRect(gutter, 0, viewport.width() - gutter, viewport.height()) # pyright: ignore[reportOptionalMemberAccess]
+            # 搜尋結果
+            if self.match is not None and start <= self.match[0] < max(end, start + 1):
+                offset, length = self.match
+                left = metrics.horizontalAdvance(self._decode(start, offset))
+                width = max(2, metrics.horizontalAdvance(self._decode(offset, min(offset + length, end))))
+                painter.fillRect(x + left, y, width, height, palette.highlight())
+            text = self._decode(start, end).rstrip("\r")
+            if line == 0: text = text.lstrip("\ufeff")
+            painter.setPen(palette.text().color())
+            painter.drawText(x, y + ascent, text)
+            widest = max(widest, metrics.horizontalAdvance(text) + gutter)
+            start = next_start
+        painter.end()
+        if widest > self._widest:
+            self._widest = widest
+            QTimer.singleShot(0, self._update_horizontal_range)
+
+    def _update_horizontal_range(self):
+        bar = self.horizontalScrollBar()
+        bar.setRange(0, max(0, self._widest - self.viewport().width())) # pyright: ignore[reportOptionalMemberAccess]
+        bar.setPageStep(self.viewport().width()) # pyright: ignore[reportOptionalMemberAccess]
+
+class FileViewer(QWidget):
+    """ 記憶體映射的唯讀檢視: 開啟幾乎不花時間 行索引在背景建立 搜尋直接在mapping上分段進行 """
+    def __init__(self, file_path: str, parent: QWidget|None = None):
+        super().__init__(parent)
+        self.file_path = file_path
+        self._file = open(file_path, "rb")
+        try: self.data: bytes|mmap.mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: self.data = b"" # 空檔不能映射
+        sample = self.data[:ENCODING_SAMPLE_SIZE]
+        encoding = detect_encoding(sample, len(sample) == len(self.data), plain_encodings)
+        if encoding in ("utf-16", "utf-32"):
+            self.close_file()
+            raise ValueError(f"唯讀檢視不支援 {encoding} 編碼的檔案")
+        self.encoding = "utf-8" if encoding == "utf-8-sig" else encoding # BOM在畫第一行時去掉
+        self.index = LineIndex(self.data)
+        self.search_task: CryptoTask|None = None
+        self.view = FileView(self.data, self.index, self.encoding, self)
+        self.init_bar()
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(2)
+        layout.addLayout(self.bar_layout)
+        layout.addWidget(self.view)
+
+    def init_bar(self):
+        """ 尋找/跳至行 """
+        self.bar_layout = QHBoxLayout()
+        self.bar_layout.setContentsMargins(8, 4, 8, 0)
+        self.find_input = QLineEdit()              # 單行輸入框
+        self.find_input.setPlaceholderText("尋找") # 輸入框提示
+        self.find_input.setFixedWidth(180)         # 寬度
+        self.prev_button = QPushButton("👆")       # 找上一個
+        self.next_button = QPushButton("👇")       # 找下一個
+        self.case_button = QPushButton("Aa")       # 大小寫需相符
+        self.case_button.setCheckable(True)
+        self.case_button.setChecked(True)          # 預設區分大小寫
+        self.prev_button.setFixedWidth(27)
+        self.next_button.setFixedWidth(27)
+        self.case_button.setFixedWidth(32)
+        self.line_input = QLineEdit()              # 跳至行
+        self.line_input.setPlaceholderText("跳至行 (Ctrl+G)")
+        self.line_input.setValidator(QIntValidator(1, 2**31 - 1, self))
+        self.line_input.setFixedWidth(120)
+        self.status_label = QLabel("")
+        self.find_input.returnPressed.connect(self.action_find_next)
+        self.next_button.clicked.connect(self.action_find_next)
+        self.prev_button.clicked.connect(self.action_find_prev)
+        self.line_input.returnPressed.connect(self.action_goto_line)
+        QShortcut(QKeySequence("Ctrl+G"), self, self.line_input.setFocus)
+        QShortcut(QKeySequence("Shift+Return"), self.find_input, self.action_find_prev)
+        for widget in (QLabel(">"), self.find_input, self.prev_button, self.next_button, self.case_button, self.line_input): 
+            self.bar_layout.addWidget(widget)
+        self.bar_layout.addWidget(self.status_label, 1)
+
+    def focus_search(self):
+        self.find_input.setFocus()
+        self.find_input.selectAll()
+
+    def close_file(self):
+        """ 取消搜尋並關閉mapping(關閉分頁時 索引工作需先結束) """
+        if self.search_task is not None:
+            self.search_task.cancel()
+            self.search_task.wait()
+        if isinstance(self.data, mmap.mmap): self.data.close()
+        self._file.close()
+
+    def action_goto_line(self):
+        """ 跳至行(索引建立中時只能跳到已索引的行) """
+        if not self.line_input.text(): return
+        line = int(self.line_input.text()) - 1
+        if line >= self.index.line_count:
+            self.status_label.setText(f"共 {self.index.line_count} 行" + ("" if self.index.complete else " (索引建立中)"))
+            line = self.index.line_count - 1
+        self.view.match = None
+        self.view.scroll_to_line(line)
+        self.view.setFocus()
+
+    def action_find_next(self):
+        self._find(backward=False)
+
+    def action_find_prev(self):
+        self._find(backward=True)
+
+    def _find(self, backward: bool):
+        """ 在背景從目前位置往後(前)尋找 找不到時從另一端繼續 """
+        text = self.find_input.text()
+        if not text: return
+        try: needle = text.encode(self.encoding)
+        except UnicodeEncodeError:
+            self.status_label.setText(f"無法以 {self.encoding} 編碼搜尋")
+            return
+        if self.search_task is not None: self.search_task.cancel()
+        match = self.view.match
+        if match is not None: origin = match[0] if backward else match[0] + 1
+        else: origin = self.index.line_start(min(self.view.first_line, self.index.line_count - 1))
+        data, index, ignore_case = self.data, self.index, not self.case_button.isChecked()
+        def search(task: CryptoTask) -> tuple[int, int, bool]:
+            """ 回傳(位元組偏移, 行, 是否從另一端繞回) """
+            if backward: found = find_bytes(data, needle, 0, origin + len(needle) - 1, True, ignore_case, task.check)
+            else: found = find_bytes(data, needle, origin, None, False, ignore_case, task.check)
+            wrapped = found < 0
+            if wrapped and backward: found = find_bytes(data, needle, origin, None, True, ignore_case, task.check)
+            elif wrapped: found = find_bytes(data, needle, 0, origin + len(needle) - 1, False, ignore_case, task.check)
+            return found, (index.line_of(found) if found >= 0 else -1), wrapped
+        def finished(result: tuple[int, int, bool]):
+            if self.search_task is not task: return # 已開始新的搜尋
+            found, line, wrapped = result
+            if found < 0:
+                self.status_label.setText("找不到")
+                return
+            self.view.match = (found, len(needle))
+            self.view.scroll_to_line(line)
+            self.view.viewport().update() # pyright: ignore[reportOptionalMemberAccess]
+            self.status_label.setText(f"第 {line + 1} 行" + (" (已從另一端繼續)" if wrapped else ""))
+        task = CryptoTask(search, "尋找", cancel_on_close=True)
+        task.signals.finished.connect(finished)
+        task.signals.failed.connect(lambda e: self.status_label.setText(f"搜尋失敗: {e}"))
+        self.search_task = task
+        self.status_label.setText("搜尋中...")
+        task.start()
+
 # 主視窗
 class MainWindow(QMainWindow):
     """ Main window of this application """
@@ -877,15 +1810,43 @@ class MainWindow(QMainWindow):
         self.theme: Theme = Theme.dark     # 預設色彩主題(深色)
         self.last_find_text = ""           # 上次的搜尋關鍵字
         self.last_replace_text = ""        # 上次的取代關鍵字
+        # 新加密檔共用的salt(KEK只需衍生一次) 所以這些檔案的KEK都相同: 可以共用是因為KEK只用來包裝資料金鑰
+        # 每個檔案(日誌的每筆record 復原快照)都有自己隨機的資料金鑰 不可用這個salt直接衍生內容的金鑰(舊base64格式的yoAES.encrypt)
+        self.kek_salt = yoAES.new_salt()
+        # 復原快照(資料夾在第一次寫入時建立並鎖定 其他執行中的視窗不會當成異常結束留下的)
+        self.recovery_dir = os.path.join(recovery_dir, f"{os.getpid()}-{int(time.time())}")
+        self.recovery_lock: QLockFile|None = None
+        self.recovery_hashes: dict[str, bytes] = {} # 已寫入的快照雜湊(內容沒變就不寫)
+        self.recovery_task: CryptoTask|None = None
+        self.recovery_due: float|None = None # 持續輸入時最晚的寫入時間
+        self.recovery_timer = QTimer(self)
+        self.recovery_timer.setSingleShot(True)
+        self.recovery_timer.timeout.connect(self._save_recovery)
+        # 監看開啟的檔案(含所在資料夾 檔案被替換/重建也能發現) 變化累積起來一次檢查
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self._handle_watched_change)
+        self.watcher.directoryChanged.connect(self._handle_watched_change)
+        self.watch_changed: set[str] = set()
+        self.watch_task: CryptoTask|None = None
+        self.watch_timer = QTimer(self)
+        self.watch_timer.setSingleShot(True)
+        self.watch_timer.setInterval(watch_debounce_ms)
+        self.watch_timer.timeout.connect(self._check_watched_files)
         # 初始化介面
         self.init_Tab()
         self.init_ui()
         self._set_theme()
         self.tab.reset_zoom()
         self.focus_text_edit()
+        # 首次執行: 產生任何雜湊或加密檔之前先校準kdf
+        _calibrate_kdf()
+        # 上次更改主密碼中斷: 開啟任何檔案前先完成提交(或清除未提交的暫存檔)
+        if recover_rekey(rekey_log, [os.path.join(filedirname, "Files"), filedirname]):
+            QMessageBox.information(self, "更改主密碼", "上次中斷的主密碼更改已完成")
         # 支援直接開啟檔案
         if not self._handle_external_file(file_to_open if file_to_open else welcome_file):
             self._handle_external_file(welcome_file)
+        QTimer.singleShot(0, self._offer_recovery) # 視窗顯示後再詢問
 
     def init_Tab(self):
         """ 初始化self.Tab_list(含text_edit) """
@@ -943,21 +1904,52 @@ class MainWindow(QMainWindow):
         self.FR_dock.setFloating(True) # 預設浮動
         self.FR_dock.hide()            # 隱藏
 
+        # 在檔案中尋找 layout
+        self.FF_dock = QDockWidget("在檔案中尋找", self)
+        self.FF_dock.setObjectName("FindInFilesDock")
+        self.find_files_panel = FindInFilesPanel(self)
+        self.FF_dock.setWidget(self.find_files_panel)
+        self.addDockWidget(Qt.DockWidgetArea.BottomDockWidgetArea, self.FF_dock) # 停在下方
+        self.FF_dock.hide()
+
         # 主要layout (Tabs)
         self.setCentralWidget(self.tabs)
         self.setStatusBar(QStatusBar())
 
+        # 背景加解密的忙碌指示(目前分頁)
+        self.busy_bar = QProgressBar()
+        self.busy_bar.setRange(0, 0)   # 不定進度
+        self.busy_bar.setTextVisible(False)
+        self.busy_bar.setMaximumWidth(120)
+        self.busy_cancel_button = QPushButton("取消")
+        self.busy_cancel_button.clicked.connect(self.action_cancel_task)
+        self.statusBar().addPermanentWidget(self.busy_bar)           # pyright: ignore[reportOptionalMemberAccess]
+        self.statusBar().addPermanentWidget(self.busy_cancel_button) # pyright: ignore[reportOptionalMemberAccess]
+        self.busy_bar.hide()
+        self.busy_cancel_button.hide()
+
         # 建立 QAction
         change_password_action = QAction("Change Master Password", self) # 更改主密碼
 
         new_action = QAction("New", self)                         # 新檔案
         open_action = QAction("Open", self)                       # 開啟普通檔案
         open_crypted_action = QAction("Open Crypted", self)       # 開啟加密檔案
+        open_viewer_action = QAction("Open Read-only Viewer", self) # 以唯讀檢視開啟大檔案
         save_action = QAction("Save", self)                       # 儲存成普通檔案
         save_crypted_action = QAction("Save Crypted", self)       # 儲存成加密檔案
         save_as_action = QAction("Save as", self)                 # 另存為普通檔案
         save_as_crypted_action = QAction("Save as Crypted", self) # 另存為加密檔案
         auto_save_action = QAction("Auto Save", self)             # 自動化儲存
+        compression_menu = QMenu("Compression", self)             # 加密檔的壓縮方式(逐檔)
+        self.compression_group = QActionGroup(self)
+        for compression in COMPRESSIONS:
+            compression_action = QAction(compression or "None", self)
+            compression_action.setCheckable(True)
+            compression_action.setData(compression)
+            self.compression_group.addAction(compression_action)
+            compression_menu.addAction(compression_action)
+        self.journal_action = QAction("Journaled Saves", self)   # 日誌模式(存檔只附加變更 逐檔)
+        self.journal_action.setCheckable(True)
 
         zoom_in_action = QAction("Zoom In", self)                 # 字體放大
         zoom_out_action = QAction("Zoom Out", self)               # 字體縮小
@@ -965,6 +1957,7 @@ class MainWindow(QMainWindow):
 
         find_action = QAction("Find", self)                       # 尋找
         replace_action = QAction("Replace", self)                 # 取代
+        find_in_files_action = QAction("Find in Files", self)     # 在檔案中尋找
 
         set_theme_dark_action = QAction("Toggle To Dark Theme", self)       # 深色模式
         set_theme_light_action = QAction("Toggle To Light Theme", self)     # 淺色模式
@@ -982,11 +1975,16 @@ class MainWindow(QMainWindow):
         new_action.triggered.connect(self.action_new)
         open_action.triggered.connect(self.action_open)
         open_crypted_action.triggered.connect(self.action_open_crypted)
+        open_viewer_action.triggered.connect(self.action_open_viewer)
         save_action.triggered.connect(self.action_save)
         save_crypted_action.triggered.connect(self.action_save_crypted)
         save_as_action.triggered.connect(self.action_save_as)
         save_as_crypted_action.triggered.connect(self.action_save_as_crypted)
         auto_save_action.triggered.connect(self.action_auto_save)
+        compression_menu.aboutToShow.connect(self._update_compression_menu)
+        self.compression_group.triggered.connect(self.action_set_compression)
+        file_menu.aboutToShow.connect(lambda: self.journal_action.setChecked(self.tab.journal))
+        self.journal_action.triggered.connect(self.action_set_journal)
 
         zoom_in_action.triggered.connect(self.action_zoom_in)
         zoom_out_action.triggered.connect(self.action_zoom_out)
@@ -994,6 +1992,7 @@ class MainWindow(QMainWindow):
 
         find_action.triggered.connect(self.action_find)
         replace_action.triggered.connect(self.action_replace)
+        find_in_files_action.triggered.connect(self.action_find_in_files)
 
         set_theme_dark_action.triggered.connect(self.action_set_theme_dark)
         set_theme_light_action.triggered.connect(self.action_set_theme_light)
@@ -1018,6 +2017,7 @@ class MainWindow(QMainWindow):
 
         find_action.setShortcut("Ctrl+F")
         replace_action.setShortcut("Ctrl+H")
+        find_in_files_action.setShortcut("Ctrl+Shift+F")
 
         close_tab_action.setShortcut("Ctrl+W")
 
@@ -1027,17 +2027,21 @@ class MainWindow(QMainWindow):
         file_menu.addAction(new_action)
         file_menu.addAction(open_action)
         file_menu.addAction(open_crypted_action)
+        file_menu.addAction(open_viewer_action)
         file_menu.addSeparator()
         file_menu.addAction(auto_save_action)
         file_menu.addAction(save_action)
         file_menu.addAction(save_crypted_action)
         file_menu.addAction(save_as_action)
         file_menu.addAction(save_as_crypted_action)
+        file_menu.addMenu(compression_menu)
+        file_menu.addAction(self.journal_action)
         file_menu.addSeparator()
         file_menu.addAction(close_tab_action)
 
         edit_menu.addAction(find_action)
         edit_menu.addAction(replace_action)
+        edit_menu.addAction(find_in_files_action)
         edit_menu.addSeparator()
         edit_menu.addAction(auto_highlight_action)
         edit_menu.addAction(disable_highlight_action)
@@ -1081,8 +2085,9 @@ class MainWindow(QMainWindow):
 
     def focus_text_edit(self):
         """ active """
-        self.text_edit.activateWindow()
-        self.text_edit.setFocus()
+        widget = self.text_edit if self.tab.viewer is None else self.tab.viewer.view
+        widget.activateWindow()
+        widget.setFocus()
 
     def _ensure_password(self) -> bool:
         """ 檢查密碼是否存在 若不存在則彈出輸入框 """
@@ -1099,6 +2104,55 @@ class MainWindow(QMainWindow):
     def _handle_tab_change(self, index: int):
         """ 處理分頁切換事件 """
         self.tab_index = index
+        self._update_busy_indicator()
+
+    def _start_task(self, tab: Tab, task: CryptoTask, on_finished: Callable[[Any], None], 
+                    on_failed: Callable[[Exception], None], on_cancelled: Callable[[], None], 
+                    on_progress: Callable[[Any], None]|None = None, read_only: bool = True):
+        """ 在背景執行分頁的加解密工作(顯示忙碌 read_only: 期間分頁唯讀) """
+        def end():
+            if tab.task is not task: return
+            tab.task = None
+            tab.text_edit.setReadOnly(False)
+            if tab in self.tab_list: tab.update_title()
+            self._update_busy_indicator()
+        task.signals.ended.connect(end)
+        task.signals.finished.connect(on_finished)
+        task.signals.failed.connect(on_failed)
+        task.signals.cancelled.connect(on_cancelled)
+        def progressed(_):
+            if tab in self.tab_list: tab.update_title()
+            if tab is self.tab: self._update_busy_indicator()
+        if on_progress is not None: 
+            task.signals.progress.connect(on_progress)
+            task.signals.progress.connect(progressed)
+        tab.task = task
+        tab.text_edit.setReadOnly(read_only)
+        tab.update_title()
+        self._update_busy_indicator()
+        task.start()
+
+    def _finish_tab_task(self, tab: Tab):
+        """ 等待分頁的背景工作結束(讀檔直接取消 合併的存檔也等完) """
+        while tab.task is not None:
+            if tab.task.cancel_on_close: tab.task.cancel()
+            tab.task.wait()
+
+    def _update_busy_indicator(self):
+        """ 目前分頁有背景工作時顯示忙碌/取消 """
+        task = self.tab.task if 0 <= self.tab_index < len(self.tab_list) else None
+        self.busy_bar.setVisible(task is not None)
+        self.busy_cancel_button.setVisible(task is not None)
+        if task is None: return
+        self.busy_bar.setToolTip(task.label)
+        if task.fraction is None: self.busy_bar.setRange(0, 0) # 不定進度
+        else:
+            self.busy_bar.setRange(0, 100)
+            self.busy_bar.setValue(int(task.fraction * 100))
+
+    def action_cancel_task(self):
+        """ 取消目前分頁的背景工作 """
+        if self.tab.task is not None: self.tab.task.cancel()
 
     def _handle_tab_close(self, index: int):
         """ 處理分頁關閉事件 """
@@ -1112,17 +2166,22 @@ class MainWindow(QMainWindow):
             self.tabs.setCurrentIndex(old_index)
             return
         self.tabs.removeTab(index)
+        viewer = self.tab_list[index].viewer
+        if viewer is not None: viewer.close_file()
         del self.tab_list[index]
+        self._update_watched()
         # 更新各tab的index
         for i in range(index, len(self.tab_list)):
             self.tab_list[i].index = i
         self.tab_index = self.tabs.currentIndex()
+        self._schedule_recovery()
         # 至少留一個分頁
         if self.tabs.count() == 0: self.action_new()
         self.focus_text_edit()
 
     def _dirty_warning_success(self) -> bool:
         """ 當檔案未儲存且會遺失時 詢問使用者是否要儲存(True代表不用cancel) """
+        self._finish_tab_task(self.tab)
         empty_file = (self.file_path is None) and (not self.text_edit.toPlainText())
         if (not self.tab.is_dirty) or empty_file: return True
         file_path = "untitled" if (self.file_path is None) else self.file_path
@@ -1134,7 +2193,7 @@ class MainWindow(QMainWindow):
             QMessageBox.Cancel # 預設選中 Cancel 避免誤觸
         )
         if reply == QMessageBox.No: return True
-        elif reply == QMessageBox.Yes: return self._auto_save()
+        elif reply == QMessageBox.Yes: return self._auto_save(wait=True)
         elif reply == QMessageBox.Cancel: return False
         else: raise ValueError(f"unexpected QMessageBox reply: {reply}")
 
@@ -1144,64 +2203,300 @@ class MainWindow(QMainWindow):
             for i in range(len(self.password)):
                 self.password[i] = 0 
         self.password = bytearray()
+        key_cache.clear()
 
-    def _auto_highlight(self, file_path: str):
-        """ 自動套用高亮器 """
+    def _auto_highlight(self, file_path: str, tab: Tab|None = None):
+        """ 自動套用高亮器(預設為目前分頁) """
+        tab = tab or self.tab
         extension = str(os.path.splitext(file_path)[1])
-        doc = self.text_edit.document()
+        doc = tab.text_edit.document()
         if doc is None: raise RuntimeError("self.text_edit.document() is None")
         # Python
-        if extension in [".py", ".ipynb"]: self.highlighter = PyHighlighter(doc)
+        if extension in [".py", ".ipynb"]: tab.highlighter = PyHighlighter(doc)
         # Markdown
-        # elif extension in [".md"]: self.highlighter = MdHighlighter(doc)
+        # elif extension in [".md"]: tab.highlighter = MdHighlighter(doc)
         # 以上皆非
-        else: self.highlighter = None
+        else: tab.highlighter = None
 
-    def _read_file_from(self, file_path: str, hint: str, decrypt: bool = False) -> bool:
-        """ 讀取指定位置的檔案 回傳是否成功 """
+    def _read_file_from(self, file_path: str, hint: str, decrypt: bool = False, on_fail: Callable[[], None]|None = None, tab: Tab|None = None) -> bool:
+        """ 讀取指定位置的檔案到分頁(預設為目前分頁) 回傳是否成功 
+        加密檔/大檔案在背景逐批讀取(回傳是否已開始) 失敗或取消時呼叫on_fail """
         file_name = os.path.basename(file_path)
-        # 內部函數
-        def msg(): self.statusBar().showMessage(f"已{hint}: {file_name}", 4000) # pyright: ignore[reportOptionalMemberAccess]
-        # 嘗試多種編碼讀取
-        encrypted_data = None
-        encodings_to_try = ["utf-8", "gbk", "cp950", "latin-1"]
-        for encoding in encodings_to_try:
-            try:
-                file = open(file_path, "r", encoding=encoding)
-                encrypted_data = file.read()
-                file.close()
-                break
-            except UnicodeDecodeError: continue
-            except Exception as e:
-                QMessageBox.critical(self, "錯誤", f"讀取檔案 {file_name} 失敗: {e}")
-                return False # 讀取失敗，直接返回
-        if encrypted_data is None:
-            QMessageBox.critical(self, "編碼錯誤", f"無法識別檔案 {file_name} 的編碼格式，開啟失敗。")
-            return False
-        # 解密/顯示/提示
+        tab = tab or self.tab
+        try: progressive = decrypt or os.path.getsize(file_path) > progressive_load_bytes
+        except Exception as e:
+            QMessageBox.critical(self, "錯誤", f"讀取檔案 {file_name} 失敗: {e}")
+            return False # 讀取失敗，直接返回
+        # 加密檔/大檔案: 背景逐批解密(讀取) 先顯示第一批 其餘陸續附加
+        if progressive:
+            shown = False
+            def progress(text: str|None):
+                nonlocal shown
+                if not shown and text is not None:
+                    shown = True # 先設定 _show_file會處理事件(可能先收到finished)
+                    self._show_file(tab, file_path, hint, text, None, decrypt)
+                elif text is None: tab.text_edit.clear() # 編碼不符 重新讀取
+                else: self._append_text(tab, text)
+            def loaded(text: str, salt: bytes|None):
+                if not shown: self._show_file(tab, file_path, hint, text, salt, decrypt)
+                else:
+                    self._append_text(tab, text)
+                    tab.salt = salt
+                    tab.is_dirty = False
+                    tab.update_title()
+            def failed(e: Exception):
+                if decrypt: QMessageBox.critical(self, "解密錯誤", f"解密檔案 {file_name} 失敗: {e}")
+                else: QMessageBox.critical(self, "錯誤", f"讀取檔案 {file_name} 失敗: {e}")
+                if on_fail: QTimer.singleShot(0, on_fail)
+            def cancelled():
+                self.statusBar().showMessage(f"已取消{hint}: {file_name}", 4000) # pyright: ignore[reportOptionalMemberAccess]
+                if on_fail: QTimer.singleShot(0, on_fail)
+            if decrypt:
+                password = self.password
+                def decrypted(result: tuple[str, bytes, ChunkMap|None, str]):
+                    text, salt, chunk_map, compression = result
+                    tab.compression = compression or default_compression # 沒壓縮的舊檔/短檔 下次存檔套用預設
+                    loaded(text, salt)
+                    self._set_chunk_map(tab, chunk_map)
+                    self._apply_journal(tab, file_path, decrypt=True)
+                task = CryptoTask(lambda task: _load_crypt_file(file_path, password, task), f"解密 {file_name}", cancel_on_close=True)
+                self._start_task(tab, task, decrypted, failed, cancelled, progress)
+            else:
+                def read(result: tuple[str, str]):
+                    text, tab.encoding = result
+                    loaded(text, None)
+                    self._apply_journal(tab, file_path, decrypt=False)
+                task = CryptoTask(lambda task: _load_plain_file(file_path, task), f"讀取 {file_name}", cancel_on_close=True)
+                self._start_task(tab, task, read, failed, cancelled, progress)
+            return True
+        # 讀取一次 判斷編碼後解碼一次
+        try:
+            with open(file_path, "rb") as file: data = file.read()
+        except Exception as e:
+            QMessageBox.critical(self, "錯誤", f"讀取檔案 {file_name} 失敗: {e}")
+            return False # 讀取失敗，直接返回
+        plain_text, tab.encoding = decode_plain(data, plain_encodings)
+        del data
+        if not self._show_file(tab, file_path, hint, plain_text, None, decrypt=False): return False
+        self._apply_journal(tab, file_path, decrypt=False)
+        return True
+
+    def _apply_journal(self, tab: Tab, file_path: str, decrypt: bool):
+        """ 讀檔完成後: 有日誌時重播(base + 日誌)並啟用日誌模式 之後的存檔繼續附加
+        日誌與檔案不符(檔案被外部改寫等)時提示並忽略 下次存檔完整寫入 """
+        path = journal_path(file_path)
+        tab.journal_ops, tab.journal_state = None, None
+        if tab not in self.tab_list or not os.path.exists(path): return
+        tab.journal = True
+        doc = tab.text_edit.document()
+        if doc is None: raise RuntimeError("text_edit.document() is None")
+        try:
+            stamp, encrypted, records, end = read_journal(path, self.password if decrypt else None)
+            if encrypted != decrypt: raise ValueError("日誌與檔案的加密方式不同")
+            if stamp != _file_stamp(file_path): raise ValueError("檔案在寫入日誌之後被改寫")
+            check_journal(doc.characterCount() - 1, records) # 先驗證長度 不會只套用一半
+        except Exception as e:
+            QMessageBox.warning(self, "日誌", f"{os.path.basename(path)} 無法套用 已忽略(下次存檔時完整寫入): {e}")
+            return
+        cursor = QTextCursor(doc)
+        doc.setUndoRedoEnabled(False)
+        cursor.beginEditBlock()
+        for ops, _ in records:
+            for position, removed, text in ops:
+                cursor.setPosition(position)
+                cursor.setPosition(min(position + removed, doc.characterCount() - 1), QTextCursor.MoveMode.KeepAnchor)
+                cursor.insertText(text)
+        cursor.endEditBlock()
+        doc.setUndoRedoEnabled(True)
+        doc.setModified(False)
+        tab.journal_state = (file_path, decrypt, stamp, end)
+        tab.journal_ops, tab.journal_tail = [], -1
+        tab.is_dirty = False
+        tab.update_title()
+
+    def _show_file(self, tab: Tab, file_path: str, hint: str, plain_text: str, salt: bytes|None, decrypt: bool) -> bool:
+        """ 顯示讀取(解密)完成的內容/提示 回傳是否成功 """
+        if tab not in self.tab_list: return False # 分頁已關閉
+        def msg(): self.statusBar().showMessage(f"已{hint}: {os.path.basename(file_path)}", 4000) # pyright: ignore[reportOptionalMemberAccess]
         try: 
             # Tab
-            plain_text = yoAES.decrypt(encrypted_data, self.password) if decrypt else encrypted_data
-            self.text_edit.setPlainText(plain_text)
+            tab.salt = salt
+            tab.chunk_map = None
+            tab.text_edit.setPlainText(plain_text)
             # 高亮
-            self._auto_highlight(file_path)
+            self._auto_highlight(file_path, tab)
             # 提示
             self.statusBar().clearMessage() # pyright: ignore[reportOptionalMemberAccess]
             QTimer.singleShot(50, msg)
-            self.file_path = file_path
-            self.tab.is_crypt = decrypt
+            tab.file_path = file_path
+            tab.is_crypt = decrypt
+            self._watch_file(tab, file_path)
             # 強制更新is_dirty
             QApplication.processEvents()
-            self.tab.is_dirty = False
-            self.tab.update_title()
-            self.tab.update_zoom()
-            self.focus_text_edit()
+            tab.is_dirty = False
+            tab.update_title()
+            tab.update_zoom()
+            if tab is self.tab: self.focus_text_edit()
             return True
         except Exception as e: 
-            QMessageBox.critical(self, "解密錯誤", f"解密檔案 {file_name} 失敗: {e}")
-            self.text_edit.clear()
+            QMessageBox.critical(self, "解密錯誤", f"解密檔案 {os.path.basename(file_path)} 失敗: {e}")
+            tab.text_edit.clear()
             return False
 
+    def _set_chunk_map(self, tab: Tab, chunk_map: ChunkMap|None):
+        """ 設定分頁的區塊對應(與文件長度不符就不用) """
+        doc = tab.text_edit.document()
+        if chunk_map is not None and (tab not in self.tab_list or chunk_map.total != doc.characterCount() - 1): chunk_map = None # pyright: ignore[reportOptionalMemberAccess]
+        tab.chunk_map = chunk_map
+
+    def _append_text(self, tab: Tab, text: str):
+        """ 在分頁結尾附加文字(背景載入用 不進入復原堆疊) """
+        if not text or tab not in self.tab_list: return
+        doc = tab.text_edit.document()
+        if doc is None: raise RuntimeError("text_edit.document() is None")
+        cursor = QTextCursor(doc)
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        doc.setUndoRedoEnabled(False)
+        cursor.insertText(text)
+        doc.setUndoRedoEnabled(True)
+
+    def _watch_file(self, tab: Tab, file_path: str):
+        """ 讀取/儲存後記錄檔案的狀態並監看 雜湊在背景計算(只有大小不變而修改時間變了時才需要) """
+        if tab not in self.tab_list or tab.viewer is not None: return
+        file_path = os.path.abspath(file_path)
+        try: stamp = _file_stamp(file_path)
+        except OSError: return
+        if tab.disk_state is not None and tab.disk_state[:2] == (file_path, stamp): return # 沒變(只附加了日誌)
+        tab.disk_state = state = (file_path, stamp, None)
+        self._update_watched()
+        if stamp[0] > watch_hash_max_bytes: return
+        def hashed(result: tuple[tuple[int, int], bytes|None]):
+            if tab.disk_state == state and result[0] == stamp: tab.disk_state = (file_path, stamp, result[1])
+        task = CryptoTask(lambda task: _file_fingerprint(file_path, task), f"雜湊 {os.path.basename(file_path)}")
+        task.signals.finished.connect(hashed)
+        task.start()
+
+    def _update_watched(self):
+        """ 監看所有分頁的檔案與所在資料夾(不再開啟的移除 被替換後失效的重新加入) """
+        files = {tab.disk_state[0] for tab in self.tab_list if tab.disk_state is not None}
+        wanted = files | {os.path.dirname(path) for path in files}
+        watched = set(self.watcher.files()) | set(self.watcher.directories())
+        if watched - wanted: self.watcher.removePaths(list(watched - wanted))
+        missing = [path for path in wanted - watched if os.path.exists(path)]
+        if missing: self.watcher.addPaths(missing)
+
+    def _handle_watched_change(self, path: str):
+        """ 監看的檔案/資料夾有變化: 累積起來 停止變化watch_debounce_ms後一次檢查 """
+        self.watch_changed.add(path)
+        self.watch_timer.start()
+
+    def _check_watched_files(self):
+        """ 在背景檢查累積的變化(資料夾的變化只檢查其中開啟的檔案) 讀取/存檔中的分頁結束後再檢查 """
+        if self.watch_task is not None: return # 上一次還沒處理完 結束後再檢查
+        paths, self.watch_changed = self.watch_changed, set()
+        self._update_watched()
+        items: list[tuple[Tab, DiskState]] = []
+        for tab in self.tab_list:
+            state = tab.disk_state
+            if state is None or (state[0] not in paths and os.path.dirname(state[0]) not in paths): continue
+            if tab.task is not None: self.watch_changed.add(state[0])
+            else: items.append((tab, state))
+        if not items:
+            if self.watch_changed: self.watch_timer.start()
+            return
+        states = [state for _, state in items]
+        task = CryptoTask(lambda task: _check_files(states, task), "檢查外部修改")
+        def ended():
+            self.watch_task = None
+            if self.watch_changed: self.watch_timer.start()
+        def finished(results: list[tuple[tuple[int, int]|None, bool]]):
+            try:
+                for (tab, state), (stamp, changed) in zip(items, results):
+                    if tab in self.tab_list and tab.disk_state == state: self._handle_external_change(tab, stamp, changed) # 期間重新讀取/儲存過就不算
+            finally: ended()
+        def failed(e: Exception):
+            self.statusBar().showMessage(f"檢查外部修改失敗: {e}", 4000) # pyright: ignore[reportOptionalMemberAccess]
+            ended()
+        task.signals.finished.connect(finished)
+        task.signals.failed.connect(failed)
+        task.signals.cancelled.connect(ended)
+        self.watch_task = task
+        task.start()
+
+    def _handle_external_change(self, tab: Tab, stamp: tuple[int, int]|None, changed: bool):
+        """ 分頁的檔案被外部修改: 沒有未儲存的變更就重新載入 否則詢問重新載入/合併/保留分頁的內容 """
+        file_path, _, digest = tab.disk_state # pyright: ignore[reportOptionalMemberAccess]
+        file_name = os.path.basename(file_path)
+        if not changed:
+            tab.disk_state = (file_path, stamp, digest) # 只有修改時間變了
+            return
+        if stamp is None:
+            tab.disk_state = (file_path, None, None)
+            tab.is_dirty = True
+            tab.update_title()
+            self.statusBar().showMessage(f"{file_name} 已被刪除或移動 內容只剩分頁中", 4000) # pyright: ignore[reportOptionalMemberAccess]
+            return
+        if not tab.is_dirty:
+            self._reload_tab(tab)
+            self.statusBar().showMessage(f"已重新載入外部修改的 {file_name}", 4000) # pyright: ignore[reportOptionalMemberAccess]
+            return
+        self.tabs.setCurrentIndex(tab.index)
+        reply = QMessageBox.question(self, "檔案已變更",
+            f"{file_name} 已被其他程式修改\n是: 重新載入(放棄分頁中未儲存的變更)\n否: 合併(保留分頁的內容 加入外部新增/修改的行)\n取消: 保留分頁的內容(儲存時覆蓋外部的修改)",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No | QMessageBox.StandardButton.Cancel, QMessageBox.StandardButton.Cancel)
+        if tab not in self.tab_list or tab.task is not None: return
+        if reply == QMessageBox.StandardButton.Yes: self._reload_tab(tab)
+        elif reply == QMessageBox.StandardButton.No: self._merge_tab(tab)
+        else: self._watch_file(tab, file_path)
+
+    def _reload_tab(self, tab: Tab):
+        """ 重新讀取分頁的檔案(放棄分頁中的變更) 盡量保留游標與捲動位置 """
+        if tab.disk_state is None: return
+        position = tab.text_edit.textCursor().position()
+        scroll = tab.text_edit.verticalScrollBar().value() # pyright: ignore[reportOptionalMemberAccess]
+        if not self._read_file_from(tab.disk_state[0], "重新載入", tab.is_crypt, tab=tab) or tab.task is not None: return
+        cursor = tab.text_edit.textCursor()
+        cursor.setPosition(min(position, tab.text_edit.document().characterCount() - 1)) # pyright: ignore[reportOptionalMemberAccess]
+        tab.text_edit.setTextCursor(cursor)
+        tab.text_edit.verticalScrollBar().setValue(scroll) # pyright: ignore[reportOptionalMemberAccess]
+
+    def _merge_tab(self, tab: Tab):
+        """ 在背景讀取外部版本並逐行合併到分頁(見_merge_insertions) 一次編輯 可以復原 """
+        if tab.disk_state is None: return
+        file_path, decrypt, password = tab.disk_state[0], tab.is_crypt, self.password
+        file_name = os.path.basename(file_path)
+        ours = tab.text_edit.toPlainText()
+        def merge(task: CryptoTask) -> list[tuple[int, str]]:
+            if decrypt: theirs = _read_crypt_file(file_path, password, task)[0]
+            else:
+                with open(file_path, "rb") as file: theirs = decode_plain(file.read(), plain_encodings)[0]
+            task.check()
+            return _merge_insertions(ours, theirs)
+        def merged(insertions: list[tuple[int, str]]):
+            if tab not in self.tab_list: return
+            cursor = QTextCursor(tab.text_edit.document())
+            cursor.beginEditBlock()
+            for position, text in reversed(insertions):
+                cursor.setPosition(position)
+                cursor.insertText(text)
+            cursor.endEditBlock()
+            self._watch_file(tab, file_path) # 已合併 之後存檔時覆蓋
+            self.statusBar().showMessage(f"已合併 {file_name} 的 {len(insertions)} 處外部修改", 4000) # pyright: ignore[reportOptionalMemberAccess]
+        def failed(e: Exception): QMessageBox.critical(self, "錯誤", f"合併 {file_name} 失敗: {e}")
+        def cancelled(): self.statusBar().showMessage(f"已取消合併: {file_name}", 4000) # pyright: ignore[reportOptionalMemberAccess]
+        self._start_task(tab, CryptoTask(merge, f"合併 {file_name}", cancel_on_close=True), merged, failed, cancelled)
+
+    def _confirm_overwrite(self, tab: Tab, file_path: str) -> bool:
+        """ 存檔前: 檔案在讀取/上次儲存之後被外部修改(還沒處理)時 確認是否覆蓋 """
+        state = tab.disk_state
+        if state is None or state[0] != os.path.abspath(file_path): return True
+        try: stamp = _file_stamp(file_path)
+        except OSError: return True # 已刪除 直接寫入
+        if stamp == state[1]: return True
+        reply = QMessageBox.question(self, "檔案已變更", f"{os.path.basename(file_path)} 在開啟/上次儲存之後被其他程式修改 儲存會覆蓋這些修改 仍要儲存?",
+                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No, QMessageBox.StandardButton.No)
+        return reply == QMessageBox.StandardButton.Yes
+
     def _handle_external_file(self, file_path: str) -> bool:
         """ 處理從外部傳入的檔案路徑 """
         if not self._read_file_from(file_path, "開啟檔案", False):
@@ -1229,12 +2524,79 @@ class MainWindow(QMainWindow):
         # 取得路徑
         file_path, _ = QFileDialog.getOpenFileName(self, hint, "", "All Files (*)", options=options)
         if not file_path: return False # 取消
+        # 很大的普通檔案 建議用唯讀檢視
+        if not decrypt and os.path.exists(file_path) and os.path.getsize(file_path) > viewer_suggest_bytes:
+            reply = QMessageBox.question(self, "大檔案", f"{os.path.basename(file_path)} 很大 要以唯讀檢視開啟嗎?\n(否: 完整載入到編輯器)",
+                                         QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+            if reply == QMessageBox.StandardButton.Yes: return self._open_viewer(file_path)
         # 開啟檔案
         self.action_new()
-        success = self._read_file_from(file_path, hint, decrypt)
-        if not success: self._handle_tab_close(self.tab_index)
+        tab = self.tab
+        def close_tab():
+            if tab in self.tab_list: self._handle_tab_close(tab.index)
+        success = self._read_file_from(file_path, hint, decrypt, on_fail=close_tab)
+        if not success: close_tab()
         return success
 
+    def open_file_at(self, file_path: str, decrypt: bool, line: int, start: int, end: int):
+        """ 開啟檔案(已開啟時切換到該分頁) 載入完成後選取第line行(0起算)的[start, end)(UTF-16位置) """
+        file_path = os.path.abspath(file_path)
+        tab = next((tab for tab in self.tab_list if tab.file_path and os.path.abspath(tab.file_path) == file_path), None)
+        loading = tab is None
+        if tab is not None: self.tabs.setCurrentIndex(tab.index)
+        else:
+            if decrypt and not self._ensure_password(): return
+            self.action_new()
+            tab = self.tab
+            def close_tab():
+                if tab in self.tab_list: self._handle_tab_close(tab.index)
+            if not self._read_file_from(file_path, "開啟加密檔案" if decrypt else "開啟普通檔案", decrypt, on_fail=close_tab): return close_tab()
+        def select():
+            if tab not in self.tab_list or tab.viewer is not None: return
+            doc = tab.text_edit.document()
+            if doc is None: raise RuntimeError("text_edit.document() is None")
+            block = doc.findBlockByNumber(line)
+            if not block.isValid(): return
+            cursor = QTextCursor(doc)
+            cursor.setPosition(block.position() + min(start, block.length() - 1))
+            cursor.setPosition(block.position() + min(end, block.length() - 1), QTextCursor.MoveMode.KeepAnchor)
+            tab.text_edit.setTextCursor(cursor)
+            tab.text_edit.centerCursor()
+            if tab is self.tab: self.focus_text_edit()
+        # 背景載入中: 讀取完成(含日誌)之後才選取
+        if loading and tab.task is not None: tab.task.signals.finished.connect(lambda _: select())
+        else: select()
+
+    def _open_viewer(self, file_path: str) -> bool:
+        """ 以唯讀檢視開啟(記憶體映射 不載入文字) 行索引在背景建立 """
+        file_name = os.path.basename(file_path)
+        try: viewer = FileViewer(file_path, self)
+        except Exception as e:
+            QMessageBox.critical(self, "錯誤", f"開啟檔案 {file_name} 失敗: {e}")
+            return False
+        new_index = self.tabs.count()
+        tab = Tab(self, index=new_index, text_edit=CodeEditor(self), file_path=file_path, is_dirty=False, is_crypt=False)
+        tab.viewer = viewer
+        tab.text_edit.setReadOnly(True)
+        viewer.view.setFont(tab.text_edit.font())
+        self.tab_list.append(tab)
+        self.tabs.addTab(viewer, "")
+        self.tabs.setCurrentIndex(new_index)
+        self.tab_index = new_index
+        tab.update_title()
+        update = lambda *_: viewer.view.update_line_count()
+        def failed(e: Exception): QMessageBox.critical(self, "錯誤", f"建立 {file_name} 的行索引失敗: {e}")
+        task = CryptoTask(lambda task: viewer.index.build(task.check, lambda fraction: task.report(None, fraction)), 
+                          f"索引 {file_name}", cancel_on_close=True)
+        self._start_task(tab, task, update, failed, update, update)
+        self.focus_text_edit()
+        return True
+
+    def action_open_viewer(self):
+        """ 以唯讀檢視開啟大檔案 """
+        file_path, _ = QFileDialog.getOpenFileName(self, "唯讀檢視", "", "All Files (*)", options=QFileDialog.Options())
+        if file_path: self._open_viewer(file_path)
+
     def action_open(self): 
         """ 開啟普通檔案 """
         self._open_file("開啟普通檔案", decrypt=False)
@@ -1244,31 +2606,125 @@ class MainWindow(QMainWindow):
         if not self._ensure_password(): return
         self._open_file("開啟加密檔案",  decrypt=True)
 
-    def _save_file(self, file_path: str, hint: str, encrypt: bool) -> bool:
-        """ 儲存至file_path """
+    def _save_file(self, file_path: str, hint: str, encrypt: bool, wait: bool = False, tab: Tab|None = None) -> bool:
+        """ 儲存至file_path(預設為目前分頁) 回傳是否成功 wait=False時回傳是否已開始
+        擷取文件快照後在背景編碼/加密 寫入暫存檔 fsync後rename覆蓋 期間仍可編輯
+        同一分頁存檔中再次存檔時合併: 完成後再以最新內容存一次 
+        日誌模式: 只把上次存檔後的編輯操作附加到日誌 日誌超過檔案的journal_compact_ratio時完整寫入(壓實) """
         file_name = os.path.basename(file_path)
+        tab = tab or self.tab
+        doc = tab.text_edit.document()
+        if doc is None: raise RuntimeError("text_edit.document() is None")
+        retried: bool|None = None
         # 內部函數
         def msg(): 
             """ 更新statusBar """
             self.statusBar().showMessage(f"已{hint}: {file_name}", 4000) # pyright: ignore[reportOptionalMemberAccess]
-        # 讀取輸入框
-        try:
-            plain_text = self.text_edit.toPlainText()
-            write_data = yoAES.encrypt(plain_text, self.password) if encrypt else plain_text
-            # 寫檔
-            file = open(file_path, "w", encoding="utf-8")
-            file.write(write_data)
-            file.close()
-            # 提示
+        def saved(chunk_map: ChunkMap|None, journal_state: tuple[str, bool, tuple[int, int], int]|None, appended: bool = False):
+            """ 提示/更新分頁 存檔期間的變更套用到新的區塊對應(附加到日誌時檔案與區塊對應都不變) """
+            changes, tab.save_changes = tab.save_changes or [], None
+            tab.journal_state = journal_state
             self.statusBar().clearMessage() # pyright: ignore[reportOptionalMemberAccess]
             QTimer.singleShot(50, msg)
-            self.tab.is_dirty = False
-            self.tab.update_title()
-            self.tab.is_crypt = encrypt
-            return True
-        # 儲存失敗
-        except Exception as e: QMessageBox.critical(self, "錯誤", f"儲存{os.path.basename(file_path)}失敗: {e}")
-        return False
+            tab.is_dirty = doc.isModified() # 存檔期間又有變更
+            tab.is_crypt = encrypt
+            if not encrypt: tab.salt = None
+            if not appended:
+                for change in changes:
+                    if chunk_map is None or not chunk_map.change(*change): chunk_map = None
+                self._set_chunk_map(tab, chunk_map)
+            if tab in self.tab_list: tab.update_title()
+            self._watch_file(tab, file_path)
+            self._schedule_recovery() # 已儲存的分頁不再需要快照
+            self._save_pending(tab)
+        def failed(e: Exception):
+            nonlocal retried
+            tab.save_changes, tab.pending_save = None, None
+            tab.chunk_map, tab.journal_ops, tab.journal_state = None, None, None # 下次完整寫入
+            doc.setModified(True)
+            if isinstance(e, UnicodeEncodeError) and not encrypt:
+                reply = QMessageBox.question(self, "編碼錯誤", f"內容無法以 {tab.encoding} 編碼({e.reason}) 改用 UTF-8 儲存?", 
+                                             QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+                if reply != QMessageBox.StandardButton.Yes: return
+                tab.encoding = "utf-8"
+                retried = self._save_file(file_path, hint, encrypt, wait, tab)
+                return
+            QMessageBox.critical(self, "錯誤", f"儲存{file_name}失敗: {e}")
+        def cancelled(): 
+            tab.save_changes, tab.pending_save = None, None
+            tab.journal_ops, tab.journal_state = None, None
+            doc.setModified(True)
+            self.statusBar().showMessage(f"已取消{hint}: {file_name}", 4000) # pyright: ignore[reportOptionalMemberAccess]
+        if tab.viewer is not None:
+            self.statusBar().showMessage("唯讀檢視的分頁不能儲存", 4000) # pyright: ignore[reportOptionalMemberAccess]
+            return False
+        # 存檔中: 合併成完成後的一次存檔(wait時等它完成再存)
+        if tab.task is not None and tab.save_changes is not None:
+            if not wait:
+                tab.pending_save = (file_path, hint, encrypt)
+                self.statusBar().showMessage(f"{tab.task.label} 進行中 完成後會再儲存一次", 4000) # pyright: ignore[reportOptionalMemberAccess]
+                return True
+            tab.pending_save = None
+            tab.task.wait()
+        if tab.task is not None:
+            self.statusBar().showMessage(f"{tab.task.label} 進行中 請稍候", 4000) # pyright: ignore[reportOptionalMemberAccess]
+            return False
+        if not self._confirm_overwrite(tab, file_path): return False
+        # 快照: 之後的編輯讓文件再次變成已修改 並記錄下來套用到新的區塊對應(日誌模式也記錄成下次的操作)
+        if encrypt and tab.salt is None: tab.salt = self.kek_salt
+        journal, journal_file, state = tab.journal, journal_path(file_path), tab.journal_state
+        if (journal and tab.journal_ops is not None and state is not None and state[:2] == (file_path, encrypt)
+            and os.path.exists(file_path) and _file_stamp(file_path) == state[2]
+            and os.path.exists(journal_file) and os.path.getsize(journal_file) >= state[3]
+            and state[3] <= max(journal_compact_min_bytes, state[2][0] * journal_compact_ratio)):
+            # 日誌模式: 只附加這次的操作
+            ops, length, end, stamp = tab.journal_ops, doc.characterCount() - 1, state[3], state[2]
+            password, salt = (self.password, tab.salt) if encrypt else (None, None)
+            def append(task: CryptoTask) -> int:
+                task.check()
+                return append_record(journal_file, pack_record(ops, length, password, salt), end)
+            task = CryptoTask(append, f"寫入日誌 {file_name}")
+            on_saved: Callable[[Any], None] = lambda end: saved(tab.chunk_map, (file_path, encrypt, stamp, end), appended=True)
+        else:
+            if encrypt:
+                password, salt, chunk_map, compression = self.password, tab.salt, tab.chunk_map, tab.compression
+                size = doc.characterCount() - 1
+                # 同一個v3檔 沒有被外部修改且壓縮方式不變 -> 只重新加密變更的區塊
+                if (chunk_map is not None and chunk_map.file_path == file_path and os.path.exists(file_path) and _file_stamp(file_path) == chunk_map.stamp
+                    and chunk_map.compression == compression_for(size, compression)):
+                    layout = tab.chunk_layout()
+                    func = lambda task: _commit_crypt_chunks(file_path, layout, password, chunk_map.sequence, task)
+                else:
+                    plain_text = tab.text_edit.toPlainText()
+                    func = lambda task: _write_crypt_file(file_path, plain_text, password, salt, task, compression)
+            else:
+                plain_text, encoding = tab.text_edit.toPlainText(), tab.encoding
+                func = lambda task: _write_plain_file(file_path, plain_text, encoding, task)
+            def write(task: CryptoTask) -> tuple[ChunkMap|None, tuple[str, bool, tuple[int, int], int]|None]:
+                """ 完整寫入 日誌模式時換成對應新檔案的空日誌 否則刪除舊日誌(檔案已包含全部內容) """
+                chunk_map = func(task)
+                if not journal:
+                    if os.path.exists(journal_file): os.remove(journal_file)
+                    return chunk_map, None
+                stamp = _file_stamp(file_path)
+                return chunk_map, (file_path, encrypt, stamp, create_journal(journal_file, stamp, encrypt))
+            task = CryptoTask(write, f"加密 {file_name}" if encrypt else f"儲存 {file_name}")
+            on_saved = lambda result: saved(*result)
+        tab.journal_ops, tab.journal_tail = ([] if journal else None), -1
+        tab.save_changes = []
+        doc.setModified(False)
+        self._start_task(tab, task, on_saved, failed, cancelled, read_only=False)
+        if not wait: return True
+        task.wait()
+        return task.ok or bool(retried)
+
+    def _save_pending(self, tab: Tab):
+        """ 執行存檔期間再次要求的存檔(內容與目的地都沒變就不必) """
+        if tab.pending_save is None or tab not in self.tab_list: return
+        file_path, hint, encrypt = tab.pending_save
+        tab.pending_save = None
+        if not tab.is_dirty and file_path == tab.file_path and encrypt == tab.is_crypt: return
+        self._save_file(file_path, hint, encrypt, tab=tab)
 
     def action_save(self):
         """ 儲存普通檔案 """
@@ -1305,8 +2761,24 @@ class MainWindow(QMainWindow):
         # 加密儲存
         self._save_file(file_path, hint=hint, encrypt=True)
 
-    def _auto_save(self) -> bool:
-        """ 自動判斷並儲存-有回傳值 """
+    def _update_compression_menu(self):
+        """ 勾選目前分頁的壓縮方式 """
+        for action in self.compression_group.actions(): action.setChecked(action.data() == self.tab.compression)
+
+    def action_set_compression(self, action: QAction):
+        """ 設定目前分頁存成加密檔時的壓縮方式(下次加密存檔時套用) """
+        self.tab.compression = action.data()
+        self.statusBar().showMessage(f"壓縮方式: {action.text()} (下次加密存檔時套用)", 4000) # pyright: ignore[reportOptionalMemberAccess]
+
+    def action_set_journal(self, checked: bool):
+        """ 設定目前分頁的日誌模式(下次存檔時完整寫入並建立/刪除日誌) """
+        self.tab.journal = checked
+        self.tab.journal_ops, self.tab.journal_state = None, None
+        if checked: self.statusBar().showMessage("日誌模式: 之後的存檔只附加變更(下次存檔時先完整寫入)", 4000) # pyright: ignore[reportOptionalMemberAccess]
+        else: self.statusBar().showMessage("已關閉日誌模式(下次存檔時完整寫入並刪除日誌)", 4000) # pyright: ignore[reportOptionalMemberAccess]
+
+    def _auto_save(self, wait: bool = False) -> bool:
+        """ 自動判斷並儲存-有回傳值(wait: 等待背景存檔完成) """
         if self.tab.is_crypt: 
             if not self._ensure_password(): return False
             # 同action_save_as_crypted
@@ -1319,28 +2791,138 @@ class MainWindow(QMainWindow):
             else:
                 hint="儲存加密檔案"
                 file_path = self.file_path
-            if self._save_file(file_path, hint=hint, encrypt=True):
+            if self._save_file(file_path, hint=hint, encrypt=True, wait=wait):
                 self.file_path = file_path
                 return True
             return False
         # 同action_save
         if (self.file_path is not None):
-            return self._save_file(self.file_path, hint="儲存普通檔案", encrypt=False)
+            return self._save_file(self.file_path, hint="儲存普通檔案", encrypt=False, wait=wait)
         # 同action_save_as
         options = QFileDialog.Options()
         file_path, _ = QFileDialog.getSaveFileName(self, "另存普通檔案", "", "All Files (*)", options=options)
         if not file_path: return False # 使用者按取消
         self.file_path = file_path
-        return self._save_file(self.file_path, hint="另存普通檔案", encrypt=False)
+        return self._save_file(self.file_path, hint="另存普通檔案", encrypt=False, wait=wait)
     
     def action_auto_save(self):
         """ 自動判斷並儲存-沒回傳值 """
         self._auto_save()
 
+    def _schedule_recovery(self):
+        """ 文件變更後: 停止輸入auto_save_delay_ms後寫入復原快照(持續輸入時最久auto_save_max_delay_ms) """
+        now = time.monotonic()
+        if self.recovery_due is None: self.recovery_due = now + auto_save_max_delay_ms / 1000
+        self.recovery_timer.start(int(min(auto_save_delay_ms, max(0, (self.recovery_due - now) * 1000))))
+
+    def _save_recovery(self):
+        """ 在背景寫入未儲存分頁的復原快照(加密分頁以目前的主密碼加密) 只有內容變更過的分頁需要取快照 """
+        if self.recovery_task is not None: return self._schedule_recovery() # 上一次還沒寫完
+        self.recovery_due = None
+        snapshots: dict[str, tuple[dict, str|None, bytes|None]] = {}
+        for tab in self.tab_list:
+            doc = tab.text_edit.document()
+            if doc is None: raise RuntimeError("text_edit.document() is None")
+            if not tab.is_dirty or tab.viewer is not None or (tab.file_path is None and doc.isEmpty()): continue
+            if tab.task is not None and tab.save_changes is None: continue # 載入中 內容還不完整
+            meta = {"file_path": tab.file_path, "is_crypt": tab.is_crypt, "encoding": tab.encoding, "compression": tab.compression, "journal": tab.journal}
+            if tab.is_crypt and not self.password: text = None # 沒有密碼時保留舊的快照
+            elif tab.recovery_state == (doc.revision(), meta) and tab.recovery_id in self.recovery_hashes: text = None
+            else:
+                text = tab.text_edit.toPlainText()
+                tab.recovery_state = (doc.revision(), meta)
+            snapshots[tab.recovery_id] = (meta, text, tab.salt or self.kek_salt)
+        if self.recovery_lock is None:
+            if not snapshots: return
+            try: 
+                os.makedirs(self.recovery_dir, exist_ok=True)
+                self.recovery_lock = QLockFile(os.path.join(self.recovery_dir, "lock"))
+                self.recovery_lock.tryLock(0)
+            except OSError as e:
+                self.statusBar().showMessage(f"無法建立復原資料夾: {e}", 4000) # pyright: ignore[reportOptionalMemberAccess]
+                return
+        hashes, password = dict(self.recovery_hashes), self.password
+        task = CryptoTask(lambda task: _write_recovery(self.recovery_dir, snapshots, hashes, password, task), "復原快照")
+        def ended(): self.recovery_task = None
+        def finished(hashes: dict[str, bytes]): self.recovery_hashes = hashes
+        def failed(e: Exception): self.statusBar().showMessage(f"寫入復原快照失敗: {e}", 4000) # pyright: ignore[reportOptionalMemberAccess]
+        task.signals.ended.connect(ended)
+        task.signals.finished.connect(finished)
+        task.signals.failed.connect(failed)
+        self.recovery_task = task
+        task.start()
+
+    def _stop_recovery(self):
+        """ 停止寫入復原快照(等待寫到一半的) """
+        self.recovery_timer.stop()
+        self.recovery_due = None
+        if self.recovery_task is not None: self.recovery_task.wait()
+
+    def _discard_recovery(self):
+        """ 正常關閉: 刪除本次的復原快照 """
+        self._stop_recovery()
+        if self.recovery_lock is None: return
+        self.recovery_lock.unlock()
+        self.recovery_lock = None
+        shutil.rmtree(self.recovery_dir, ignore_errors=True)
+
+    def _offer_recovery(self):
+        """ 啟動時: 找出異常結束留下的復原快照 詢問是否還原(否: 刪除 取消: 下次再問) """
+        if not os.path.isdir(recovery_dir): return
+        sessions: list[tuple[str, QLockFile, list[str]]] = []
+        for name in sorted(os.listdir(recovery_dir)):
+            path = os.path.join(recovery_dir, name)
+            if not os.path.isdir(path) or path == self.recovery_dir: continue
+            lock = QLockFile(os.path.join(path, "lock"))
+            lock.setStaleLockTime(0) # 只有持有的行程已結束才算
+            if not lock.tryLock(0): continue # 其他執行中的視窗
+            entries = [os.path.join(path, entry[:-len(".json")]) for entry in sorted(os.listdir(path)) if entry.endswith(".json")]
+            sessions.append((path, lock, entries))
+        count = sum(len(entries) for _, _, entries in sessions)
+        reply = QMessageBox.StandardButton.No
+        if count: 
+            reply = QMessageBox.question(self, "還原", f"上次沒有正常關閉 找到 {count} 個分頁未儲存的內容 要還原嗎?\n(否: 刪除 取消: 下次再問)",
+                                         QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No | QMessageBox.StandardButton.Cancel,
+                                         QMessageBox.StandardButton.Yes)
+        for path, lock, entries in sessions:
+            if reply == QMessageBox.StandardButton.Yes: 
+                entries = [entry for entry in entries if not self._restore_recovery(entry)] # 還原失敗的留到下次
+            elif reply == QMessageBox.StandardButton.No: entries = []
+            lock.unlock()
+            if not entries: shutil.rmtree(path, ignore_errors=True)
+
+    def _restore_recovery(self, entry: str) -> bool:
+        """ 把一個復原快照還原到新分頁(未儲存) 成功後刪除快照 """
+        try:
+            with open(entry + ".json", "r", encoding="utf-8") as file: meta = json.load(file)
+            if meta["is_crypt"]:
+                if not self._ensure_password(): return False
+                text, _ = _read_crypt_file(entry + ".yoc", self.password)
+            else:
+                with open(entry + ".txt", "r", encoding="utf-8", errors="surrogatepass", newline="") as file: text = file.read()
+        except Exception as e:
+            QMessageBox.critical(self, "錯誤", f"還原 {os.path.basename(entry)} 失敗: {e}")
+            return False
+        self.action_new()
+        tab = self.tab
+        tab.text_edit.setPlainText(text)
+        tab.file_path, tab.is_crypt = meta["file_path"], meta["is_crypt"]
+        tab.encoding, tab.compression, tab.journal = meta["encoding"], meta["compression"], meta.get("journal", False)
+        if tab.file_path: self._auto_highlight(tab.file_path, tab)
+        tab.is_dirty = True
+        tab.update_title()
+        for extension in _RECOVERY_EXTENSIONS:
+            if os.path.exists(entry + extension): os.remove(entry + extension)
+        return True
+
     def change_master_password(self):
         """ 更改主密碼 """
         if not self._ensure_password(): return
         if not self._dirty_warning_success(): return
+        # 等待背景加解密(存檔不會在重新加密途中以舊密碼寫入)
+        for tab in self.tab_list: 
+            if tab.task is not None: tab.task.wait()
+        self._stop_recovery() # 快照不會在更換途中以舊密碼寫入
 
         # 舊密碼輸入與驗證
         dialog = QInputDialog(self)
@@ -1360,15 +2942,26 @@ class MainWindow(QMainWindow):
         old_password_for_verification = bytearray(old_password_str, encoding)
         del old_password_str # 立即清除原始的 str 副本
         
-        # 驗證
+        # 驗證(kdf在背景執行 視窗不凍結)
         with open(os.path.join(filedirname, "password.txt"), "r", encoding="utf-8") as f:
             stored_hash = f.read().strip()
-        if not verify_password(old_password_for_verification, stored_hash):
-            del old_password_for_verification # 驗證失敗 清除 bytearray 引用
+        task = CryptoTask(lambda task: verify_password(old_password_for_verification, stored_hash), "驗證密碼")
+        busy = QProgressDialog("驗證中...", "", 0, 0, self)
+        busy.setWindowTitle("更改主密碼")
+        busy.setWindowModality(Qt.WindowModality.WindowModal)
+        busy.setCancelButton(None) # pyright: ignore[reportArgumentType]
+        busy.setMinimumDuration(0)
+        busy.show()
+        task.start()
+        task.wait()
+        busy.close()
+        del old_password_for_verification # 清除 bytearray 引用
+        if task.error is not None:
+            QMessageBox.critical(self, "錯誤", f"驗證密碼失敗: {task.error}")
+            return
+        if not task.result:
             QMessageBox.warning(self, "錯誤", "舊密碼錯誤！")
             return
-        # 驗證成功 清除 bytearray 引用
-        del old_password_for_verification 
         
         # 新密碼輸入與確認
         new_password_str = ""
@@ -1409,44 +3002,107 @@ class MainWindow(QMainWindow):
         new_password_bytearray = bytearray(new_password_str, encoding)
         del confirm_password_str # 清除臨時 str 變數的引用
         
-        # 更新 Files 內所有 txt 檔案
-        for fname in os.listdir(os.path.join(filedirname, "Files")):
-            if (not fname.endswith(".txt")) or (fname == "password.txt"): 
-                continue
-            fpath = os.path.join(filedirname, "Files", fname)
-            try:
-                # 解密&重新加密
-                with open(fpath, "r", encoding="utf-8") as f:
-                    encrypted_data = f.read()
-                plain_text = yoAES.decrypt(encrypted_data, self.password)
-                new_encrypted = yoAES.encrypt(plain_text, new_password_bytearray)
-                with open(fpath, "w", encoding="utf-8") as f:
-                    f.write(new_encrypted)
-            except Exception as e:
-                # 問使用者是否繼續
-                reply = QMessageBox.question(
-                    self,
-                    "檔案加密失敗",
-                    f"檔案 {fname} 重新加密失敗: {e}\n是否繼續更新剩下的檔案? \n注意: 更新後 {fname} 將無法讀取",
-                    QMessageBox.Yes | QMessageBox.No,
-                    QMessageBox.No
-                )
-                if reply == QMessageBox.No: # 停止整個更改流程
-                    QMessageBox.information(self, "取消", "主密碼更改已取消")
-                    # 錯誤發生時 也確保所有密碼被清除
-                    del new_password_bytearray
-                    del new_password_str
-                    return 
-                continue
+        # 平行重新加密 Files 內所有 txt 檔案 (共用同一個salt 新KEK只需衍生一次)
+        new_salt = yoAES.new_salt()
+        files_dir = os.path.join(filedirname, "Files")
+        file_paths = [os.path.join(files_dir, fname) for fname in sorted(os.listdir(files_dir)) 
+                      if fname.endswith(".txt") and fname != "password.txt"]
+        # 編輯日誌一起重新加密 提交後改對應新的檔案(原本就不適用的不動)
+        journals = {path: journal_path(path) for path in file_paths if os.path.exists(journal_path(path))}
+        valid_journals = [path for path, journal in journals.items() if journal_stamp(journal) == _file_stamp(path)]
+        # 一起提交新的密碼雜湊與日誌stamp(中斷時下次啟動完成) 失敗的檔案由使用者選擇略過(維持舊密碼)或全部取消
+        job = RekeyJob(file_paths + list(journals.values()), self.password, new_password_bytearray, new_salt,
+                       extra={os.path.join(filedirname, "password.txt"): hash_password(new_password_str).encode("utf-8")},
+                       restamps=[(journals[path], path) for path in valid_journals], log_path=rekey_log)
+        if not self._run_rekey_job(job):
+            QMessageBox.information(self, "取消", "主密碼更改已取消")
+            del new_password_bytearray
+            del new_password_str
+            return
 
         # 更新密碼與清理
         self._clear_master_password() 
         self.password = new_password_bytearray
-        with open(os.path.join(filedirname, "password.txt"), "w", encoding="utf-8") as f:
-            f.write(hash_password(new_password_str))
+        self.kek_salt = new_salt
+        # 加密分頁的快照改用新密碼重寫
+        for tab in self.tab_list: tab.recovery_state = None
+        # 重新加密過的檔案: 更新開啟中分頁記錄的檔案狀態(自己的改寫不算外部修改) 日誌改對應新的stamp與結尾
+        rekeyed = {os.path.abspath(path) for path in job.file_paths}
+        for tab in self.tab_list:
+            if tab.disk_state is not None and tab.disk_state[0] in rekeyed: self._watch_file(tab, tab.disk_state[0])
+            state = tab.journal_state
+            if state is None or os.path.abspath(state[0]) not in rekeyed: continue
+            journal = journal_path(state[0])
+            if os.path.exists(journal) and journal_stamp(journal) == _file_stamp(state[0]):
+                tab.journal_state = (state[0], state[1], _file_stamp(state[0]), os.path.getsize(journal)) # 重新包裝時捨棄了寫到一半的record
+            else: tab.journal_ops, tab.journal_state = None, None # 下次完整寫入
+        self.recovery_hashes.clear()
+        self._schedule_recovery()
         del new_password_str
         
-        QMessageBox.information(self, "完成", "主密碼已更新 所有txt已重新加密")
+        skipped = [os.path.basename(path) for path in file_paths if path not in job.file_paths]
+        if skipped: QMessageBox.warning(self, "完成", "主密碼已更新 以下檔案維持舊密碼(將無法讀取):\n" + "\n".join(skipped))
+        else: QMessageBox.information(self, "完成", "主密碼已更新 所有txt已重新加密")
+
+    def _run_rekey_job(self, job: RekeyJob) -> bool:
+        """ 在行程池執行重新加密並顯示進度(不凍結視窗) 
+        失敗的檔案逐一詢問略過或取消全部 略過的檔案(與它的日誌)維持舊密碼 其餘提交 回傳是否提交 """
+        progress = QProgressDialog("重新加密中...", "取消", 0, job.total, self)
+        progress.setWindowTitle("更改主密碼")
+        progress.setWindowModality(Qt.WindowModality.WindowModal)
+        progress.setAutoReset(False)
+        progress.setMinimumDuration(0)
+        loop = QEventLoop()
+        timer = QTimer()
+        # 輪詢進度
+        def update():
+            progress.setValue(job.done_count)
+            if job.is_done() or progress.wasCanceled(): loop.quit()
+        timer.timeout.connect(update)
+        try:
+            job.start()
+            timer.start(50)
+            loop.exec_()
+        except Exception as e:
+            job.rollback()
+            progress.close()
+            QMessageBox.critical(self, "錯誤", f"重新加密失敗: {e}")
+            return False
+        finally: timer.stop()
+        # 取消 -> 全部回復
+        if progress.wasCanceled():
+            job.rollback()
+            progress.close()
+            return False
+        # 失敗的檔案 -> 問使用者略過或全部回復
+        for path, e in job.errors().items():
+            if path not in job.file_paths: continue # 已隨檔案略過的日誌
+            fname = os.path.basename(path)
+            reply = QMessageBox.question(
+                self,
+                "檔案加密失敗",
+                f"檔案 {fname} 重新加密失敗: {e}\n是否略過此檔案並繼續? \n注意: 更新後 {fname} 將無法讀取",
+                QMessageBox.Yes | QMessageBox.No,
+                QMessageBox.No
+            )
+            if reply == QMessageBox.No:
+                job.rollback()
+                progress.close()
+                return False
+            for skipped in (path, journal_path(path)):
+                if skipped in job.file_paths: job.skip(skipped)
+        # 提交(寫入提交紀錄前失敗就回復 之後失敗由下次啟動完成)
+        try: job.commit()
+        except Exception as e:
+            progress.close()
+            if job.committed:
+                QMessageBox.critical(self, "錯誤", f"提交未完成: {e}\n下次啟動時會完成提交")
+                return True
+            job.rollback()
+            QMessageBox.critical(self, "錯誤", f"重新加密失敗: {e}")
+            return False
+        progress.close()
+        return True
 
     def action_zoom_in(self):
         """ 字體放大 """
@@ -1454,7 +3110,7 @@ class MainWindow(QMainWindow):
 
     def action_zoom_out(self):
         """ 字體縮小 """
-        self.text_edit.zoomOut(1)
+        self.tab.zoom_out(1)
     
     def action_zoom_reset(self):
         """ 還原預設字體大小 """
@@ -1474,6 +3130,7 @@ class MainWindow(QMainWindow):
 
     def action_find(self):
         """ 尋找 """
+        if self.tab.viewer is not None: return self.tab.viewer.focus_search() # 唯讀檢視有自己的尋找欄
         self.FR_dock.hide()
         self.find_bar.show()
         self.replace_bar.hide()
@@ -1490,8 +3147,20 @@ class MainWindow(QMainWindow):
         self.FR_dock.adjustSize()
         self.FR_dock.show()
 
+    def action_find_in_files(self):
+        """ 在檔案中尋找 預設為選取的文字或上次的搜尋 """
+        panel = self.find_files_panel
+        selected = _cursor_text(self.text_edit.textCursor()) if self.tab.viewer is None else ""
+        if selected and "\n" not in selected: panel.find_input.setText(selected)
+        elif not panel.find_input.text(): panel.find_input.setText(self.last_find_text)
+        self.FF_dock.show()
+        self.FF_dock.raise_()
+        panel.find_input.setFocus()
+        panel.find_input.selectAll()
+
     def action_replace(self):
         """ 尋找+取代 """
+        if self.tab.viewer is not None: return self.tab.viewer.focus_search() # 唯讀 不能取代
         self.FR_dock.hide()
         self.replace_bar.show()
         self.find_bar.hide()
@@ -1572,12 +3241,17 @@ class MainWindow(QMainWindow):
             if not self._dirty_warning_success():
                 a0.ignore()
                 return
+        # 背景工作結束後才清除密碼
+        self.find_files_panel.action_cancel()
+        for tab in self.tab_list: self._finish_tab_task(tab)
+        self._discard_recovery()
         self._clear_master_password()
         a0.accept()
 
 # pyinstaller --onefile --windowed --icon=main_icon.ico main.py
 # pyinstaller --onedir --windowed --icon=main_icon.ico main.py
 if __name__ == "__main__":
+    multiprocessing.freeze_support() # 打包後的行程池需要
     with Code_Timer("init"):
         file_to_open = None
         app = QApplication(sys.argv)
@@ -0,0 +1,4 @@
+from yotools200.yoCrypt import yoCrypt_init
+
+# 測試以低成本的參數執行(正式使用的參數太慢)
+yoCrypt_init(1000, 16, 32, "utf-8", key_cache_size=4, kdf="pbkdf2_sha256$1000")
@@ -0,0 +1,271 @@
+from yotools200.yoCrypt import KeyCache, IndexedContainer, COMPRESSIONS, COMPRESS_MIN_SIZE, split_chunks, yoAES
+from yotools200.yoKDF import KDF
+from yotools200 import yoCrypt
+import pytest
+import io
+
+PASSWORD = b"password"
+TEXT = "".join(f"line {i} 中文 😀\n" for i in range(2000)).encode("utf-8")
+
+def _flip(data: bytes, position: int) -> bytes:
+    """ 翻轉一個位元組 """
+    return data[:position] + bytes([data[position] ^ 0xFF]) + data[position+1:]
+
+def _put(cache: KeyCache, salt: bytes, key: bytes):
+    cache.put(PASSWORD, salt, 32, "pbkdf2_sha1$1000", key)
+
+def _get(cache: KeyCache, salt: bytes) -> bytes|None:
+    return cache.get(PASSWORD, salt, 32, "pbkdf2_sha1$1000")
+
+# KeyCache
+def test_key_cache_evicts_least_recently_used():
+    cache = KeyCache(2)
+    _put(cache, b"a", b"A" * 32)
+    _put(cache, b"b", b"B" * 32)
+    assert _get(cache, b"a") == b"A" * 32 # a變成最近使用
+    _put(cache, b"c", b"C" * 32)
+    assert len(cache) == 2 and _get(cache, b"b") is None
+    assert _get(cache, b"a") == b"A" * 32 and _get(cache, b"c") == b"C" * 32
+
+def test_key_cache_zeroizes_evicted_and_cleared_keys():
+    cache = KeyCache(1)
+    _put(cache, b"a", b"A" * 32)
+    evicted = next(iter(cache._keys.values()))
+    _put(cache, b"b", b"B" * 32)
+    assert evicted == bytearray(32)
+    kept = next(iter(cache._keys.values()))
+    cache.clear()
+    assert kept == bytearray(32) and len(cache) == 0
+
+def test_key_cache_separates_parameters():
+    cache = KeyCache(4)
+    _put(cache, b"a", b"A" * 32)
+    assert cache.get(b"other", b"a", 32, "pbkdf2_sha1$1000") is None
+    assert cache.get(PASSWORD, b"a", 16, "pbkdf2_sha1$1000") is None
+    assert cache.get(PASSWORD, b"a", 32, "pbkdf2_sha1$1001") is None
+    assert cache.get(PASSWORD, b"a", 32, "pbkdf2_sha256$1000") is None
+
+def test_key_cache_disabled():
+    cache = KeyCache(0)
+    _put(cache, b"a", b"A" * 32)
+    assert len(cache) == 0 and _get(cache, b"a") is None
+
+# 串流格式
+def _encrypt_stream(data: bytes, chunk_size: int = 1000) -> bytes:
+    dst = io.BytesIO()
+    assert yoAES.encrypt_stream(io.BytesIO(data), dst, PASSWORD, chunk_size) == len(data)
+    return dst.getvalue()
+
+def _decrypt_stream(data: bytes, password: bytes = PASSWORD) -> bytes:
+    dst = io.BytesIO()
+    yoAES.decrypt_stream(io.BytesIO(data), dst, password)
+    return dst.getvalue()
+
+@pytest.mark.parametrize("data", [b"", b"x", b"y" * 1000, TEXT])
+def test_stream_roundtrip(data: bytes):
+    encrypted = _encrypt_stream(data)
+    assert yoAES.is_stream(encrypted)
+    assert _decrypt_stream(encrypted) == data
+    assert b"".join(yoAES.decrypt_chunks(io.BytesIO(encrypted), PASSWORD)) == data
+
+def test_stream_rejects_wrong_password():
+    with pytest.raises(ValueError): _decrypt_stream(_encrypt_stream(TEXT), b"other")
+
+@pytest.mark.parametrize("cut", [1, 16, 1000 + 16, 1000 + 17])
+def test_stream_rejects_truncation(cut: int):
+    """ 截掉任何一部分(包括剛好一整塊)都無法通過驗證 """
+    with pytest.raises(ValueError): _decrypt_stream(_encrypt_stream(TEXT)[:-cut])
+
+def test_stream_rejects_corruption_and_reordering():
+    encrypted = _encrypt_stream(TEXT)
+    for position in (4, len(encrypted) // 2, len(encrypted) - 1): # header(AAD) 本體 tag
+        with pytest.raises(ValueError): _decrypt_stream(_flip(encrypted, position))
+    block = 1000 + 16
+    header_size = len(encrypted) - len(TEXT) - -(-len(TEXT) // 1000) * 16 # 每塊多16位元組的tag
+    first, second = encrypted[header_size:header_size+block], encrypted[header_size+block:header_size+2*block]
+    swapped = encrypted[:header_size] + second + first + encrypted[header_size+2*block:]
+    with pytest.raises(ValueError): _decrypt_stream(swapped)
+
+# 二進位容器(整份解密) 與舊base64格式
+@pytest.mark.parametrize("data", [b"", b"x", TEXT])
+def test_bytes_roundtrip(data: bytes):
+    encrypted = yoAES.encrypt_bytes(data, PASSWORD, chunk_size=1000)
+    assert yoAES.decrypt_bytes(encrypted, PASSWORD) == data == _decrypt_stream(encrypted)
+
+def test_bytes_rejects_truncation_and_corruption():
+    encrypted = yoAES.encrypt_bytes(TEXT, PASSWORD, chunk_size=1000)
+    for broken in (encrypted[:-1], encrypted[:-1016], encrypted[:40], _flip(encrypted, len(encrypted) // 2)):
+        with pytest.raises(ValueError): yoAES.decrypt_bytes(broken, PASSWORD)
+
+def test_salt_of_both_formats():
+    salt = yoAES.new_salt()
+    assert yoAES.salt_of(yoAES.encrypt_bytes(TEXT, PASSWORD, salt=salt)) == salt
+    legacy = yoAES.encrypt("舊格式 text", PASSWORD, salt)
+    assert yoAES.salt_of(legacy) == salt and yoAES.decrypt(legacy, PASSWORD) == "舊格式 text"
+
+# 信封加密: 更換密碼只重寫key block
+def test_rewrap_only_rewrites_key_block():
+    encrypted = yoAES.encrypt_bytes(TEXT, PASSWORD, chunk_size=1000)
+    file = io.BytesIO(encrypted)
+    assert yoAES.rewrap(file, PASSWORD, b"new")
+    rewrapped = file.getvalue()
+    assert len(rewrapped) == len(encrypted) and rewrapped[-len(TEXT):] == encrypted[-len(TEXT):]
+    assert yoAES.decrypt_bytes(rewrapped, b"new") == TEXT
+    with pytest.raises(ValueError): yoAES.decrypt_bytes(rewrapped, PASSWORD)
+
+def test_rewrap_rejects_wrong_password_and_legacy():
+    file = io.BytesIO(yoAES.encrypt_bytes(TEXT, PASSWORD))
+    with pytest.raises(ValueError): yoAES.rewrap(file, b"other", b"new")
+    assert yoAES.decrypt_bytes(file.getvalue(), PASSWORD) == TEXT # 失敗時不動
+    assert not yoAES.rewrap(io.BytesIO(yoAES.encrypt("legacy", PASSWORD).encode()), PASSWORD, b"new")
+
+def test_shared_salt_gives_each_file_its_own_data_key():
+    """ 共用salt(MainWindow.kek_salt)時KEK相同 但每個檔案的資料金鑰不同 """
+    salt = yoAES.new_salt()
+    encrypted = [yoAES.encrypt_bytes(TEXT, PASSWORD, salt=salt), yoAES.encrypt_bytes(TEXT, PASSWORD, salt=salt),
+                 yoAES.encrypt_indexed(TEXT, PASSWORD, salt=salt)]
+    keys = [bytes(yoCrypt._Header.read(io.BytesIO(data)).data_key(PASSWORD)) for data in encrypted]
+    assert all(yoAES.salt_of(data) == salt for data in encrypted)
+    assert len(set(keys)) == len(keys)
+
+def test_rewrap_file(tmp_path):
+    path = tmp_path / "copy.txt"
+    path.write_bytes(yoAES.encrypt_bytes(TEXT, PASSWORD))
+    with open(path, "r+b") as file: assert yoAES.rewrap(file, PASSWORD, b"new")
+    assert yoAES.decrypt_bytes(path.read_bytes(), b"new") == TEXT
+
+# 批次API(行程池)
+def test_batch_results_carry_per_item_errors():
+    items = [b"a", "中文", TEXT, b""]
+    encrypted = [result.value for result in yoAES.encrypt_many(items, PASSWORD, max_workers=2)]
+    broken = _flip(encrypted[1], len(encrypted[1]) - 1)
+    results = list(yoAES.decrypt_many([encrypted[0], broken, encrypted[2], encrypted[3]], PASSWORD, max_workers=2))
+    assert [result.index for result in results] == [0, 1, 2, 3]
+    assert [result.ok for result in results] == [True, False, True, True]
+    assert isinstance(results[1].error, ValueError)
+    assert [bytes(results[i].value) for i in (0, 2, 3)] == [b"a", TEXT, b""]
+
+def test_batch_paths(tmp_path):
+    sources = []
+    for i in range(3):
+        path = tmp_path / f"{i}.txt"
+        path.write_bytes(f"file {i}".encode("utf-8"))
+        sources.append((str(path), str(path) + ".enc"))
+    sources.append((str(tmp_path / "missing.txt"), str(tmp_path / "missing.enc")))
+    results = list(yoAES.encrypt_many(sources, PASSWORD, paths=True, ordered=False, max_workers=2))
+    assert sorted(result.index for result in results) == [0, 1, 2, 3]
+    assert [result.ok for result in sorted(results, key=lambda result: result.index)] == [True, True, True, False]
+    decrypted = {result.index: result.value for result in yoAES.decrypt_many([dst for _, dst in sources[:3]], PASSWORD, paths=True)}
+    assert {index: bytes(value) for index, value in decrypted.items()} == {i: f"file {i}".encode("utf-8") for i in range(3)}
+
+def test_init_worker_uses_parent_kdf(monkeypatch):
+    """ 子行程已用別的kdf init時(spawn的子行程import主程式) 仍改用父行程的kdf """
+    params = yoCrypt.yoCrypt_params()
+    monkeypatch.setattr(yoCrypt, "_kdf", KDF.from_string("pbkdf2_sha256$2000"))
+    monkeypatch.setattr(yoCrypt, "_worker_passwords", ())
+    yoCrypt._init_worker(params, PASSWORD)
+    assert yoCrypt.yoCrypt_params() == params and yoCrypt._worker_passwords == (PASSWORD,)
+
+# 可隨機存取的容器(v3)
+def _indexed(data: bytes = TEXT, chunk_size: int = 4096, compression: str|None = None) -> io.BytesIO:
+    return io.BytesIO(yoAES.encrypt_indexed(data, PASSWORD, chunk_size, compression=compression))
+
+def test_indexed_roundtrip_and_random_access():
+    file = _indexed()
+    with IndexedContainer.open(file, PASSWORD) as container:
+        assert len(container) > 1 and container.size == len(TEXT)
+        assert b"".join(container) == TEXT
+        for start, end in ((0, 10), (4090, 4200), (len(TEXT) - 5, len(TEXT) + 100), (50, 50)):
+            assert container.read(start, end) == TEXT[start:end]
+    assert yoAES.decrypt_bytes(file.getvalue(), PASSWORD) == TEXT
+    assert bytes(yoAES.decrypt_bytes(yoAES.encrypt_indexed(b"", PASSWORD), PASSWORD)) == b""
+
+def test_indexed_rejects_corruption():
+    file = _indexed()
+    data = file.getvalue()
+    with IndexedContainer.open(file, PASSWORD) as container: first = container.entries[0][0]
+    with IndexedContainer.open(io.BytesIO(_flip(data, first)), PASSWORD) as container:
+        with pytest.raises(ValueError): container.chunk(0)
+        assert container.chunk(1) # 其他區塊不受影響
+    with pytest.raises(ValueError): IndexedContainer.open(io.BytesIO(data[:-len(data) // 2]), PASSWORD)
+    with pytest.raises(ValueError): IndexedContainer.open(io.BytesIO(data), b"other")
+    with pytest.raises(ValueError): IndexedContainer.open(io.BytesIO(yoAES.encrypt_bytes(TEXT, PASSWORD)), PASSWORD)
+
+def test_indexed_rewrap():
+    file = _indexed()
+    assert yoAES.rewrap(file, PASSWORD, b"new")
+    with IndexedContainer.open(file, b"new") as container: assert b"".join(container) == TEXT
+
+def test_indexed_commit_reuses_chunks():
+    file = _indexed()
+    with IndexedContainer.open(file, PASSWORD) as container:
+        chunks = list(container)
+        size = len(file.getvalue())
+        container.commit([0, b"inserted\n", *range(2, len(chunks))])
+        assert len(file.getvalue()) < size + 1000 # 只附加新的區塊與manifest
+    expected = chunks[0] + b"inserted\n" + b"".join(chunks[2:])
+    with IndexedContainer.open(file, PASSWORD) as container:
+        assert container.sequence == 2 and b"".join(container) == expected
+
+def test_indexed_torn_commit_keeps_previous_version():
+    """ 寫入中斷: slot還沒寫/manifest被截斷/slot損毀 都回到上一個有效版本 """
+    file = _indexed()
+    with IndexedContainer.open(file, PASSWORD) as container:
+        container.commit([b"first\n"])
+        committed = file.getvalue()
+        slots = container._slots_offset
+        container.commit([b"second\n"])
+        latest = file.getvalue()
+    # 新的區塊與manifest已附加 slot還沒寫
+    with IndexedContainer.open(io.BytesIO(latest[:slots] + committed[slots:] + latest[len(committed):]), PASSWORD) as container:
+        assert b"".join(container) == b"first\n"
+    # manifest寫到一半
+    with IndexedContainer.open(io.BytesIO(latest[:-5]), PASSWORD) as container:
+        assert b"".join(container) == b"first\n"
+    # 新的slot損毀(序號3寫在第二個slot 每個slot 20位元組: 序號 manifest位置 長度)
+    with IndexedContainer.open(io.BytesIO(_flip(latest, slots + 20 + 15)), PASSWORD) as container:
+        assert b"".join(container) == b"first\n"
+    with IndexedContainer.open(io.BytesIO(latest), PASSWORD) as container:
+        assert b"".join(container) == b"second\n"
+
+def test_indexed_compact():
+    file = _indexed()
+    with IndexedContainer.open(file, PASSWORD) as container:
+        for _ in range(3): container.commit([0, b"edit\n", *range(2, len(container))])
+        expected = b"".join(container)
+        assert container.wasted > 0
+        compacted = io.BytesIO()
+        sequence = container.compact(compacted)
+    with IndexedContainer.open(compacted, PASSWORD) as container:
+        assert container.sequence == sequence and container.wasted == 0
+        assert b"".join(container) == expected
+
+# 區塊壓縮
+@pytest.mark.parametrize("compression", COMPRESSIONS)
+def test_codec_roundtrip(compression: str):
+    file = _indexed(compression=compression)
+    assert yoAES.compression_of(file.getvalue()) == compression
+    with IndexedContainer.open(file, PASSWORD) as container:
+        assert container.compression == compression
+        assert (container.stored_size < container.size) == bool(compression)
+        assert container.read(5000, 9000) == TEXT[5000:9000]
+        container.commit([b"x" * COMPRESS_MIN_SIZE, *range(1, len(container))])
+        expected = b"x" * COMPRESS_MIN_SIZE + b"".join(container.chunk(i) for i in range(1, len(container)))
+    assert yoAES.decrypt_bytes(file.getvalue(), PASSWORD) == expected
+
+def test_codec_skipped_for_small_text():
+    assert yoAES.compression_of(yoAES.encrypt_indexed(b"short", PASSWORD, compression="lzma")) == ""
+
+@pytest.mark.parametrize("compression", COMPRESSIONS[1:])
+def test_codec_rejects_wrong_length(compression: str):
+    """ manifest記錄的明文長度與解壓結果不符時視為損毀 """
+    file = _indexed(compression=compression)
+    with IndexedContainer.open(file, PASSWORD) as container:
+        offset, size, nonce, plain_size = container.entries[0]
+        container.entries[0] = (offset, size, nonce, plain_size - 1)
+        with pytest.raises(ValueError): container.chunk(0)
+
+def test_split_chunks_keeps_characters():
+    chunks = [bytes(chunk) for chunk in split_chunks(TEXT, 100)]
+    assert b"".join(chunks) == TEXT
+    for chunk in chunks: chunk.decode("utf-8")
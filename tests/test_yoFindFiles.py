@@ -0,0 +1,81 @@
+from yotools200.yoFindFiles import FindFilesJob, list_files, read_text
+from yotools200.yoJournal import journal_path, create_journal, append_record, pack_record
+from yotools200.yoSearch import search_pattern
+from yotools200.yoCrypt import yoAES
+import time
+import os
+
+PASSWORD = b"password"
+
+def _stamp(path) -> tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+def _journal(path, ops, length: int, password: bytes|None = None, stamp: tuple[int, int]|None = None):
+    journal = journal_path(str(path))
+    end = create_journal(journal, stamp or _stamp(path), password is not None)
+    append_record(journal, pack_record(ops, length, password), end)
+
+def _wait(job: FindFilesJob) -> dict:
+    results = {}
+    while not job.is_done():
+        results.update((path, (encrypted, hits, error)) for path, encrypted, hits, error in job.results())
+        time.sleep(0.01)
+    return results
+
+# read_text
+def test_read_text_plain_and_encrypted(tmp_path):
+    plain = tmp_path / "plain.txt"
+    plain.write_bytes("中文\r\nline".encode("gbk"))
+    assert read_text(str(plain), None, ("utf-8", "gbk")) == ("中文\nline", False)
+    encrypted = tmp_path / "secret.txt"
+    encrypted.write_bytes(yoAES.encrypt_bytes("秘密", PASSWORD))
+    assert read_text(str(encrypted), PASSWORD) == ("秘密", True)
+    legacy = tmp_path / "legacy.txt"
+    legacy.write_text(yoAES.encrypt("舊格式", PASSWORD))
+    assert read_text(str(legacy), PASSWORD) == ("舊格式", True)
+
+def test_read_text_replays_journal(tmp_path):
+    plain = tmp_path / "plain.txt"
+    plain.write_bytes(b"hello world")
+    _journal(plain, [(0, 5, "HELLO"), (11, 0, " 😀")], 14)
+    assert read_text(str(plain), None) == ("HELLO world 😀", False)
+    encrypted = tmp_path / "secret.txt"
+    encrypted.write_bytes(yoAES.encrypt_bytes("hello", PASSWORD))
+    _journal(encrypted, [(5, 0, "!")], 6, PASSWORD)
+    assert read_text(str(encrypted), PASSWORD) == ("hello!", True)
+
+def test_read_text_ignores_stale_journal(tmp_path):
+    """ 日誌的stamp與檔案不符時不重播(同開啟到分頁) """
+    plain = tmp_path / "plain.txt"
+    plain.write_bytes(b"hello")
+    size, mtime = _stamp(plain)
+    _journal(plain, [(0, 5, "stale")], 5, stamp=(size, mtime + 1))
+    assert read_text(str(plain), None) == ("hello", False)
+
+# FindFilesJob
+def test_list_files_skips_journals_and_temps(tmp_path):
+    for name in ("b.txt", "a.txt", "a.txt.yoj", "c.txt.123.tmp", "password.txt", "sub/d.txt"):
+        os.makedirs((tmp_path / name).parent, exist_ok=True)
+        (tmp_path / name).write_bytes(b"")
+    assert [os.path.relpath(path, tmp_path) for path in list_files(str(tmp_path))] == ["a.txt", "b.txt", os.path.join("sub", "d.txt")]
+
+def test_find_files_job(tmp_path):
+    (tmp_path / "plain.txt").write_bytes("x\n😀 cat cat\ncats".encode("utf-8"))
+    (tmp_path / "secret.txt").write_bytes(yoAES.encrypt_bytes("a cat", PASSWORD))
+    (tmp_path / "other.txt").write_bytes(yoAES.encrypt_bytes("cat", b"other"))
+    job = FindFilesJob(list_files(str(tmp_path)), search_pattern("cat", whole_word=True), PASSWORD, max_workers=2)
+    job.start()
+    results = _wait(job)
+    assert results[str(tmp_path / "plain.txt")] == (False, [(1, 3, 6, "😀 cat cat"), (1, 7, 10, "😀 cat cat")], None)
+    assert results[str(tmp_path / "secret.txt")] == (True, [(0, 2, 5, "a cat")], None)
+    encrypted, hits, error = results[str(tmp_path / "other.txt")]
+    assert hits == [] and isinstance(error, ValueError) # 密碼錯誤: 列出錯誤 不中斷其他檔案
+
+def test_find_files_job_cancel(tmp_path):
+    for i in range(40): (tmp_path / f"{i}.txt").write_bytes(b"cat\n" * 1000)
+    job = FindFilesJob(list_files(str(tmp_path)), search_pattern("cat"), max_workers=1)
+    job.start()
+    job.cancel()
+    assert job.is_done() and job.done_count == job.total and job.results() == []
+    assert job._executor is None
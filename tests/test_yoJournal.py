@@ -0,0 +1,54 @@
+from yotools200.yoJournal import (create_journal, append_record, pack_record, read_journal, journal_stamp,
+                                  restamp_journal, rewrap_journal)
+import pytest
+import io
+import os
+
+PASSWORD = b"password"
+
+def _flip(data: bytes, position: int) -> bytes:
+    """ 翻轉一個位元組 """
+    return data[:position] + bytes([data[position] ^ 0xFF]) + data[position+1:]
+
+@pytest.mark.parametrize("password", [None, PASSWORD])
+def test_journal_roundtrip(tmp_path, password: bytes|None):
+    path = str(tmp_path / "a.txt.yoj")
+    end = create_journal(path, (10, 20), password is not None)
+    records = [([(0, 0, "ab😀")], 14), ([(2, 3, ""), (0, 1, "x")], 10)]
+    for ops, length in records: end = append_record(path, pack_record(ops, length, password), end)
+    assert read_journal(path, password) == ((10, 20), password is not None, records, end)
+    assert end == os.path.getsize(path)
+    restamp_journal(path, (30, 40))
+    assert journal_stamp(path) == (30, 40)
+
+def test_journal_torn_tail(tmp_path):
+    """ 寫到一半/crc不符的record不算 下次附加時截掉 """
+    path = str(tmp_path / "a.txt.yoj")
+    end = append_record(path, pack_record([(0, 0, "abc")], 3), create_journal(path, (0, 0), False))
+    record = pack_record([(3, 0, "def")], 6)
+    for torn in (record[:3], record[:-1], _flip(record, len(record) - 1)):
+        with open(path, "r+b") as file:
+            file.truncate(end)
+            file.seek(end)
+            file.write(torn)
+        _, _, records, valid_end = read_journal(path)
+        assert records == [([(0, 0, "abc")], 3)] and valid_end == end
+    end = append_record(path, record, valid_end)
+    assert read_journal(path)[2] == [([(0, 0, "abc")], 3), ([(3, 0, "def")], 6)] and end == os.path.getsize(path)
+
+def test_journal_encrypted(tmp_path):
+    path = str(tmp_path / "a.txt.yoj")
+    append_record(path, pack_record([(0, 0, "secret")], 6, PASSWORD), create_journal(path, (0, 0), True))
+    assert b"secret" not in open(path, "rb").read()
+    with pytest.raises(ValueError): read_journal(path)
+    with pytest.raises(ValueError): read_journal(path, b"other")
+    rewrapped = io.BytesIO()
+    with open(path, "rb") as file: rewrap_journal(file, rewrapped, PASSWORD, b"new")
+    (tmp_path / "b.txt.yoj").write_bytes(rewrapped.getvalue())
+    assert read_journal(str(tmp_path / "b.txt.yoj"), b"new")[2] == [([(0, 0, "secret")], 6)]
+
+def test_journal_rejects_other_files(tmp_path):
+    path = tmp_path / "a.txt.yoj"
+    path.write_bytes(b"not a journal")
+    with pytest.raises(ValueError): read_journal(str(path))
+    with pytest.raises(ValueError): journal_stamp(str(path))
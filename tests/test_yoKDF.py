@@ -0,0 +1,78 @@
+from yotools200.yoKDF import KDF, PBKDF2_KDF, Scrypt_KDF, KDF_PBKDF2_SHA256, KDF_SCRYPT, calibrate_kdf
+from yotools200.yoCrypt import hash_password, verify_password, needs_rehash, yoCrypt_set_kdf, yoAES
+from yotools200 import yoCrypt
+import pytest
+import base64
+
+def test_kdf_string_and_header_roundtrip():
+    for kdf in (PBKDF2_KDF(1000), PBKDF2_KDF(5000, "sha1"), Scrypt_KDF(1 << 10, 4, 2)):
+        assert KDF.from_string(kdf.to_string()) == kdf
+    for kdf in (PBKDF2_KDF(1000), Scrypt_KDF(1 << 10, 4, 2)):
+        assert KDF.from_header(kdf.kdf_id, kdf.cost) == kdf
+
+@pytest.mark.parametrize("kdf_id, cost", [
+    (0, 1000), (99, 1000), # 不支援的kdf
+    (KDF_PBKDF2_SHA256, 0), # 0次
+    (KDF_SCRYPT, (40 << 24) | (8 << 8) | 1), # n過大
+    (KDF_SCRYPT, (14 << 24) | (0 << 8) | 1), # r=0
+    (KDF_SCRYPT, (14 << 24) | (8 << 8) | 0), # p=0
+    (KDF_SCRYPT, (10 << 24) | (0xFFFF << 8) | 1), # r超過上限
+    (KDF_SCRYPT, (10 << 24) | (8 << 8) | 0xFF), # p超過上限
+    (KDF_SCRYPT, (21 << 24) | (8 << 8) | 1), # 128*r*n*p超過1GiB
+])
+def test_kdf_from_header_rejects_invalid(kdf_id, cost):
+    with pytest.raises(ValueError): KDF.from_header(kdf_id, cost)
+
+def test_scrypt_limits():
+    assert Scrypt_KDF(1 << 20, 8, 1).n == 1 << 20 # 剛好1GiB
+    assert Scrypt_KDF(1 << 10, Scrypt_KDF.MAX_R, Scrypt_KDF.MAX_P).p == Scrypt_KDF.MAX_P
+    for n, r, p in ((1 << 10, 33, 1), (1 << 10, 8, 17), (1 << 21, 8, 1), (1 << 18, 32, 2)):
+        with pytest.raises(ValueError): Scrypt_KDF(n, r, p)
+        with pytest.raises(ValueError): KDF.from_string(f"scrypt${n}${r}${p}")
+
+def test_kdf_from_string_rejects_unknown():
+    for text in ("md5$1000", "pbkdf2_md5$1000", "scrypt$1024$8", "pbkdf2_sha256"):
+        with pytest.raises(ValueError): KDF.from_string(text)
+
+def test_weaker_than():
+    assert PBKDF2_KDF(1000).weaker_than(PBKDF2_KDF(2000))
+    assert not PBKDF2_KDF(2000).weaker_than(PBKDF2_KDF(1000))
+    assert PBKDF2_KDF(5000, "sha1").weaker_than(PBKDF2_KDF(1000))
+    assert PBKDF2_KDF(1000).weaker_than(Scrypt_KDF(1 << 10))
+
+def test_verify_password_and_rehash():
+    stored = hash_password(b"secret")
+    assert stored.startswith("pbkdf2_sha256$1000$")
+    assert not needs_rehash(stored)
+    rehashed = []
+    assert verify_password(b"secret", stored, on_rehash=rehashed.append)
+    assert not verify_password(b"wrong", stored, on_rehash=rehashed.append)
+    assert rehashed == []
+    # 較弱的雜湊: 驗證成功時才升級
+    salt, key = "AAAAAAAAAAAAAAAAAAAAAA==", PBKDF2_KDF(500).derive(b"secret", bytes(16), 32)
+    weak = f"pbkdf2_sha256$500${salt}${base64.b64encode(key).decode()}"
+    assert needs_rehash(weak)
+    assert not verify_password(b"wrong", weak, on_rehash=rehashed.append) and rehashed == []
+    assert verify_password(b"secret", weak, on_rehash=rehashed.append)
+    assert len(rehashed) == 1 and not needs_rehash(rehashed[0]) and verify_password(b"secret", rehashed[0])
+
+def test_container_records_kdf(monkeypatch):
+    # 以scrypt加密的檔案 在kdf設定改回pbkdf2後仍依header解密
+    monkeypatch.setattr(yoCrypt, "_kdf", Scrypt_KDF(1 << 10, 8, 1))
+    data = yoAES.encrypt_bytes(b"text", b"secret")
+    monkeypatch.undo()
+    assert bytes(yoAES.decrypt_bytes(data, b"secret")) == b"text"
+    with pytest.raises(ValueError): yoAES.decrypt_bytes(data, b"wrong")
+
+def test_calibrate_kdf_floor():
+    """ 再快的目標也不低於預設的下限(PBKDF2-SHA256 36萬次 同舊版的固定參數) """
+    assert calibrate_kdf("pbkdf2", 0.001) == PBKDF2_KDF(360000, "sha256")
+    assert calibrate_kdf("pbkdf2", 0.001, minimum=PBKDF2_KDF(5000)) == PBKDF2_KDF(5000)
+    with pytest.raises(ValueError): calibrate_kdf("md5")
+
+def test_set_kdf(monkeypatch):
+    monkeypatch.setattr(yoCrypt, "_kdf", yoCrypt._kdf)
+    stored = hash_password(b"secret")
+    yoCrypt_set_kdf("pbkdf2_sha256$2000")
+    assert hash_password(b"secret").startswith("pbkdf2_sha256$2000$")
+    assert needs_rehash(stored) and verify_password(b"secret", stored)
@@ -0,0 +1,118 @@
+from yotools200.yoCrypt import yoAES
+from yotools200.yoRekey import RekeyJob, recover_rekey, TEMP_SUFFIX
+from yotools200.yoJournal import journal_path, create_journal, append_record, pack_record, read_journal
+from yotools200 import yoRekey
+import pytest
+import os
+
+OLD = b"old password"
+NEW = b"new password"
+
+def _make_files(folder, count: int = 3) -> dict[str, bytes]:
+    salt = yoAES.new_salt()
+    plains = {}
+    for i in range(count):
+        path = str(folder / f"{i}.txt")
+        plains[path] = f"file {i} 中文\n".encode("utf-8") * (i + 1)
+        with open(path, "wb") as file: file.write(yoAES.encrypt_bytes(plains[path], OLD, salt=salt))
+    return plains
+
+def _read(path: str, password: bytes) -> bytes:
+    with open(path, "rb") as file: return yoAES.decrypt_auto(file.read(), password)
+
+def _run(job: RekeyJob):
+    job.start()
+    for future in job._futures.values(): future.exception()
+    assert job.is_done()
+
+def test_rekey_commit(tmp_path):
+    plains = _make_files(tmp_path)
+    password_file = str(tmp_path / "password.txt")
+    job = RekeyJob(list(plains), OLD, NEW, yoAES.new_salt(), max_workers=2, extra={password_file: b"hash"},
+                   log_path=str(tmp_path / "rekey.log"))
+    _run(job)
+    assert not job.errors()
+    job.commit()
+    assert job.committed
+    for path, plain in plains.items(): assert _read(path, NEW) == plain
+    with open(password_file, "rb") as file: assert file.read() == b"hash"
+    assert sorted(os.listdir(tmp_path)) == ["0.txt", "1.txt", "2.txt", "password.txt"]
+
+def test_rekey_rollback_on_error(tmp_path):
+    plains = _make_files(tmp_path)
+    broken = str(tmp_path / "broken.txt")
+    with open(broken, "wb") as file: file.write(b"not encrypted")
+    originals = {path: open(path, "rb").read() for path in [*plains, broken]}
+    job = RekeyJob([*plains, broken], OLD, NEW, yoAES.new_salt(), max_workers=2, extra={str(tmp_path / "password.txt"): b"hash"})
+    _run(job)
+    assert list(job.errors()) == [broken]
+    with pytest.raises(RuntimeError): job.commit()
+    job.rollback()
+    assert {path: open(path, "rb").read() for path in originals} == originals
+    assert not any(name.endswith(TEMP_SUFFIX) for name in os.listdir(tmp_path))
+
+def test_recover_rekey_rolls_forward_interrupted_commit(tmp_path, monkeypatch):
+    plains = _make_files(tmp_path)
+    log_path = str(tmp_path / "rekey.log")
+    job = RekeyJob(list(plains), OLD, NEW, yoAES.new_salt(), max_workers=2, log_path=log_path)
+    _run(job)
+    # 模擬提交途中中斷: 寫入紀錄後 只完成第一個rename
+    replace = os.replace
+    calls = []
+    def crash(src, dst):
+        calls.append(src)
+        if len(calls) > 2: raise OSError("crash") # 第一次是提交紀錄
+        replace(src, dst)
+    monkeypatch.setattr(yoRekey.os, "replace", crash)
+    with pytest.raises(OSError): job.commit()
+    monkeypatch.setattr(yoRekey.os, "replace", replace)
+    assert job.committed and os.path.exists(log_path)
+    # 下次啟動完成提交
+    assert recover_rekey(log_path, [str(tmp_path)])
+    for path, plain in plains.items(): assert _read(path, NEW) == plain
+    assert not os.path.exists(log_path)
+    assert not any(name.endswith(TEMP_SUFFIX) for name in os.listdir(tmp_path))
+    assert not recover_rekey(log_path, [str(tmp_path)])
+
+def test_recover_rekey_discards_uncommitted_temps(tmp_path):
+    plains = _make_files(tmp_path)
+    job = RekeyJob(list(plains), OLD, NEW, yoAES.new_salt(), max_workers=2, log_path=str(tmp_path / "rekey.log"))
+    _run(job)
+    job._shutdown() # 中斷在寫入提交紀錄前
+    assert not recover_rekey(str(tmp_path / "rekey.log"), [str(tmp_path), str(tmp_path / "missing")])
+    for path, plain in plains.items(): assert _read(path, OLD) == plain
+    assert not any(name.endswith(TEMP_SUFFIX) for name in os.listdir(tmp_path))
+
+def test_rekey_journals_and_restamps(tmp_path):
+    plains = _make_files(tmp_path, 1)
+    base = next(iter(plains))
+    journal = journal_path(base)
+    stat = os.stat(base)
+    end = create_journal(journal, (stat.st_size, stat.st_mtime_ns), True)
+    append_record(journal, pack_record([(0, 0, "x")], 1, OLD), end)
+    job = RekeyJob([base, journal], OLD, NEW, yoAES.new_salt(), max_workers=1,
+                   restamps=[(journal, base)], log_path=str(tmp_path / "rekey.log"))
+    _run(job)
+    job.commit()
+    stat = os.stat(base)
+    stamp, encrypted, records, _ = read_journal(journal, NEW)
+    assert stamp == (stat.st_size, stat.st_mtime_ns) and encrypted and records == [([(0, 0, "x")], 1)]
+    assert _read(base, NEW) == plains[base]
+
+def test_rekey_skip_failed_file(tmp_path):
+    plains = _make_files(tmp_path, 2)
+    broken = str(tmp_path / "broken.txt")
+    with open(broken, "wb") as file: file.write(b"not encrypted")
+    journal = journal_path(broken)
+    with open(journal, "wb") as file: file.write(b"journal")
+    job = RekeyJob([*plains, broken], OLD, NEW, yoAES.new_salt(), max_workers=2,
+                   restamps=[(journal, broken)], log_path=str(tmp_path / "rekey.log"))
+    _run(job)
+    assert list(job.errors()) == [broken]
+    job.skip(broken)
+    assert not job.errors() and not job.restamps
+    job.commit()
+    for path, plain in plains.items(): assert _read(path, NEW) == plain
+    with open(broken, "rb") as file: assert file.read() == b"not encrypted"
+    with open(journal, "rb") as file: assert file.read() == b"journal"
+    assert not any(name.endswith(TEMP_SUFFIX) for name in os.listdir(tmp_path))
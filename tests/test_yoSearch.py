@@ -0,0 +1,175 @@
+from yotools200.yoSearch import LineIndex, MatchIndex, find_bytes, search_line, search_pattern, match_at, replace_all
+from yotools200 import yoSearch
+import random
+import pytest
+import re
+
+DATA = "".join(f"line {i} 中文 {'ab' * (i % 7)}\n" for i in range(3000)).encode("utf-8")
+
+# LineIndex
+def test_line_index_matches_split():
+    index = LineIndex(DATA, block=256)
+    index.build()
+    assert index.complete and index.line_count == DATA.count(b"\n") + 1
+    starts = [0] + [i + 1 for i, byte in enumerate(DATA) if byte == 10]
+    for line in (0, 1, 7, 1500, len(starts) - 1):
+        assert index.line_start(line) == starts[line]
+        assert index.line_of(starts[line]) == line
+    assert index.line_of(len(DATA)) == len(starts) - 1
+
+def test_line_index_partial_build(monkeypatch):
+    """ 建立途中取消: 已索引的部分可以查詢 之後繼續建立 """
+    monkeypatch.setattr(yoSearch, "_SCAN_SIZE", 1024)
+    index = LineIndex(DATA, block=256)
+    with pytest.raises(IndexError): index.line_start(5)
+    calls = []
+    def check():
+        calls.append(None)
+        if len(calls) > 1: raise InterruptedError
+    with pytest.raises(InterruptedError): index.build(check)
+    assert not index.complete and index.indexed_bytes == 1024
+    known = index.counts[-1]
+    assert index.line_start(known) == [i for i, byte in enumerate(DATA) if byte == 10][known - 1] + 1
+    index.build()
+    assert index.complete and index.line_count == DATA.count(b"\n") + 1
+
+# find_bytes
+@pytest.mark.parametrize("window", [5, 64, 1 << 20])
+def test_find_bytes_matches_find(window: int):
+    rng = random.Random(window)
+    for needle in (b"line 29", "中文".encode("utf-8"), b"abab\nline", b"missing"):
+        for _ in range(20):
+            start = rng.randrange(len(DATA))
+            end = rng.randrange(start, len(DATA) + 1)
+            assert find_bytes(DATA, needle, start, end, window=window) == DATA.find(needle, start, end)
+            assert find_bytes(DATA, needle, start, end, backward=True, window=window) == DATA.rfind(needle, start, end)
+
+def test_find_bytes_ignore_case():
+    data = b"xxLINE 12 yy line 12"
+    assert find_bytes(data, b"line 12", ignore_case=True, window=3) == 2
+    assert find_bytes(data, b"LINE 12", ignore_case=True, backward=True, window=3) == 13
+    assert find_bytes(data, b"") == -1
+
+# MatchIndex
+def _spans(index: MatchIndex) -> list[tuple[int, int]]:
+    return [index.span(i) for i in range(len(index))]
+
+def test_match_index_utf16_offsets():
+    """ 位置以UTF-16單位計算(😀佔兩個) 結果不重疊 """
+    index = MatchIndex.scan("😀aa😀aaa", re.compile("aa"), 10)
+    assert _spans(index) == [(12, 14), (16, 18)]
+    assert _spans(MatchIndex.scan("aAa", re.compile("a*"))) == [(0, 1), (2, 3)] # 空的結果不算
+
+def test_match_index_navigation():
+    index = MatchIndex.scan("ab ab ab", re.compile("ab"))
+    assert index.index_of(3, 5) == 1 and index.index_of(3, 4) == -1 and index.index_of(4, 6) == -1
+    assert [index.next_after(position) for position in (0, 1, 3, 7)] == [0, 1, 1, 0] # 最後之後回到第一個
+    assert [index.prev_before(position) for position in (0, 1, 4, 8)] == [2, 0, 1, 2] # 最前之前回到最後一個
+    assert len(MatchIndex.scan("xyz", re.compile("ab"))) == 0
+
+def test_match_index_segments(monkeypatch):
+    """ 分段搜尋的結果與一次搜尋相同 每段之間可取消/回報數量 """
+    monkeypatch.setattr(yoSearch, "_TEXT_SEGMENT", 16)
+    text = "".join(f"ab 😀 {i} ab\n" for i in range(50))
+    pattern = re.compile("ab")
+    reports = []
+    index = MatchIndex.scan(text, pattern, 5, report=reports.append)
+    assert len(index) == 100 and reports[-1] == 100 and len(reports) > 1 and reports == sorted(reports)
+    assert index.span(2) == (5 + _utf16_len(text[:text.index("ab", 10)]), 7 + _utf16_len(text[:text.index("ab", 10)]))
+    def check():
+        if reports: raise InterruptedError
+    reports.clear()
+    with pytest.raises(InterruptedError): MatchIndex.scan(text, pattern, check=check, report=reports.append)
+    assert len(reports) == 1
+
+def test_search_line():
+    text = "ab😀ab x ab"
+    pattern = re.compile("ab")
+    assert search_line(text, pattern, 0, 12) == (0, 2)
+    assert search_line(text, pattern, 1, 12) == (4, 6) # 😀在UTF-16中佔兩個位置
+    assert search_line(text, pattern, 0, 12, backward=True) == (9, 11)
+    assert search_line(text, pattern, 0, 10, backward=True) == (4, 6) # 要完全落在範圍內
+    assert search_line(text, pattern, 5, 9) is None
+    assert search_line("aXa", re.compile("X*"), 0, 3) == (1, 2) # 略過空的結果
+
+# 尋找欄的條件
+def test_search_pattern_plain_and_case():
+    assert search_pattern("a.b").findall("a.b axb") == ["a.b"] # 純文字時跳脫
+    assert search_pattern("AB").findall("ab AB") == ["AB"]
+    assert search_pattern("AB", case_sensitive=False).findall("ab AB") == ["ab", "AB"]
+    assert search_pattern("ab") is search_pattern("ab") # 快取
+
+def test_search_pattern_whole_word():
+    pattern = search_pattern("cat", whole_word=True)
+    assert [match.start() for match in pattern.finditer("cat cats concat cat_ (cat) 中cat")] == [0, 22]
+    assert search_pattern("c.t", regex=True, whole_word=True).findall("cut cute cot") == ["cut", "cot"]
+    assert search_pattern("a|b", regex=True, whole_word=True).findall("a ab b") == ["a", "b"] # 整個regex都要是完整的字
+
+def test_search_pattern_regex():
+    pattern = search_pattern(r"^(\w+) (\d+)$", regex=True)
+    assert pattern.findall("one 1\ntwo x\nthree 3") == [("one", "1"), ("three", "3")] # ^$對應行首行尾
+    with pytest.raises(re.error): search_pattern("(", regex=True)
+    assert search_pattern("(").findall("a(b") == ["("]
+
+def test_match_at():
+    text = "😀ab abc"
+    pattern = search_pattern(r"a(b)", regex=True)
+    assert match_at(text, pattern, 2, 4).expand(r"\1") == "b" # 😀在UTF-16中佔兩個位置
+    assert match_at(text, pattern, 5, 7) is not None
+    assert match_at(text, pattern, 5, 8) is None and match_at(text, pattern, 3, 5) is None
+    assert match_at("aXa", search_pattern("X*", regex=True), 1, 1) is None # 空的結果不算
+
+# 全部取代
+@pytest.mark.parametrize("regex", [False, True])
+def test_replace_all_matches_sub(regex: bool):
+    text = "".join(f"ab 😀 {i} AB\n" for i in range(300))
+    pattern = search_pattern("ab" if not regex else r"(a)(b)", case_sensitive=False, regex=regex)
+    template = "x" if not regex else r"\2\1"
+    replaced, index, replacements = replace_all(text, pattern, template, 7, 9999, expand=regex)
+    assert replaced == pattern.sub(template, text)
+    scanned = MatchIndex.scan(text, pattern, 7, 9999)
+    assert _spans(index) == _spans(scanned) and index.length == 9999
+    assert replacements == [match.expand(template) for match in pattern.finditer(text)]
+
+def test_replace_all_literal_template():
+    """ 沒有expand時template原樣插入(不展開反向參照) """
+    replaced, index, replacements = replace_all("a.a", search_pattern("."), r"\1")
+    assert replaced == r"a\1a" and _spans(index) == [(1, 2)] and replacements == [r"\1"]
+    assert replace_all("abc", search_pattern("x"), "y")[0] == "abc"
+    with pytest.raises(re.error): replace_all("ab", search_pattern("a", regex=True), r"\9", expand=True)
+
+def _utf16_len(text: str) -> int:
+    return len(text.encode("utf-16-le", "surrogatepass")) // 2
+
+def _update(index: MatchIndex, text: str, pattern: re.Pattern[str], low: int, high: int, delta: int) -> MatchIndex:
+    """ 同FindReplaceDialog._update_matches: text已改寫 [low, high)(字元位置)是變更後的範圍 長度變化delta(UTF-16) """
+    start = text.rfind("\n", 0, low) + 1
+    end = text.find("\n", high)
+    if end < 0: end = len(text)
+    first, last = _utf16_len(text[:start]), _utf16_len(text[:end])
+    if last - delta < first: return MatchIndex.scan(text, pattern, 0, _utf16_len(text)) # 作廢後完整搜尋
+    index.replace(first, last - delta + 1, delta, MatchIndex.scan(text[start:end], pattern, first, _utf16_len(text)))
+    return index
+
+@pytest.mark.parametrize("seed", range(5))
+def test_match_index_random_edits(seed: int):
+    """ 隨機編輯後只重新搜尋變更的段落 結果要與完整搜尋相同 """
+    rng = random.Random(seed)
+    alphabet = "ab\n😀"
+    text = "".join(rng.choice(alphabet) for _ in range(300))
+    pattern = re.compile("ab")
+    index = MatchIndex.scan(text, pattern, 0, _utf16_len(text))
+    for _ in range(500):
+        position = rng.randrange(len(text) + 1)
+        removed = min(rng.choice((0, 0, 1, 2, 5)), len(text) - position)
+        inserted = "".join(rng.choice(alphabet) for _ in range(rng.choice((0, 1, 1, 3, 8))))
+        delta = _utf16_len(inserted) - _utf16_len(text[position:position+removed])
+        text = text[:position] + inserted + text[position+removed:]
+        index = _update(index, text, pattern, position, position + len(inserted), delta)
+        expected = MatchIndex.scan(text, pattern, 0, _utf16_len(text))
+        assert index.length == expected.length and _spans(index) == _spans(expected)
+        if len(index):
+            probe = rng.randrange(index.length + 1)
+            assert index.next_after(probe) == expected.next_after(probe)
+            assert index.prev_before(probe) == expected.prev_before(probe)
+            assert index.index_of(*expected.span(0)) == 0
@@ -0,0 +1,47 @@
+from yotools200.yoText import ENCODING_SAMPLE_SIZE, utf16_len, detect_encoding, decode_plain, check_journal, replay_journal
+import codecs
+import pytest
+
+ENCODINGS = ("utf-8", "gbk", "cp950")
+TEXT = "".join(f"line {i} 中文\n" for i in range(100))
+
+# 編碼判斷
+def test_detect_encoding_by_bom():
+    for name in ("utf-8-sig", "utf-16-le", "utf-16-be", "utf-32-le", "utf-32-be"):
+        data = TEXT.encode(name) if name == "utf-8-sig" else codecs.lookup(name).encode("\ufeff" + TEXT)[0]
+        detected = detect_encoding(data[:10], False, ENCODINGS)
+        assert detected == {"utf-8-sig": "utf-8-sig"}.get(name, name[:6])
+        assert decode_plain(data, ENCODINGS) == (TEXT, detected)
+
+def test_detect_encoding_by_sample():
+    assert detect_encoding(TEXT.encode("utf-8"), True, ENCODINGS) == "utf-8"
+    assert detect_encoding(TEXT.encode("gbk"), True, ENCODINGS) == "gbk"
+    assert detect_encoding(TEXT.encode("gbk"), True, ("utf-8",)) == "latin-1"
+    assert detect_encoding(bytes([0x81, 0x30, 0xFF]), True, ENCODINGS) == "latin-1"
+    # 樣本結尾切斷多位元組字元不算錯(complete=False)
+    sample = "a中".encode("utf-8")[:-1]
+    assert detect_encoding(sample, False, ENCODINGS) == "utf-8"
+    assert detect_encoding(sample, True, ENCODINGS) != "utf-8"
+
+def test_decode_plain_falls_back_after_sample():
+    """ 樣本之後才出現不符的位元組: 改用下一個編碼 換行統一為\\n """
+    data = b"a\r\n" * ENCODING_SAMPLE_SIZE + "中文".encode("gbk")
+    text, name = decode_plain(data, ENCODINGS)
+    assert name == "gbk" and text == "a\n" * ENCODING_SAMPLE_SIZE + "中文"
+    assert decode_plain(b"a\rb\xff", ENCODINGS) == ("a\nb\xff", "latin-1")
+
+def test_utf16_len():
+    assert utf16_len("a中😀") == 4
+    assert utf16_len("a\ud800b") == 3 # 單獨的surrogate(編輯途中可能出現)
+
+# 日誌重播
+def test_replay_journal():
+    assert replay_journal("hello world", [([(0, 5, "HELLO")], 11), ([(11, 0, " 😀")], 14)]) == "HELLO world 😀"
+    assert replay_journal("a😀b", [([(1, 2, "")], 2)]) == "ab"
+    assert replay_journal("text", []) == "text"
+
+def test_replay_journal_rejects_mismatch():
+    """ 不符時整個不套用 """
+    with pytest.raises(ValueError): replay_journal("short", [([(0, 0, "x")], 99)]) # 長度不符
+    with pytest.raises(ValueError): replay_journal("short", [([(10, 0, "x")], 6)]) # 位置超出範圍
+    with pytest.raises(ValueError): check_journal(5, [([(0, 0, "x")], 6), ([(0, 0, "y")], 6)]) # 第二筆不符
@@ -1,5 +1,6 @@
 # import主接口
 from .utils import *
-from .yoCrypt import yoAES
+from .yoCrypt import yoAES, BatchResult
+from .yoRekey import RekeyJob, recover_rekey
 
-__all__ = ['Code_Timer', 'resource_path', 'true_func', 'empty_func', 'is_chinese', 'is_punctuation', 'memory_address', 'yoAES']
+__all__ = ['Code_Timer', 'resource_path', 'atomic_write', 'true_func', 'empty_func', 'is_chinese', 'is_punctuation', 'memory_address', 'yoAES', 'BatchResult', 'RekeyJob', 'recover_rekey']
@@ -1,3 +1,7 @@
+from typing import Any, BinaryIO, Callable
+import threading
+import hashlib
+import shutil
 import time
 import sys
 import os
@@ -19,6 +23,40 @@ def is_punctuation(ch: str):
     if len(ch) != 1: raise ValueError("is_punctuation() 只接受單一字元")
     return regex.match(r'\p{P}|\p{S}', ch) is not None
 
+def atomic_write(file_path: str, write: Callable[[BinaryIO], Any]):
+    """ 寫到同目錄的暫存檔 fsync後以rename覆蓋 中途失敗不會破壞原檔 
+    沿用原檔的權限 rename後fsync目錄(POSIX) 不同執行緒同時寫同一檔也不會共用暫存檔 """
+    temp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, "wb") as file:
+            write(file)
+            file.flush()
+            os.fsync(file.fileno())
+        try: shutil.copymode(file_path, temp_path)
+        except OSError: pass # 新檔案
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path): os.remove(temp_path)
+        raise
+    fsync_dir(os.path.dirname(os.path.abspath(file_path))) # rename本身也要落地
+
+def fsync_dir(directory: str):
+    """ fsync目錄(POSIX) 之前在其中的rename/刪除才會落地 """
+    if os.name == "nt": return
+    handle = os.open(directory, os.O_RDONLY)
+    try: os.fsync(handle)
+    finally: os.close(handle)
+
+def file_digest(file_path: str, check: Callable[[], None]|None = None, block: int = 1 << 20) -> bytes:
+    """ 逐段計算檔案的雜湊(blake2b) 不整個讀進記憶體 每段之前呼叫check(可取消) """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as file:
+        while True:
+            if check is not None: check()
+            data = file.read(block)
+            if not data: return digest.digest()
+            digest.update(data)
+
 def resource_path(relative_path: str) -> str:
     """支援 PyInstaller 打包後讀取資源(動態讀寫)"""
     if getattr(sys, 'frozen', False): base_path = os.path.dirname(sys.executable)
@@ -1,25 +1,128 @@
 from Crypto.Cipher import AES
-from Crypto.Protocol.KDF import PBKDF2
-from Crypto.Hash import SHA256
 from Crypto.Random import get_random_bytes
+from concurrent.futures import ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+from collections import OrderedDict, deque
+from typing import BinaryIO, Iterable, Iterator
+from .utils import atomic_write
+from .yoKDF import KDF, PBKDF2_KDF
+from typing import Callable
+import threading
+import bisect
+import zlib
+import lzma
+import ctypes
+import struct
+import io
+import hashlib
 import base64
 import os
 import hmac
 
-_count: int
+_count: int     # 舊base64格式的PBKDF2次數(沒有記錄在檔案中)
 _salt_size: int
 _hash_len: int
+_kdf: KDF       # 新的雜湊與加密檔使用的kdf
 _already_init = False
 
-def yoCrypt_init(count: int = 200*1000, salt_size: int = 16, hash_len: int = 32, encoding: str = "utf-8"):
-    global _count, _already_init, _salt_size, _hash_len, _encoding
+# 串流(分塊)加密格式 header格式見_Header
+# chunk : AES-GCM(ciphertext) | tag  (nonce = nonce_prefix | counter | last_flag)
+STREAM_MAGIC = b"\x00yoC"            # 含非base64字元 不會與舊格式混淆
+STREAM_CHUNK_SIZE = 64 * 1024        # 預設每塊明文大小
+_STREAM_VERSION = 2
+_INDEXED_VERSION = 3                  # 可隨機存取的格式 見IndexedContainer
+_V1_FIXED = struct.Struct(">4sBBIIB") # magic, version, kdf, iterations, chunk_size, salt_size
+_V2_FIXED = struct.Struct(">4sBI7s")  # magic, version, chunk_size, nonce_prefix
+_KEY_BLOCK = struct.Struct(">BIB")    # kdf, cost(見KDF.cost), salt_size
+_NONCE_PREFIX_SIZE = 7
+_WRAP_NONCE_SIZE = 12
+_DATA_KEY_SIZE = 32
+_TAG_SIZE = 16
+_WRAP_SIZE = _WRAP_NONCE_SIZE + _DATA_KEY_SIZE + _TAG_SIZE
+_SLOT = struct.Struct(">QQI")         # sequence, manifest_offset, manifest_size
+_INDEX_COUNT = struct.Struct(">I")
+_INDEX_ENTRY = struct.Struct(">QI12s") # offset, size, nonce
+_INDEX_ENTRY_PACKED = struct.Struct(">QI12sI") # 壓縮時多記錄明文長度
+_CHUNK_NONCE_SIZE = 12
+_CODEC_SHIFT = 24                     # v3 chunk_size欄位的高8位元為壓縮方式 舊檔為0
+COMPRESSIONS = ("", "zlib", "lzma")   # 壓縮方式(編號為索引) ""為不壓縮
+COMPRESS_MIN_SIZE = 4 * 1024          # 小於此長度的明文不壓縮(短筆記省不了多少 徒增CPU)
+
+class KeyCache:
+    """ 衍生金鑰的LRU快取(max_size=0時關閉) """
+    def __init__(self, max_size: int = 0):
+        self.max_size = max_size
+        self._secret = os.urandom(32) # 指紋用的隨機密鑰 不讓指紋可被離線暴力破解
+        self._keys: OrderedDict[bytes, bytearray] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _fingerprint(self, password: bytes, salt: bytes, dk_len: int, kdf: str) -> bytes:
+        """ (password, salt, dk_len, kdf參數) 的指紋 """
+        mac = hmac.new(self._secret, digestmod=hashlib.sha256)
+        for part in (password, salt, str(dk_len).encode(), kdf.encode()):
+            mac.update(len(part).to_bytes(4, "big"))
+            mac.update(part)
+        return mac.digest()
+
+    def get(self, password: bytes, salt: bytes, dk_len: int, kdf: str) -> bytes|None:
+        """ 取得快取的金鑰 沒有則回傳None """
+        if self.max_size <= 0: return None
+        fingerprint = self._fingerprint(password, salt, dk_len, kdf)
+        with self._lock:
+            key = self._keys.get(fingerprint)
+            if key is None: return None
+            self._keys.move_to_end(fingerprint)
+            return bytes(key)
+
+    def put(self, password: bytes, salt: bytes, dk_len: int, kdf: str, key: bytes):
+        """ 存入金鑰 超過上限時淘汰最久未使用的 """
+        if self.max_size <= 0: return
+        fingerprint = self._fingerprint(password, salt, dk_len, kdf)
+        with self._lock:
+            if fingerprint in self._keys: _try_clear(self._keys.pop(fingerprint))
+            self._keys[fingerprint] = bytearray(key)
+            while len(self._keys) > self.max_size:
+                _, evicted = self._keys.popitem(last=False)
+                _try_clear(evicted)
+
+    def clear(self):
+        """ 清除(歸零)所有快取的金鑰 """
+        with self._lock:
+            for key in self._keys.values(): _try_clear(key)
+            self._keys.clear()
+
+key_cache = KeyCache()
+
+def yoCrypt_init(count: int = 200*1000, salt_size: int = 16, hash_len: int = 32, encoding: str = "utf-8", 
+                 key_cache_size: int = 0, kdf: KDF|str|None = None):
+    """ kdf: 新雜湊/加密檔使用的kdf(預設PBKDF2-SHA256 count次) count同時是舊base64格式的次數 """
+    global _count, _already_init, _salt_size, _hash_len, _encoding, _kdf
     if _already_init: return print(f"yoCrypt has already init: count = {_count}")
     _count = count
     _salt_size = salt_size
     _hash_len = hash_len
     _encoding = encoding
+    if isinstance(kdf, str): kdf = KDF.from_string(kdf)
+    _kdf = kdf or PBKDF2_KDF(count)
+    key_cache.max_size = key_cache_size
     _already_init = True
 
+def yoCrypt_set_kdf(kdf: KDF|str):
+    """ 更換新雜湊/加密檔使用的kdf(例如首次執行校準後) 已存在的雜湊與檔案依自己記錄的kdf驗證/解密 """
+    global _kdf
+    _ensure_init()
+    _kdf = KDF.from_string(kdf) if isinstance(kdf, str) else kdf
+
+# yoCrypt_params(): (count, salt_size, hash_len, encoding, key_cache_size, kdf字串)
+Params = tuple[int, int, int, str, int, str]
+
+def yoCrypt_params() -> Params:
+    """ 目前的init參數(傳給子行程重新init用) """
+    _ensure_init()
+    return (_count, _salt_size, _hash_len, _encoding, key_cache.max_size, _kdf.to_string())
+
 def _ensure_init(): 
     if not _already_init: raise RuntimeError("yoCrypt has not init yet")
     return True
@@ -34,40 +137,756 @@ def _ensure_bytes(password: str|bytes|bytearray):
     return password
 
 def _try_clear(password: str|bytes|bytearray):
-    if isinstance(password, bytearray):
-        for i in range(len(password)):
-            password[i] = 0
+    """ 就地歸零bytearray(memset 大緩衝區也不會逐位元組迴圈) """
+    if isinstance(password, bytearray) and password:
+        ctypes.memset((ctypes.c_char * len(password)).from_buffer(password), 0, len(password))
 
 def hash_password(password: str|bytes|bytearray) -> str:
-    """ 將傳入的密碼雜湊 """
+    """ 將傳入的密碼雜湊 格式: kdf參數$salt$key """
     password = _ensure_bytes(password)
     salt = os.urandom(_salt_size)
-    key = PBKDF2(password, salt, dkLen=_hash_len , count=_count, hmac_hash_module=SHA256)
+    key = _kdf.derive(password, salt, _hash_len)
     _try_clear(password)
     del password
-    return f"pbkdf2_sha256${_count}${base64.b64encode(salt).decode()}${base64.b64encode(key).decode()}"
+    return f"{_kdf.to_string()}${base64.b64encode(salt).decode()}${base64.b64encode(key).decode()}"
+
+def needs_rehash(stored: str) -> bool:
+    """ 儲存的雜湊是否比目前的kdf設定弱(需要升級) """
+    _ensure_init()
+    return KDF.from_string(stored.rsplit("$", 2)[0]).weaker_than(_kdf)
 
-def verify_password(password: str|bytes|bytearray, stored: str) -> bool:
+def verify_password(password: str|bytes|bytearray, stored: str, on_rehash: Callable[[str], None]|None = None) -> bool:
+    """ 驗證密碼 成功且雜湊需要升級時 以新雜湊呼叫on_rehash """
     password = _ensure_bytes(password)
     try:
-        algo, iter_str, salt_b64, key_b64 = stored.split("$")
-        if algo != "pbkdf2_sha256": raise ValueError("Unsupported algorithm")
-        iterations = int(iter_str)
+        kdf_str, salt_b64, key_b64 = stored.strip().rsplit("$", 2)
+        kdf = KDF.from_string(kdf_str)
         salt = base64.b64decode(salt_b64)
         key = base64.b64decode(key_b64)
-        new_key = PBKDF2(password, salt, dkLen=len(key), count=iterations, hmac_hash_module=SHA256)
+        new_key = kdf.derive(password, salt, len(key))
+        verified = hmac.compare_digest(new_key, key)
+        # 透明升級
+        if verified and on_rehash is not None and kdf.weaker_than(_kdf): on_rehash(hash_password(password))
         _try_clear(password)
         del password
-        return hmac.compare_digest(new_key, key)
+        return verified
     except Exception as e: raise e
 
+def _derive_key(password: bytes, salt: bytes, dk_len: int, kdf: KDF) -> bytes:
+    """ 衍生金鑰 先查key_cache """
+    kdf_str = kdf.to_string()
+    key = key_cache.get(password, salt, dk_len, kdf_str)
+    if key is not None: return key
+    key = kdf.derive(password, salt, dk_len)
+    key_cache.put(password, salt, dk_len, kdf_str, key)
+    return key
+
+def _read_exact(src: BinaryIO, size: int) -> bytes:
+    """ 讀滿size個位元組(除非EOF) """
+    data = src.read(size)
+    if len(data) == size or not data: return data
+    parts = [data]
+    remain = size - len(data)
+    while remain:
+        part = src.read(remain)
+        if not part: break
+        parts.append(part)
+        remain -= len(part)
+    return b"".join(parts)
+
+def _sync(file: BinaryIO):
+    """ flush並fsync(記憶體串流只flush) """
+    file.flush()
+    try: fileno = file.fileno()
+    except io.UnsupportedOperation: return
+    os.fsync(fileno)
+
+def _codec_id(compression: str|None) -> int:
+    """ 壓縮方式名稱 -> header中的編號 """
+    if compression not in COMPRESSIONS and compression is not None: raise ValueError(f"Unsupported compression: {compression}")
+    return COMPRESSIONS.index(compression or "")
+
+def _compress(codec: int, data: bytes|bytearray|memoryview) -> bytes|bytearray|memoryview:
+    """ 壓縮單一區塊(各區塊獨立 才能隨機存取) """
+    if codec == 1: return zlib.compress(data, 3) # 快 適合預設
+    if codec == 2: return lzma.compress(data, format=lzma.FORMAT_XZ, check=lzma.CHECK_NONE, preset=6) # 慢但壓縮率高 GCM已驗證 不需再檢查
+    return data
+
+def _decompress(codec: int, data: bytes, size: int) -> bytes:
+    """ 解壓單一區塊 最多輸出size位元組(manifest記錄的明文長度) 長度不符視為損毀 """
+    if codec == 1: decompressor = zlib.decompressobj()
+    elif codec == 2: decompressor = lzma.LZMADecompressor(lzma.FORMAT_XZ)
+    else: return data
+    plain = decompressor.decompress(data, size + 1) # 多1位元組才能分辨超長的資料
+    if len(plain) != size or not decompressor.eof: raise ValueError("Corrupted compressed chunk")
+    return plain
+
+def _chunk_nonce(prefix: bytes, counter: int, last: bool) -> bytes:
+    """ 每塊的nonce: 計數器防重排 last旗標防截斷 """
+    if counter >= 1 << 32: raise OverflowError("too many chunks")
+    return prefix + counter.to_bytes(4, "big") + (b"\x01" if last else b"\x00")
+
+class _Header:
+    """ 容器header
+    v1: magic | 1 | kdf | iterations | chunk_size | salt_size | salt | nonce_prefix (只有PBKDF2-SHA256)
+        金鑰 = KDF(password, salt), 本體AAD = 整個header
+    v2: magic | 2 | chunk_size | nonce_prefix | kdf | cost | salt_size | salt | wrap_nonce | wrapped_key | wrap_tag
+        每個檔案有自己的隨機資料金鑰 由 KEK = KDF(password, salt) 包裝
+        本體AAD = key block之前的16位元組 更換密碼時只需重寫key block
+    v3: 同v2 之後接兩個manifest slot(見IndexedContainer) nonce_prefix不使用
+        chunk_size欄位的高8位元為壓縮方式(COMPRESSIONS的編號) 在AAD內 受驗證
+    """
+    def __init__(self, version: int, chunk_size: int, prefix: bytes, kdf: KDF, salt: bytes, wrapped: bytes = b"", codec: int = 0):
+        if codec and version != _INDEXED_VERSION: raise ValueError("Compression requires an indexed container")
+        if codec and chunk_size >> _CODEC_SHIFT: raise ValueError("chunk size too large for a compressed container")
+        self.version = version
+        self.chunk_size = chunk_size
+        self.codec = codec
+        self.prefix = prefix
+        self.kdf = kdf
+        self.salt = salt
+        self.wrapped = wrapped # wrap_nonce | wrapped_key | wrap_tag
+        if version == 1: self.aad = _V1_FIXED.pack(STREAM_MAGIC, 1, kdf.kdf_id, kdf.cost, chunk_size, len(salt)) + salt + prefix
+        else: self.aad = _V2_FIXED.pack(STREAM_MAGIC, version, codec << _CODEC_SHIFT | chunk_size, prefix)
+
+    @property
+    def key_block(self) -> bytes:
+        """ v2的key block(v1沒有) """
+        if self.version == 1: return b""
+        return _KEY_BLOCK.pack(self.kdf.kdf_id, self.kdf.cost, len(self.salt)) + self.salt + self.wrapped
+
+    @property
+    def size(self) -> int:
+        return len(self.aad) + len(self.key_block)
+
+    def pack(self) -> bytes:
+        return self.aad + self.key_block
+
+    @staticmethod
+    def parse(view: memoryview) -> "_Header":
+        """ 解析並檢查header """
+        if len(view) < 5: raise ValueError("Truncated header")
+        if bytes(view[:4]) != STREAM_MAGIC: raise ValueError("Not a yoCrypt container")
+        version = view[4]
+        codec = 0
+        if version == 1:
+            if len(view) < _V1_FIXED.size: raise ValueError("Truncated header")
+            _, _, kdf_id, cost, chunk_size, salt_size = _V1_FIXED.unpack_from(view)
+            salt_end = _V1_FIXED.size + salt_size
+            if len(view) < salt_end + _NONCE_PREFIX_SIZE: raise ValueError("Truncated header")
+            salt, prefix, wrapped = bytes(view[_V1_FIXED.size:salt_end]), bytes(view[salt_end:salt_end+_NONCE_PREFIX_SIZE]), b""
+        elif version in (2, _INDEXED_VERSION):
+            if len(view) < _V2_FIXED.size + _KEY_BLOCK.size: raise ValueError("Truncated header")
+            _, _, chunk_size, prefix = _V2_FIXED.unpack_from(view)
+            if version == _INDEXED_VERSION: codec, chunk_size = chunk_size >> _CODEC_SHIFT, chunk_size & ((1 << _CODEC_SHIFT) - 1)
+            if codec >= len(COMPRESSIONS): raise ValueError(f"Unsupported compression: {codec}")
+            kdf_id, cost, salt_size = _KEY_BLOCK.unpack_from(view, _V2_FIXED.size)
+            salt_start = _V2_FIXED.size + _KEY_BLOCK.size
+            salt_end = salt_start + salt_size
+            if len(view) < salt_end + _WRAP_SIZE: raise ValueError("Truncated header")
+            salt, wrapped = bytes(view[salt_start:salt_end]), bytes(view[salt_end:salt_end+_WRAP_SIZE])
+        else: raise ValueError(f"Unsupported container version: {version}")
+        if version == 1 and kdf_id != PBKDF2_KDF.kdf_id: raise ValueError(f"Unsupported kdf: {kdf_id}")
+        if chunk_size <= 0: raise ValueError("Invalid chunk size")
+        return _Header(version, chunk_size, prefix, KDF.from_header(kdf_id, cost), salt, wrapped, codec)
+
+    @staticmethod
+    def read(src: BinaryIO) -> "_Header":
+        """ 從串流讀取header(讀完後src停在本體開頭) """
+        head = _read_exact(src, 5)
+        if len(head) == 5 and head[4] == 1:
+            head += _read_exact(src, _V1_FIXED.size - 5)
+            head += _read_exact(src, head[-1] + _NONCE_PREFIX_SIZE)
+        elif len(head) == 5 and head[4] in (2, _INDEXED_VERSION):
+            head += _read_exact(src, _V2_FIXED.size - 5 + _KEY_BLOCK.size)
+            head += _read_exact(src, head[-1] + _WRAP_SIZE)
+        return _Header.parse(memoryview(head))
+
+    @staticmethod
+    def new(chunk_size: int, salt: bytes, password: bytes, data_key: bytes|bytearray, 
+            version: int = _STREAM_VERSION, codec: int = 0) -> "_Header":
+        """ 建立v2/v3 header並包裝資料金鑰 """
+        header = _Header(version, chunk_size, get_random_bytes(_NONCE_PREFIX_SIZE), _kdf, salt, codec=codec)
+        header.wrap(password, data_key)
+        return header
+
+    def _wrap_aad(self) -> bytes:
+        return self.aad + _KEY_BLOCK.pack(self.kdf.kdf_id, self.kdf.cost, len(self.salt)) + self.salt
+
+    def wrap(self, password: bytes, data_key: bytes|bytearray):
+        """ 以KEK包裝資料金鑰 """
+        kek = _derive_key(password, self.salt, 32, self.kdf)
+        cipher = AES.new(kek, AES.MODE_GCM, nonce=get_random_bytes(_WRAP_NONCE_SIZE))
+        cipher.update(self._wrap_aad())
+        wrapped_key, tag = cipher.encrypt_and_digest(bytes(data_key))
+        self.wrapped = cipher.nonce + wrapped_key + tag
+
+    def data_key(self, password: bytes) -> bytearray:
+        """ 取得本體的金鑰(v1: 直接衍生, v2: 解開包裝) 用完請_try_clear """
+        kek = _derive_key(password, self.salt, 32, self.kdf)
+        if self.version == 1: return bytearray(kek)
+        nonce = self.wrapped[:_WRAP_NONCE_SIZE]
+        wrapped_key = self.wrapped[_WRAP_NONCE_SIZE:_WRAP_NONCE_SIZE+_DATA_KEY_SIZE]
+        cipher = AES.new(kek, AES.MODE_GCM, nonce=nonce)
+        cipher.update(self._wrap_aad())
+        data_key = bytearray(_DATA_KEY_SIZE)
+        cipher.decrypt(wrapped_key, output=data_key)
+        try: cipher.verify(self.wrapped[-_TAG_SIZE:])
+        except ValueError:
+            _try_clear(data_key)
+            raise
+        return data_key
+
+def compression_for(size: int, compression: str|None) -> str:
+    """ 長度size的明文實際使用的壓縮方式(低於COMPRESS_MIN_SIZE不壓縮) """
+    _codec_id(compression)
+    return (compression or "") if size >= COMPRESS_MIN_SIZE else ""
+
+def split_chunks(data: bytes|bytearray|memoryview, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[memoryview]:
+    """ 把UTF-8文字切成約chunk_size的區塊 盡量切在換行之後 不會切斷多位元組字元(每塊可單獨解碼) """
+    view = memoryview(data)
+    start = 0
+    while start < len(view):
+        end = start + chunk_size
+        if end < len(view):
+            newline = bytes(view[start:end]).rfind(b"\n")
+            if newline >= 0: end = start + newline + 1
+            else:
+                while end > start + 1 and view[end] & 0xC0 == 0x80: end -= 1
+        yield view[start:end]
+        start = end
+
+class IndexedContainer:
+    """ 可隨機存取的加密容器(v3)
+    header(同v2 可rewrap) | slot A | slot B | 區塊 ... | manifest ...
+    每個區塊以資料金鑰和自己的隨機nonce加密 AAD = header前16位元組
+    manifest = 區塊索引(offset, size, nonce[, 明文長度]) 加密並驗證 AAD = header前16位元組 + 序號
+    slot指向最新的manifest 兩個slot輪流寫入 寫入中斷時另一個仍然有效
+    commit()只在檔尾附加變更的區塊與新的manifest 舊區塊成為浪費空間 由compact()清除
+    header記錄壓縮方式時 每個區塊先各自壓縮再加密(仍可單獨解密) manifest多記錄明文長度 """
+    def __init__(self, file: BinaryIO, header: _Header, key: bytearray, 
+                 entries: list[tuple[int, int, bytes, int]], sequence: int = 0):
+        self.file = file
+        self.header = header
+        self._key = key
+        self._set_entries(entries, sequence)
+
+    def _set_entries(self, entries: list[tuple[int, int, bytes, int]], sequence: int):
+        self.entries = entries # (offset, size, nonce, plain_size) size為密文長度(不含tag) 未壓縮時兩者相同
+        self.sequence = sequence
+        self._starts = [0]     # 每個區塊在明文中的起點
+        for entry in entries: self._starts.append(self._starts[-1] + entry[3])
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __enter__(self) -> "IndexedContainer":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """ 歸零資料金鑰(不關閉file) """
+        _try_clear(self._key)
+
+    @property
+    def size(self) -> int:
+        """ 明文總長度 """
+        return self._starts[-1]
+
+    @property
+    def compression(self) -> str:
+        """ 壓縮方式(""為不壓縮) """
+        return COMPRESSIONS[self.header.codec]
+
+    @property
+    def stored_size(self) -> int:
+        """ 有效區塊的密文總長度(不含tag) 與size比較即為壓縮省下的I/O """
+        return sum(entry[1] for entry in self.entries)
+
+    @property
+    def _entry_struct(self) -> struct.Struct:
+        return _INDEX_ENTRY_PACKED if self.header.codec else _INDEX_ENTRY
+
+    @property
+    def _slots_offset(self) -> int:
+        return self.header.size
+
+    @property
+    def _body_offset(self) -> int:
+        return self.header.size + 2 * _SLOT.size
+
+    @property
+    def live_size(self) -> int:
+        """ 有效區塊(含tag)與manifest佔用的位元組 """
+        manifest_size = _CHUNK_NONCE_SIZE + _INDEX_COUNT.size + len(self.entries) * self._entry_struct.size + _TAG_SIZE
+        return self.stored_size + len(self.entries) * _TAG_SIZE + manifest_size
+
+    @property
+    def wasted(self) -> int:
+        """ 不再被manifest引用的位元組(舊區塊/舊manifest 仍是密文 但含有已刪除的內容) """
+        self.file.seek(0, os.SEEK_END)
+        return self.file.tell() - self._body_offset - self.live_size
+
+    def chunk_start(self, index: int) -> int:
+        """ 第index塊在明文中的起點 """
+        return self._starts[index]
+
+    def _encrypt(self, plain: bytes|bytearray|memoryview, aad: bytes) -> tuple[bytes, bytes, bytes]:
+        """ 回傳(nonce, ciphertext, tag) """
+        nonce = get_random_bytes(_CHUNK_NONCE_SIZE)
+        cipher = AES.new(self._key, AES.MODE_GCM, nonce=nonce)
+        cipher.update(aad)
+        return (nonce, *cipher.encrypt_and_digest(plain))
+
+    def _decrypt(self, offset: int, size: int, nonce: bytes, aad: bytes) -> bytes:
+        self.file.seek(offset)
+        data = _read_exact(self.file, size + _TAG_SIZE)
+        if len(data) != size + _TAG_SIZE: raise ValueError("Truncated container")
+        cipher = AES.new(self._key, AES.MODE_GCM, nonce=nonce)
+        cipher.update(aad)
+        return cipher.decrypt_and_verify(data[:size], data[size:])
+
+    def _encrypt_chunk(self, plain: bytes|bytearray|memoryview, offset: int) -> tuple[bytes, tuple[int, int, bytes, int]]:
+        """ 壓縮(若有)並加密一個區塊 回傳(密文|tag, 位於offset的索引項) """
+        nonce, cipher_text, tag = self._encrypt(_compress(self.header.codec, plain), self.header.aad)
+        return cipher_text + tag, (offset, len(cipher_text), nonce, len(plain))
+
+    def chunk(self, index: int) -> bytes:
+        """ 解密並驗證第index塊 """
+        offset, size, nonce, plain_size = self.entries[index]
+        return _decompress(self.header.codec, self._decrypt(offset, size, nonce, self.header.aad), plain_size)
+
+    def __iter__(self) -> Iterator[bytes]:
+        for index in range(len(self.entries)): yield self.chunk(index)
+
+    def read(self, start: int = 0, end: int|None = None) -> bytes:
+        """ 解密明文[start:end] 只會讀取涵蓋的區塊 """
+        end = self.size if end is None else min(end, self.size)
+        if start >= end: return b""
+        first = bisect.bisect_right(self._starts, start) - 1
+        last = bisect.bisect_left(self._starts, end) # 不含
+        data = b"".join(self.chunk(index) for index in range(first, last))
+        offset = self._starts[first]
+        return data[start-offset:end-offset]
+
+    def _manifest_aad(self, sequence: int) -> bytes:
+        return self.header.aad + sequence.to_bytes(8, "big")
+
+    def _pack_manifest(self, entries: list[tuple[int, int, bytes, int]], sequence: int) -> bytes:
+        """ 加密後的manifest: nonce | ciphertext | tag """
+        if self.header.codec: packed = (_INDEX_ENTRY_PACKED.pack(*entry) for entry in entries)
+        else: packed = (_INDEX_ENTRY.pack(*entry[:3]) for entry in entries)
+        plain = _INDEX_COUNT.pack(len(entries)) + b"".join(packed)
+        nonce, cipher_text, tag = self._encrypt(plain, self._manifest_aad(sequence))
+        return nonce + cipher_text + tag
+
+    def _load_manifest(self, offset: int, size: int, sequence: int) -> list[tuple[int, int, bytes, int]]:
+        if size < _CHUNK_NONCE_SIZE + _INDEX_COUNT.size + _TAG_SIZE: raise ValueError("Invalid manifest")
+        self.file.seek(offset)
+        nonce = _read_exact(self.file, _CHUNK_NONCE_SIZE)
+        plain = self._decrypt(offset + _CHUNK_NONCE_SIZE, size - _CHUNK_NONCE_SIZE - _TAG_SIZE, nonce, self._manifest_aad(sequence))
+        count, = _INDEX_COUNT.unpack_from(plain)
+        entry = self._entry_struct
+        if len(plain) != _INDEX_COUNT.size + count * entry.size: raise ValueError("Invalid manifest")
+        entries = [entry.unpack_from(plain, _INDEX_COUNT.size + i * entry.size) for i in range(count)]
+        if not self.header.codec: entries = [(*item, item[1]) for item in entries]
+        return entries
+
+    def _write_slot(self, sequence: int, offset: int, size: int):
+        """ 寫入slot(序號奇偶決定位置 不會覆蓋目前有效的slot) """
+        self.file.seek(self._slots_offset + (sequence % 2) * _SLOT.size)
+        self.file.write(_SLOT.pack(sequence, offset, size))
+
+    def commit(self, layout: Iterable[int|bytes|bytearray|memoryview]):
+        """ 以新的區塊順序提交(file需以r+b開啟) 
+        layout: 沿用的區塊編號 或新區塊的明文 新區塊與manifest附加在檔尾 fsync後才寫slot """
+        self.file.seek(0, os.SEEK_END)
+        offset = self.file.tell()
+        entries = []
+        for item in layout:
+            if isinstance(item, int):
+                entries.append(self.entries[item])
+                continue
+            data, entry = self._encrypt_chunk(item, offset)
+            self.file.write(data)
+            entries.append(entry)
+            offset += len(data)
+        sequence = self.sequence + 1
+        manifest = self._pack_manifest(entries, sequence)
+        self.file.write(manifest)
+        _sync(self.file)
+        self._write_slot(sequence, offset, len(manifest))
+        _sync(self.file)
+        self._set_entries(entries, sequence)
+
+    def compact(self, dst: BinaryIO) -> int:
+        """ 只複製有效區塊的密文到dst(空檔 通常配合atomic_write) 不需重新加密 回傳新的序號 """
+        dst.write(self.header.pack())
+        dst.write(bytes(2 * _SLOT.size))
+        offset = self._body_offset
+        entries = []
+        for old_offset, size, nonce, plain_size in self.entries:
+            self.file.seek(old_offset)
+            data = _read_exact(self.file, size + _TAG_SIZE)
+            if len(data) != size + _TAG_SIZE: raise ValueError("Truncated container")
+            dst.write(data)
+            entries.append((offset, size, nonce, plain_size))
+            offset += len(data)
+        sequence = self.sequence + 1
+        manifest = self._pack_manifest(entries, sequence)
+        dst.write(manifest)
+        dst.seek(self._slots_offset + (sequence % 2) * _SLOT.size)
+        dst.write(_SLOT.pack(sequence, offset, len(manifest)))
+        dst.seek(0, os.SEEK_END)
+        return sequence
+
+    @staticmethod
+    def is_indexed(head: bytes) -> bool:
+        """ 檔案開頭是否為v3容器 """
+        return len(head) > len(STREAM_MAGIC) and head[:len(STREAM_MAGIC)] == STREAM_MAGIC and head[len(STREAM_MAGIC)] == _INDEXED_VERSION
+
+    @staticmethod
+    def open(file: BinaryIO, password: str|bytes|bytearray) -> "IndexedContainer":
+        """ 開啟v3容器(file需可seek) 讀取最新且有效的manifest """
+        password = _ensure_bytes(password)
+        file.seek(0)
+        header = _Header.read(file)
+        if header.version != _INDEXED_VERSION: raise ValueError("Not an indexed container")
+        key = header.data_key(password)
+        del password
+        container = IndexedContainer(file, header, key, [])
+        slots = _read_exact(file, 2 * _SLOT.size)
+        if len(slots) != 2 * _SLOT.size: raise ValueError("Truncated container")
+        candidates = sorted((_SLOT.unpack_from(slots, i * _SLOT.size) for i in range(2)), reverse=True)
+        for sequence, offset, size in candidates:
+            if sequence == 0: continue
+            try: entries = container._load_manifest(offset, size, sequence)
+            except ValueError: continue # 寫入中斷的slot -> 用另一個
+            return IndexedContainer(file, header, key, entries, sequence)
+        container.close()
+        raise ValueError("No valid manifest")
+
+    @staticmethod
+    def create(file: BinaryIO, chunks: Iterable[bytes|bytearray|memoryview], password: str|bytes|bytearray,
+               chunk_size: int = STREAM_CHUNK_SIZE, salt: bytes|None = None, compression: str|None = None) -> int:
+        """ 把區塊寫成新的v3容器(file為空檔 通常配合atomic_write) 回傳明文長度
+        compression: COMPRESSIONS之一 每塊邊產生邊壓縮 不需整份明文在記憶體 (門檻由呼叫端判斷 見compression_for) """
+        password = _ensure_bytes(password)
+        if salt is None: salt = get_random_bytes(_salt_size)
+        key = bytearray(get_random_bytes(_DATA_KEY_SIZE))
+        header = _Header.new(chunk_size, salt, password, key, _INDEXED_VERSION, _codec_id(compression))
+        del password
+        with IndexedContainer(file, header, key, []) as container:
+            file.write(header.pack())
+            file.write(bytes(2 * _SLOT.size))
+            offset = container._body_offset
+            entries = []
+            for chunk in chunks:
+                data, entry = container._encrypt_chunk(chunk, offset)
+                file.write(data)
+                entries.append(entry)
+                offset += len(data)
+            manifest = container._pack_manifest(entries, 1)
+            file.write(manifest)
+            container._write_slot(1, offset, len(manifest))
+            file.seek(0, os.SEEK_END)
+            return sum(entry[3] for entry in entries)
+
+# 批次處理
+class BatchResult:
+    """ 批次處理中單一項目的結果(error不為None代表失敗) """
+    def __init__(self, index: int, item, value=None, error: BaseException|None = None):
+        self.index = index
+        self.item = item
+        self.value = value
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self) -> str:
+        return f"BatchResult(index={self.index}, ok={self.ok})"
+
+# 子行程內的密碼(由initializer傳入一次 不隨每個工作傳送)
+_worker_passwords: tuple[bytes, ...] = ()
+
+def _init_worker(params: Params, *passwords: bytes):
+    """ 行程池子行程初始化 """
+    global _worker_passwords
+    # fork啟動的子行程已繼承init狀態
+    try: already_init = yoCrypt_params() == params
+    except RuntimeError: already_init = False
+    if not already_init:
+        yoCrypt_init(*params[:4], key_cache_size=max(params[4], 4), kdf=params[5])
+        yoCrypt_set_kdf(params[5]) # spawn的子行程import主程式時可能已用別的kdf init(例如kdf.txt寫入失敗)
+    _worker_passwords = passwords
+
+def _load_item(item, paths: bool) -> tuple[bytes, str|None]:
+    """ 取得項目內容與輸出路徑 """
+    if not paths: return (item.encode("utf-8") if isinstance(item, str) else bytes(item)), None
+    src, dst = item if isinstance(item, tuple) else (item, None)
+    with open(src, "rb") as file:
+        return file.read(), dst
+
+def _store_result(data: bytes|bytearray, dst: str|None):
+    """ 有輸出路徑就(原子)寫檔並回傳路徑 否則回傳資料 """
+    if dst is None: return bytes(data)
+    atomic_write(dst, lambda file: file.write(data))
+    return dst
+
+def _batch_encrypt(item, paths: bool, chunk_size: int, salt: bytes):
+    data, dst = _load_item(item, paths)
+    return _store_result(yoAES.encrypt_bytes(data, _worker_passwords[0], chunk_size, salt), dst)
+
+def _batch_decrypt(item, paths: bool):
+    data, dst = _load_item(item, paths)
+    plain = yoAES.decrypt_auto(data, _worker_passwords[0])
+    try: return _store_result(plain, dst)
+    finally: _try_clear(plain)
+
+def _run_batch(func, items: Iterable, password: bytes, args: tuple, 
+               ordered: bool, max_workers: int|None, mp_context) -> Iterator[BatchResult]:
+    """ 以行程池執行批次工作 同時在途的工作數有上限(輸入可為很大的iterable) """
+    initargs = (yoCrypt_params(), password)
+    executor = ProcessPoolExecutor(max_workers, mp_context=mp_context, initializer=_init_worker, initargs=initargs)
+    limit = 2 * (max_workers or os.cpu_count() or 1)
+    pending: deque[tuple[int, object, Future]] = deque()
+    source = enumerate(items)
+    def submit() -> bool:
+        entry = next(source, None)
+        if entry is None: return False
+        index, item = entry
+        pending.append((index, item, executor.submit(func, item, *args)))
+        return True
+    def result(index: int, item, future: Future) -> BatchResult:
+        error = future.exception()
+        return BatchResult(index, item, None if error else future.result(), error)
+    try:
+        while len(pending) < limit and submit(): pass
+        while pending:
+            # 依輸入順序
+            if ordered:
+                index, item, future = pending.popleft()
+                yield result(index, item, future)
+            # 依完成順序
+            else:
+                done, _ = wait([future for _, _, future in pending], return_when=FIRST_COMPLETED)
+                for entry in [entry for entry in pending if entry[2] in done]:
+                    pending.remove(entry)
+                    yield result(*entry)
+            while len(pending) < limit and submit(): pass
+    finally: executor.shutdown(wait=True, cancel_futures=True)
+
 # 加密函數
 class yoAES:
     @staticmethod
-    def encrypt(plain_text: str, password: str|bytes|bytearray):
+    def new_salt() -> bytes:
+        """ 產生新的salt """
+        _ensure_init()
+        return get_random_bytes(_salt_size)
+
+    @staticmethod
+    def salt_of(encrypted: str|bytes) -> bytes:
+        """ 取出密文(容器或舊base64格式)的salt 存檔時傳回加密函數可重用快取的金鑰 """
+        if isinstance(encrypted, bytes) and yoAES.is_stream(encrypted):
+            return _Header.parse(memoryview(encrypted)).salt
+        # 舊格式: base64每4字元對應3位元組
+        return base64.b64decode(encrypted[:(_salt_size + 2) // 3 * 4])[:_salt_size]
+
+    @staticmethod
+    def compression_of(head: bytes) -> str:
+        """ 容器的壓縮方式(""為不壓縮 舊格式/v1/v2都不壓縮) """
+        if not yoAES.is_stream(head): return ""
+        return COMPRESSIONS[_Header.parse(memoryview(head)).codec]
+
+    @staticmethod
+    def is_stream(head: bytes) -> bool:
+        """ 檔案開頭是否為串流格式 """
+        return head[:len(STREAM_MAGIC)] == STREAM_MAGIC
+
+    @staticmethod
+    def encrypt_stream(src: BinaryIO, dst: BinaryIO, password: str|bytes|bytearray, 
+                       chunk_size: int = STREAM_CHUNK_SIZE, salt: bytes|None = None) -> int:
+        """ 從src分塊讀取明文 加密後寫入dst 回傳明文長度(記憶體用量固定) """
+        password = _ensure_bytes(password)
+        if salt is None: salt = get_random_bytes(_salt_size)
+        key = bytearray(get_random_bytes(_DATA_KEY_SIZE)) # 每個檔案自己的資料金鑰
+        header = _Header.new(chunk_size, salt, password, key)
+        _try_clear(password)
+        del password
+        dst.write(header.pack())
+        # 預讀下一塊 才知道哪一塊是最後一塊
+        total = 0
+        counter = 0
+        chunk = _read_exact(src, chunk_size)
+        try:
+            while True:
+                next_chunk = _read_exact(src, chunk_size) if len(chunk) == chunk_size else b""
+                last = not next_chunk
+                cipher = AES.new(key, AES.MODE_GCM, nonce=_chunk_nonce(header.prefix, counter, last))
+                cipher.update(header.aad)
+                cipher_text, tag = cipher.encrypt_and_digest(chunk)
+                dst.write(cipher_text)
+                dst.write(tag)
+                total += len(chunk)
+                if last: return total
+                counter += 1
+                chunk = next_chunk
+        finally: _try_clear(key)
+
+    @staticmethod
+    def decrypt_chunks(src: BinaryIO, password: str|bytes|bytearray) -> Iterator[bytes]:
+        """ 逐塊解密並驗證 產生明文區塊(v3需可seek) """
+        password = _ensure_bytes(password)
+        header = _Header.read(src)
+        if header.version == _INDEXED_VERSION:
+            with IndexedContainer.open(src, password) as container: yield from container
+            return
+        key = header.data_key(password)
+        _try_clear(password)
+        del password
+        block_size = header.chunk_size + _TAG_SIZE
+        counter = 0
+        block = _read_exact(src, block_size)
+        try:
+            while True:
+                if len(block) < _TAG_SIZE: raise ValueError("Truncated stream")
+                next_block = _read_exact(src, block_size) if len(block) == block_size else b""
+                last = not next_block
+                cipher = AES.new(key, AES.MODE_GCM, nonce=_chunk_nonce(header.prefix, counter, last))
+                cipher.update(header.aad)
+                yield cipher.decrypt_and_verify(block[:-_TAG_SIZE], block[-_TAG_SIZE:])
+                if last: return
+                counter += 1
+                block = next_block
+        finally: _try_clear(key)
+
+    @staticmethod
+    def decrypt_stream(src: BinaryIO, dst: BinaryIO, password: str|bytes|bytearray) -> int:
+        """ 從src分塊解密 寫入dst 回傳明文長度 """
+        total = 0
+        for chunk in yoAES.decrypt_chunks(src, password):
+            dst.write(chunk)
+            total += len(chunk)
+        return total
+
+    @staticmethod
+    def encrypt_bytes(plain_text: str|bytes, password: str|bytes|bytearray, 
+                      chunk_size: int = STREAM_CHUNK_SIZE, salt: bytes|None = None) -> bytes:
+        """ 加密成二進位容器(格式同encrypt_stream) """
+        if isinstance(plain_text, str): plain_text = plain_text.encode("utf-8")
+        dst = io.BytesIO()
+        yoAES.encrypt_stream(io.BytesIO(plain_text), dst, password, chunk_size, salt)
+        return dst.getvalue()
+
+    @staticmethod
+    def encrypt_indexed(plain_text: str|bytes, password: str|bytes|bytearray, 
+                        chunk_size: int = STREAM_CHUNK_SIZE, salt: bytes|None = None, compression: str|None = None) -> bytes:
+        """ 加密成可隨機存取的容器(v3 格式見IndexedContainer) 區塊切在換行處
+        compression: 壓縮方式 明文小於COMPRESS_MIN_SIZE時自動不壓縮 """
+        if isinstance(plain_text, str): plain_text = plain_text.encode("utf-8")
+        dst = io.BytesIO()
+        IndexedContainer.create(dst, split_chunks(plain_text, chunk_size), password, chunk_size, salt, 
+                                compression_for(len(plain_text), compression))
+        return dst.getvalue()
+
+    @staticmethod
+    def decrypt_bytes(data: bytes|bytearray|memoryview, password: str|bytes|bytearray) -> bytearray:
+        """ 解密整個二進位容器 以memoryview切片 直接解密到預先配置的緩衝區 """
+        password = _ensure_bytes(password)
+        view = memoryview(data)
+        header = _Header.parse(view)
+        if header.version == _INDEXED_VERSION:
+            with IndexedContainer.open(io.BytesIO(view), password) as container:
+                plain = bytearray(container.size)
+                for index, chunk in enumerate(container):
+                    plain[container.chunk_start(index):container.chunk_start(index)+len(chunk)] = chunk
+                return plain
+        key = header.data_key(password)
+        _try_clear(password)
+        del password
+        body = view[header.size:]
+        block_size = header.chunk_size + _TAG_SIZE
+        count = max(1, -(-len(body) // block_size))
+        if len(body) - (count-1) * block_size < _TAG_SIZE: raise ValueError("Truncated stream")
+        plain = bytearray(len(body) - count * _TAG_SIZE)
+        out = memoryview(plain)
+        position = 0
+        try:
+            for counter in range(count):
+                block = body[counter * block_size:(counter+1) * block_size]
+                size = len(block) - _TAG_SIZE
+                cipher = AES.new(key, AES.MODE_GCM, nonce=_chunk_nonce(header.prefix, counter, counter == count-1))
+                cipher.update(header.aad)
+                cipher.decrypt(block[:size], output=out[position:position+size])
+                cipher.verify(block[size:])
+                position += size
+        except Exception:
+            # 驗證失敗 不留下未驗證的明文
+            out.release()
+            _try_clear(plain)
+            raise
+        finally: _try_clear(key)
+        out.release()
+        return plain
+
+    @staticmethod
+    def decrypt_auto(data: bytes, password: str|bytes|bytearray) -> bytearray:
+        """ 自動辨識二進位容器/舊base64格式並解密 回傳明文位元組 """
+        if yoAES.is_stream(data): return yoAES.decrypt_bytes(data, password)
+        return bytearray(yoAES.decrypt(data, password), "utf-8")
+
+    @staticmethod
+    def rewrap(file: BinaryIO, old_password: str|bytes|bytearray, new_password: str|bytes|bytearray, salt: bytes|None = None) -> bool:
+        """ 只重寫key block以更換密碼(file需以r+b開啟) 寫入後fsync
+        舊格式或header長度會改變時回傳False 由呼叫端完整重新加密
+        原地覆寫header 寫到一半中斷時整個檔案無法解密: 只能用在暫存的複本上(如RekeyJob) 確定成功後再rename覆蓋原檔 """
+        old_password = _ensure_bytes(old_password)
+        new_password = _ensure_bytes(new_password)
+        is_container = yoAES.is_stream(file.read(len(STREAM_MAGIC)))
+        file.seek(0)
+        if not is_container: return False
+        header = _Header.read(file)
+        if header.version < 2: return False
+        key = header.data_key(old_password)
+        try:
+            new_header = _Header(header.version, header.chunk_size, header.prefix, _kdf, salt or get_random_bytes(_salt_size), codec=header.codec)
+            new_header.wrap(new_password, key)
+        finally: _try_clear(key)
+        if new_header.size != header.size: return False
+        file.seek(0)
+        file.write(new_header.pack())
+        _sync(file)
+        return True
+
+    @staticmethod
+    def encrypt_many(items: Iterable, password: str|bytes|bytearray, paths: bool = False, ordered: bool = True,
+                     max_workers: int|None = None, mp_context=None, chunk_size: int = STREAM_CHUNK_SIZE, 
+                     salt: bytes|None = None) -> Iterator[BatchResult]:
+        """ 以行程池批次加密 產生BatchResult(單一項目失敗不會中斷批次)
+        items: 明文(str/bytes) 或 paths=True時為路徑/(來源, 輸出)路徑
+        整批共用一個salt 每個子行程只需衍生一次KEK """
+        _ensure_init()
+        if salt is None: salt = get_random_bytes(_salt_size)
+        return _run_batch(_batch_encrypt, items, _ensure_bytes(password), (paths, chunk_size, salt), ordered, max_workers, mp_context)
+
+    @staticmethod
+    def decrypt_many(items: Iterable, password: str|bytes|bytearray, paths: bool = False, ordered: bool = True,
+                     max_workers: int|None = None, mp_context=None) -> Iterator[BatchResult]:
+        """ 以行程池批次解密(自動辨識格式) 產生BatchResult """
+        _ensure_init()
+        return _run_batch(_batch_decrypt, items, _ensure_bytes(password), (paths,), ordered, max_workers, mp_context)
+
+    @staticmethod
+    def encrypt(plain_text: str, password: str|bytes|bytearray, salt: bytes|None = None):
+        """ 舊base64格式(只為相容保留 新檔案用encrypt_bytes/encrypt_indexed)
+        內容的金鑰直接由(password, salt)衍生: salt必須每個檔案不同 不可傳入多個檔案共用的salt """
         password = _ensure_bytes(password)
-        salt = get_random_bytes(_salt_size)
-        key = PBKDF2(password, salt, dkLen=_hash_len, count=_count)
+        if salt is None: salt = get_random_bytes(_salt_size)
+        key = _derive_key(password, salt, _hash_len, PBKDF2_KDF(_count, "sha1"))
         _try_clear(password)
         del password
         cipher = AES.new(key, AES.MODE_GCM)
@@ -75,11 +894,12 @@ class yoAES:
         encrypted_data = base64.b64encode(salt + cipher.nonce + tag + cipher_text).decode('utf-8')
         return encrypted_data
     @staticmethod
-    def decrypt(encrypted_text: str, password: str|bytes|bytearray):
+    def decrypt(encrypted_text: str|bytes, password: str|bytes|bytearray):
         password = _ensure_bytes(password)
-        data = base64.b64decode(encrypted_text)
-        salt, nonce, tag, cipher_text = data[:16], data[16:32], data[32:48], data[48:]
-        key = PBKDF2(password, salt, dkLen=32, count=_count)
+        data = memoryview(base64.b64decode(encrypted_text))
+        nonce_end = _salt_size + 16
+        salt, nonce, tag, cipher_text = data[:_salt_size], data[_salt_size:nonce_end], data[nonce_end:nonce_end+16], data[nonce_end+16:]
+        key = _derive_key(password, bytes(salt), _hash_len, PBKDF2_KDF(_count, "sha1"))
         _try_clear(password)
         del password
         cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
@@ -0,0 +1,130 @@
+from concurrent.futures import ProcessPoolExecutor, Future
+from . import yoCrypt
+from .yoCrypt import yoCrypt_params, yoAES, _try_clear, _init_worker
+from .yoJournal import JOURNAL_SUFFIX, journal_path, read_journal
+from .yoSearch import iter_matches
+from .yoText import utf16_len, decode_plain, replay_journal
+import re
+import os
+
+# 在資料夾中搜尋(含加密檔): 每個檔案在行程池中讀取/解密(有日誌時重播)後搜尋 結果依完成順序取回
+MAX_FILE_HITS = 1000  # 每個檔案最多回傳的結果數
+SNIPPET_CHARS = 200   # 結果所在行最多顯示的字數
+
+Hit = tuple[int, int, int, str] # (行(0起算), 行內的起點, 終點(UTF-16位置 同QTextDocument), 該行的片段)
+
+_LEGACY = re.compile(rb"[A-Za-z0-9+/=\s]+") # 舊base64格式的加密檔
+
+def list_files(root: str) -> list[str]:
+    """ root之下(含子資料夾)要搜尋的檔案 不含日誌/暫存檔(.tmp)/password.txt """
+    file_paths = []
+    for folder, folders, names in os.walk(root):
+        folders.sort()
+        file_paths += [os.path.join(folder, name) for name in sorted(names)
+                       if name != "password.txt" and not name.endswith((JOURNAL_SUFFIX, ".tmp"))]
+    return file_paths
+
+def read_text(file_path: str, password: bytes|bytearray|None, encodings: tuple[str, ...] = ("utf-8",)) -> tuple[str, bool]:
+    """ 讀取檔案的內容(同開啟到分頁: 加密檔解密 有對應的日誌時重播) 回傳(文字, 是否為加密檔)
+    加密檔沒有password時ValueError 看似舊格式但無法解密的當成普通檔案 """
+    with open(file_path, "rb") as file: data = file.read()
+    encrypted = yoAES.is_stream(data)
+    legacy = not encrypted and password is not None and _LEGACY.fullmatch(data) is not None
+    plain = None
+    if encrypted or legacy:
+        if password is None: raise ValueError("加密檔需要密碼")
+        try: plain = yoAES.decrypt_auto(data, password)
+        except Exception:
+            if encrypted: raise
+    if plain is None: text = decode_plain(data, encodings)[0]
+    else:
+        encrypted = True
+        try: text = plain.decode("utf-8")
+        finally: _try_clear(plain)
+    # 日誌與檔案相符時重播(不符時開啟也不會套用)
+    path = journal_path(file_path)
+    if os.path.exists(path):
+        stat = os.stat(file_path)
+        stamp, journal_encrypted, records, _ = read_journal(path, password if encrypted else None)
+        if journal_encrypted == encrypted and stamp == (stat.st_size, stat.st_mtime_ns):
+            try: text = replay_journal(text, records)
+            except ValueError: pass
+    return text, encrypted
+
+def _search_file(file_path: str, pattern: re.Pattern[str], encodings: tuple[str, ...]) -> tuple[bool, list[Hit]]:
+    """ (子行程)搜尋一個檔案 回傳(是否為加密檔, 結果) 最多MAX_FILE_HITS個 """
+    password = yoCrypt._worker_passwords[0] if yoCrypt._worker_passwords else None
+    text, encrypted = read_text(file_path, password, encodings)
+    hits: list[Hit] = []
+    line, counted = 0, 0
+    for match in iter_matches(text, pattern):
+        first, last = match.span()
+        line += text.count("\n", counted, first)
+        counted = first
+        line_start = text.rfind("\n", 0, first) + 1
+        line_end = text.find("\n", first)
+        if line_end < 0: line_end = len(text)
+        snippet_start = max(line_start, first - SNIPPET_CHARS // 4)
+        snippet = ("…" if snippet_start > line_start else "") + text[snippet_start:min(line_end, snippet_start + SNIPPET_CHARS)]
+        start = utf16_len(text[line_start:first])
+        hits.append((line, start, start + utf16_len(text[first:last]), snippet))
+        if len(hits) >= MAX_FILE_HITS: break
+    return encrypted, hits
+
+class FindFilesJob:
+    """ 平行搜尋多個檔案(加密檔以password解密)
+    以results()取回已完成的檔案(依完成順序 可邊搜尋邊顯示) cancel()取消尚未開始的檔案 """
+    def __init__(self, file_paths: list[str], pattern: re.Pattern[str], password: bytes|bytearray|None = None,
+                 encodings: tuple[str, ...] = ("utf-8",), max_workers: int|None = None):
+        self.file_paths = list(file_paths)
+        self.pattern = pattern
+        self.encodings = encodings
+        self.max_workers = max_workers
+        self._password = None if not password else bytearray(password)
+        self._executor: ProcessPoolExecutor|None = None
+        self._futures: dict[Future, str] = {}
+        self._collected = 0
+
+    @property
+    def total(self) -> int:
+        return len(self.file_paths)
+
+    @property
+    def done_count(self) -> int:
+        return self._collected
+
+    def is_done(self) -> bool:
+        return self._collected == self.total
+
+    def start(self):
+        """ 送出所有檔案到行程池 """
+        if not self.file_paths: return
+        initargs = (yoCrypt_params(),) + (() if self._password is None else (bytes(self._password),))
+        self._executor = ProcessPoolExecutor(self.max_workers, initializer=_init_worker, initargs=initargs)
+        self._futures = {self._executor.submit(_search_file, path, self.pattern, self.encodings): path for path in self.file_paths}
+
+    def results(self) -> list[tuple[str, bool, list[Hit], BaseException|None]]:
+        """ 上次取回之後完成的檔案: [(路徑, 是否為加密檔, 結果, 錯誤)] 全部取回後關閉行程池 """
+        done = [future for future in self._futures if future.done()]
+        results = []
+        for future in done:
+            path = self._futures.pop(future)
+            error = None if future.cancelled() else future.exception()
+            if future.cancelled() or error is not None: results.append((path, False, [], error))
+            else: results.append((path, *future.result(), None))
+        self._collected += len(done)
+        if self._executor is not None and not self._futures: self._shutdown(wait=True)
+        return results
+
+    def _shutdown(self, wait: bool):
+        """ 關閉行程池並清除密碼 """
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+        if self._password is not None: _try_clear(self._password)
+
+    def cancel(self):
+        """ 取消尚未開始的檔案(搜尋中的檔案在背景結束 結果不再取回) """
+        self._futures.clear()
+        self._collected = self.total
+        self._shutdown(wait=False)
@@ -0,0 +1,126 @@
+from .yoCrypt import yoAES
+from .utils import atomic_write
+from typing import BinaryIO
+import struct
+import zlib
+import io
+import os
+
+# 附加式的編輯日誌(<檔案>.yoj): 存檔時只附加這次的變更 開啟時重播 base + 日誌
+# header: magic, 版本, flags, base檔的(大小, mtime_ns) base被改寫後日誌就不再適用
+# record: (payload長度, crc32) + payload 最後一筆寫到一半(當機)時讀取到前一筆為止
+# payload: 操作數 + 每個操作(位置, 刪除長度, 文字位元組數)+utf-8文字 + 套用後的文件長度 加密日誌的payload為yoAES容器
+# 位置與長度都是UTF-16單位(同QTextDocument)
+JOURNAL_SUFFIX = ".yoj"
+_MAGIC = b"\x00yoJ"
+_VERSION = 1
+_FLAG_ENCRYPTED = 1
+_HEADER = struct.Struct(">4sBBQQ")   # magic, version, flags, base_size, base_mtime_ns
+_RECORD = struct.Struct(">II")       # payload_size, crc32
+_COUNT = struct.Struct(">I")
+_OP = struct.Struct(">QQI")          # position, removed, text_size
+_LENGTH = struct.Struct(">Q")
+
+Op = tuple[int, int, str] # (位置, 刪除長度, 插入的文字)
+
+def journal_path(file_path: str) -> str:
+    """ file_path的日誌檔 """
+    return file_path + JOURNAL_SUFFIX
+
+def is_journal(head: bytes) -> bool:
+    """ 檔案開頭是否為日誌 """
+    return head[:len(_MAGIC)] == _MAGIC
+
+def create_journal(path: str, stamp: tuple[int, int], encrypted: bool) -> int:
+    """ 原子寫入只有header的日誌(對應大小/mtime為stamp的base檔) 回傳有效結尾 """
+    header = _HEADER.pack(_MAGIC, _VERSION, _FLAG_ENCRYPTED if encrypted else 0, *stamp)
+    atomic_write(path, lambda file: file.write(header))
+    return _HEADER.size
+
+def journal_stamp(path: str) -> tuple[int, int]:
+    """ 日誌對應的base檔stamp(不讀取record) """
+    with open(path, "rb") as file: head = file.read(_HEADER.size)
+    if len(head) < _HEADER.size or not is_journal(head): raise ValueError("Not a journal")
+    return _HEADER.unpack(head)[3:]
+
+def restamp_journal(path: str, stamp: tuple[int, int]):
+    """ base檔只是重新包裝(內容不變)時 更新日誌對應的stamp """
+    with open(path, "r+b") as file:
+        magic, version, flags, *_ = _HEADER.unpack(file.read(_HEADER.size))
+        file.seek(0)
+        file.write(_HEADER.pack(magic, version, flags, *stamp))
+        file.flush()
+        os.fsync(file.fileno())
+
+def pack_record(ops: list[Op], length: int, password: bytes|bytearray|None = None, salt: bytes|None = None) -> bytes:
+    """ 一次存檔的操作 -> record(length: 套用後的文件長度 供重播時驗證) password: 加密日誌 """
+    parts = [_COUNT.pack(len(ops))]
+    for position, removed, text in ops:
+        data = text.encode("utf-8", "surrogatepass")
+        parts += [_OP.pack(position, removed, len(data)), data]
+    parts.append(_LENGTH.pack(length))
+    payload = b"".join(parts)
+    if password is not None: payload = yoAES.encrypt_bytes(payload, password, salt=salt)
+    return _RECORD.pack(len(payload), zlib.crc32(payload)) + payload
+
+def _unpack_payload(payload: bytes) -> tuple[list[Op], int]:
+    view = memoryview(payload)
+    (count,), position = _COUNT.unpack_from(view), _COUNT.size
+    ops: list[Op] = []
+    for _ in range(count):
+        start, removed, size = _OP.unpack_from(view, position)
+        position += _OP.size
+        ops.append((start, removed, str(view[position:position+size], "utf-8", "surrogatepass")))
+        position += size
+    (length,) = _LENGTH.unpack_from(view, position)
+    if position + _LENGTH.size != len(view): raise ValueError("Corrupted journal record")
+    return ops, length
+
+def _read_records(file: BinaryIO) -> tuple[tuple[int, int, int], list[bytes], int]:
+    """ (header的(flags, stamp), 完整的payload, 有效結尾) 尾端寫到一半的record不算 """
+    head = file.read(_HEADER.size)
+    if len(head) < _HEADER.size or not is_journal(head): raise ValueError("Not a journal")
+    _, version, flags, base_size, base_mtime = _HEADER.unpack(head)
+    if version != _VERSION: raise ValueError(f"Unsupported journal version: {version}")
+    payloads, end = [], _HEADER.size
+    while len(prefix := file.read(_RECORD.size)) == _RECORD.size:
+        size, crc = _RECORD.unpack(prefix)
+        payload = file.read(size)
+        if len(payload) < size or zlib.crc32(payload) != crc: break
+        payloads.append(payload)
+        end += _RECORD.size + size
+    return (flags, base_size, base_mtime), payloads, end
+
+def read_journal(path: str, password: bytes|bytearray|None = None) -> tuple[tuple[int, int], bool, list[tuple[list[Op], int]], int]:
+    """ 讀取日誌 回傳(base的stamp, 是否加密, [(操作, 套用後的文件長度)], 有效結尾)
+    加密日誌需要password(驗證失敗時ValueError) 有效結尾之後為寫到一半的record 下次附加時截掉 """
+    with open(path, "rb") as file: (flags, *stamp), payloads, end = _read_records(file)
+    encrypted = bool(flags & _FLAG_ENCRYPTED)
+    if encrypted and password is None: raise ValueError("Encrypted journal needs a password")
+    records = [_unpack_payload(bytes(yoAES.decrypt_bytes(payload, password)) if encrypted else payload) # pyright: ignore[reportArgumentType]
+               for payload in payloads]
+    return (stamp[0], stamp[1]), encrypted, records, end
+
+def append_record(path: str, record: bytes, end: int) -> int:
+    """ 在有效結尾(截掉之後寫到一半的部分)附加record並fsync 回傳新的有效結尾 """
+    with open(path, "r+b") as file:
+        file.seek(end)
+        file.truncate()
+        file.write(record)
+        file.flush()
+        os.fsync(file.fileno())
+    return end + len(record)
+
+def rewrap_journal(src: BinaryIO, dst: BinaryIO, old_password: bytes|bytearray, new_password: bytes|bytearray, salt: bytes|None = None):
+    """ 更換加密日誌的密碼(每筆只重寫key block) 寫到dst 寫到一半的record捨棄 """
+    src.seek(0)
+    header = src.read(_HEADER.size)
+    src.seek(0)
+    (flags, *_), payloads, _ = _read_records(src)
+    dst.write(header)
+    for payload in payloads:
+        if flags & _FLAG_ENCRYPTED:
+            buffer = io.BytesIO(payload)
+            if not yoAES.rewrap(buffer, old_password, new_password, salt): raise ValueError("Unsupported journal record")
+            payload = buffer.getvalue()
+        dst.write(_RECORD.pack(len(payload), zlib.crc32(payload)) + payload)
@@ -0,0 +1,144 @@
+from Crypto.Protocol.KDF import PBKDF2
+from Crypto.Hash import SHA1, SHA256
+from abc import abstractmethod, ABCMeta
+import hashlib
+import time
+import os
+
+# 容器header中的kdf編號
+KDF_PBKDF2_SHA256 = 1
+KDF_SCRYPT = 2
+
+class KDF(metaclass=ABCMeta):
+    """ 金鑰衍生函數的基底(參數記錄在雜湊字串與容器header) """
+    kdf_id: int = 0
+
+    @abstractmethod
+    def derive(self, password: bytes, salt: bytes, dk_len: int) -> bytes: pass
+
+    @abstractmethod
+    def to_string(self) -> str:
+        """ 例: pbkdf2_sha256$360000 / scrypt$16384$8$1 """
+
+    @property
+    @abstractmethod
+    def cost(self) -> int:
+        """ 容器header中的u32成本欄位 """
+
+    @property
+    @abstractmethod
+    def work(self) -> int:
+        """ 相對工作量(比較強弱用) """
+
+    def weaker_than(self, other: "KDF") -> bool:
+        """ 演算法不同或工作量較低 """
+        return type(self) is not type(other) or self.work < other.work
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, KDF) and self.to_string() == other.to_string()
+
+    def __hash__(self) -> int:
+        return hash(self.to_string())
+
+    def __repr__(self) -> str:
+        return f"KDF({self.to_string()})"
+
+    @staticmethod
+    def from_string(text: str) -> "KDF":
+        """ 由to_string()的格式還原 """
+        algo, *params = text.strip().split("$")
+        if algo.startswith("pbkdf2_") and len(params) == 1:
+            return PBKDF2_KDF(int(params[0]), algo[len("pbkdf2_"):])
+        if algo == "scrypt" and len(params) == 3:
+            return Scrypt_KDF(*(int(param) for param in params))
+        raise ValueError(f"Unsupported algorithm: {algo}")
+
+    @staticmethod
+    def from_header(kdf_id: int, cost: int) -> "KDF":
+        """ 由容器header的(kdf編號, 成本欄位)還原 """
+        if kdf_id == KDF_PBKDF2_SHA256: return PBKDF2_KDF(cost, "sha256")
+        if kdf_id == KDF_SCRYPT: return Scrypt_KDF(1 << (cost >> 24), (cost >> 8) & 0xFFFF, cost & 0xFF)
+        raise ValueError(f"Unsupported kdf: {kdf_id}")
+
+class PBKDF2_KDF(KDF):
+    """ PBKDF2-HMAC(sha256, 舊base64格式為sha1) """
+    kdf_id = KDF_PBKDF2_SHA256
+    _hash_modules = {"sha1": SHA1, "sha256": SHA256}
+
+    def __init__(self, iterations: int, hash_name: str = "sha256"):
+        if hash_name not in self._hash_modules: raise ValueError(f"Unsupported hash: {hash_name}")
+        if iterations <= 0: raise ValueError("iterations must be positive")
+        self.iterations = iterations
+        self.hash_name = hash_name
+
+    def derive(self, password: bytes, salt: bytes, dk_len: int) -> bytes:
+        return PBKDF2(password, salt, dkLen=dk_len, count=self.iterations, hmac_hash_module=self._hash_modules[self.hash_name])
+
+    def to_string(self) -> str:
+        return f"pbkdf2_{self.hash_name}${self.iterations}"
+
+    @property
+    def cost(self) -> int:
+        if self.hash_name != "sha256": raise ValueError("only pbkdf2_sha256 can be stored in a container header")
+        return self.iterations
+
+    @property
+    def work(self) -> int:
+        return self.iterations
+
+    def weaker_than(self, other: KDF) -> bool:
+        return super().weaker_than(other) or self.hash_name != getattr(other, "hash_name", None)
+
+class Scrypt_KDF(KDF):
+    """ hashlib.scrypt (記憶體困難) """
+    kdf_id = KDF_SCRYPT
+    # 固定的上限(header的值不可信 不能由header決定可用的記憶體)
+    MAX_LOG2_N = 24
+    MAX_R = 32
+    MAX_P = 16
+    MAX_MEMORY = 1 << 30 # 128*r*n*p
+    _MAXMEM = MAX_MEMORY + (1 << 20) # 傳給hashlib的上限(含p個區塊的額外空間)
+
+    def __init__(self, n: int = 1 << 14, r: int = 8, p: int = 1):
+        if n < 2 or n & (n-1) or n.bit_length()-1 > self.MAX_LOG2_N: raise ValueError(f"Invalid scrypt n: {n}")
+        if not (0 < r <= self.MAX_R) or not (0 < p <= self.MAX_P): raise ValueError(f"Invalid scrypt r/p: {r}/{p}")
+        if 128 * r * n * p > self.MAX_MEMORY: raise ValueError(f"scrypt parameters need too much memory: {n}/{r}/{p}")
+        self.n = n
+        self.r = r
+        self.p = p
+
+    def derive(self, password: bytes, salt: bytes, dk_len: int) -> bytes:
+        return hashlib.scrypt(password, salt=salt, n=self.n, r=self.r, p=self.p, maxmem=self._MAXMEM, dklen=dk_len)
+
+    def to_string(self) -> str:
+        return f"scrypt${self.n}${self.r}${self.p}"
+
+    @property
+    def cost(self) -> int:
+        return ((self.n.bit_length()-1) << 24) | (self.r << 8) | self.p
+
+    @property
+    def work(self) -> int:
+        return self.n * self.r * self.p
+
+def _time_kdf(kdf: KDF) -> float:
+    """ 執行一次kdf的秒數 """
+    start = time.perf_counter()
+    kdf.derive(b"calibration", os.urandom(16), 32)
+    return time.perf_counter() - start
+
+def calibrate_kdf(kind: str = "pbkdf2", target_ms: float = 250, minimum: KDF|None = None) -> KDF:
+    """ 依本機速度挑選約target_ms毫秒的參數 不低於minimum(預設pbkdf2 36萬次/scrypt n=2^14) """
+    target = target_ms / 1000
+    if kind == "pbkdf2":
+        probe = PBKDF2_KDF(20000)
+        iterations = int(probe.iterations * target / _time_kdf(probe)) // 1000 * 1000
+        kdf: KDF = PBKDF2_KDF(max(iterations, 1000))
+        minimum = minimum or PBKDF2_KDF(360000, "sha256")
+    elif kind == "scrypt":
+        probe = Scrypt_KDF(1 << 14)
+        scale = max(1, int(target / _time_kdf(probe)))
+        kdf = Scrypt_KDF(min(1 << (14 + scale.bit_length()-1), 1 << 20))
+        minimum = minimum or Scrypt_KDF(1 << 14)
+    else: raise ValueError(f"Unsupported kdf kind: {kind}")
+    return minimum if kdf.weaker_than(minimum) else kdf
@@ -0,0 +1,157 @@
+from concurrent.futures import ProcessPoolExecutor, Future
+from . import yoCrypt
+from .yoCrypt import yoCrypt_params, yoAES, _try_clear, _init_worker
+from .yoJournal import is_journal, rewrap_journal, restamp_journal
+from .utils import fsync_dir
+from typing import Iterable
+import shutil
+import json
+import io
+import os
+
+TEMP_SUFFIX = ".rekey.tmp"
+
+# 提交紀錄: 所有暫存檔都寫好後才寫入 列出要改名的檔案與要更新stamp的日誌 全部完成後才刪除
+# 啟動時(recover_rekey)有紀錄就完成提交(不會一部分新密碼一部分舊密碼) 沒有就刪除中斷留下的暫存檔
+
+def _fsync_write(temp_path: str, write):
+    """ 寫入暫存檔並fsync """
+    with open(temp_path, "wb") as file:
+        write(file)
+        file.flush()
+        os.fsync(file.fileno())
+
+def _rekey_to_temp(file_path: str, salt: bytes) -> str:
+    """ 以新密碼把file_path寫到暫存檔 回傳暫存檔路徑(原檔不動) """
+    temp_path = file_path + TEMP_SUFFIX
+    old_password, new_password = yoCrypt._worker_passwords
+    try:
+        # 編輯日誌: 每筆record只重寫header
+        with open(file_path, "rb") as file:
+            if is_journal(file.read(4)):
+                _fsync_write(temp_path, lambda dst: rewrap_journal(file, dst, old_password, new_password, salt))
+                return temp_path
+        # 信封格式: 複製後只重寫header
+        shutil.copyfile(file_path, temp_path)
+        with open(temp_path, "r+b") as file:
+            if yoAES.rewrap(file, old_password, new_password, salt): return temp_path
+        # 舊格式: 解密後以信封格式重新加密
+        with open(file_path, "rb") as file:
+            plain = yoAES.decrypt_auto(file.read(), old_password)
+        try: _fsync_write(temp_path, lambda file: yoAES.encrypt_stream(io.BytesIO(plain), file, new_password, salt=salt))
+        finally: _try_clear(plain)
+        return temp_path
+    except BaseException:
+        if os.path.exists(temp_path): os.remove(temp_path)
+        raise
+
+def _stamp(file_path: str) -> tuple[int, int]:
+    stat = os.stat(file_path)
+    return stat.st_size, stat.st_mtime_ns
+
+def _roll_forward(file_paths: Iterable[str], restamps: Iterable[tuple[str, str]]):
+    """ 把(還在的)暫存檔改名覆蓋原檔 再把日誌的stamp更新為對應檔案目前的stamp 可重複執行 """
+    file_paths = list(file_paths)
+    for path in file_paths:
+        if os.path.exists(path + TEMP_SUFFIX): os.replace(path + TEMP_SUFFIX, path)
+    for journal, base in restamps:
+        if os.path.exists(journal) and os.path.exists(base): restamp_journal(journal, _stamp(base))
+    for directory in {os.path.dirname(os.path.abspath(path)) for path in file_paths}: fsync_dir(directory)
+
+def recover_rekey(log_path: str, folders: Iterable[str]) -> bool:
+    """ 啟動時處理中斷的重新加密: 有提交紀錄時完成提交(回傳True) 
+    之後刪除folders中留下的暫存檔(沒有紀錄代表還沒提交 原檔都還是舊密碼) """
+    recovered = os.path.exists(log_path)
+    if recovered:
+        with open(log_path, "r", encoding="utf-8") as file: log = json.load(file)
+        _roll_forward(log["files"], [tuple(pair) for pair in log["restamps"]])
+        os.remove(log_path)
+        fsync_dir(os.path.dirname(os.path.abspath(log_path)))
+    for folder in folders:
+        if not os.path.isdir(folder): continue
+        for name in os.listdir(folder):
+            if name.endswith(TEMP_SUFFIX): os.remove(os.path.join(folder, name))
+    return recovered
+
+class RekeyJob:
+    """ 平行 交易式的重新加密
+    每個檔案先寫到暫存檔 全部成功才commit()以rename覆蓋原檔 否則rollback()刪除暫存檔 
+    extra: 一起提交的其他檔案內容(例如新的密碼雜湊) restamps: 提交後要更新stamp的(日誌, 對應的檔案)
+    log_path: 提交紀錄 改名途中中斷時由recover_rekey完成提交 """
+    def __init__(self, file_paths: list[str], old_password: bytes|bytearray, new_password: bytes|bytearray, 
+                 salt: bytes, max_workers: int|None = None, extra: dict[str, bytes]|None = None,
+                 restamps: list[tuple[str, str]]|None = None, log_path: str|None = None):
+        self.file_paths = list(file_paths)
+        self.salt = salt
+        self.max_workers = max_workers
+        self.extra = dict(extra or {})
+        self.restamps = list(restamps or [])
+        self.log_path = log_path
+        self.committed = False # 已寫入提交紀錄(之後中斷也會由recover_rekey完成)
+        self._old_password = bytearray(old_password)
+        self._new_password = bytearray(new_password)
+        self._executor: ProcessPoolExecutor|None = None
+        self._futures: dict[str, Future] = {}
+
+    @property
+    def total(self) -> int:
+        return len(self.file_paths)
+
+    @property
+    def done_count(self) -> int:
+        return sum(future.done() for future in self._futures.values())
+
+    def is_done(self) -> bool:
+        return self.done_count == self.total
+
+    def errors(self) -> dict[str, BaseException]:
+        """ 已失敗的檔案與錯誤 """
+        return {path: future.exception() for path, future in self._futures.items() # type: ignore
+                if future.done() and not future.cancelled() and future.exception() is not None}
+
+    def start(self):
+        """ 送出所有檔案到行程池 """
+        if not self.file_paths: return
+        initargs = (yoCrypt_params(), bytes(self._old_password), bytes(self._new_password))
+        self._executor = ProcessPoolExecutor(self.max_workers, initializer=_init_worker, initargs=initargs)
+        self._futures = {path: self._executor.submit(_rekey_to_temp, path, self.salt) for path in self.file_paths}
+
+    def _shutdown(self):
+        """ 關閉行程池並清除密碼 """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        _try_clear(self._old_password)
+        _try_clear(self._new_password)
+
+    def skip(self, path: str):
+        """ 所有檔案結束後 把(失敗的)檔案移出這次工作: 不提交 原檔維持舊密碼 也不更新相關日誌的stamp """
+        if not self.is_done(): raise RuntimeError("RekeyJob is still running")
+        self.file_paths.remove(path)
+        self._futures.pop(path, None)
+        self.restamps = [(journal, base) for journal, base in self.restamps if path not in (journal, base)]
+        if os.path.exists(path + TEMP_SUFFIX): os.remove(path + TEMP_SUFFIX)
+
+    def commit(self):
+        """ 全部成功後: 寫入extra的暫存檔與提交紀錄 以rename覆蓋原檔 更新日誌的stamp 最後刪除紀錄 """
+        if not self.is_done() or self.errors(): raise RuntimeError("RekeyJob is not finished successfully")
+        self._shutdown()
+        for path, data in self.extra.items(): _fsync_write(path + TEMP_SUFFIX, lambda file, data=data: file.write(data))
+        targets = self.file_paths + list(self.extra)
+        if self.log_path is not None:
+            log = json.dumps({"files": targets, "restamps": self.restamps}).encode("utf-8")
+            _fsync_write(self.log_path + TEMP_SUFFIX, lambda file: file.write(log))
+            os.replace(self.log_path + TEMP_SUFFIX, self.log_path)
+            fsync_dir(os.path.dirname(os.path.abspath(self.log_path)))
+        self.committed = True
+        _roll_forward(targets, self.restamps)
+        if self.log_path is not None:
+            os.remove(self.log_path)
+            fsync_dir(os.path.dirname(os.path.abspath(self.log_path)))
+
+    def rollback(self):
+        """ 取消尚未開始的工作 刪除所有暫存檔 原檔保持不變 """
+        self._shutdown()
+        for path in self.file_paths + list(self.extra):
+            temp_path = path + TEMP_SUFFIX
+            if os.path.exists(temp_path): os.remove(temp_path)
@@ -0,0 +1,261 @@
+from typing import Callable, Iterator
+from array import array
+import functools
+import bisect
+import re
+
+_SCAN_SIZE = 16 << 20 # 每次複製出來計算/搜尋的大小(mmap沒有count 也不要一次複製整份)
+_TEXT_SEGMENT = 1 << 20 # MatchIndex.scan每段的字數(之間可取消/回報進度)
+
+class LineIndex:
+    """ 稀疏的行索引(bytes或mmap) 每block個位元組記錄一次累計的換行數(1GB約16K個數字)
+    build()可在背景執行緒建立 同時可查詢已建立的部分 查詢行首只需掃描一個區塊 """
+    def __init__(self, data: bytes|memoryview, block: int = 64 * 1024):
+        self.data = data
+        self.block = block
+        self.counts = array("Q", [0]) # counts[i] = data[:i*block]中的換行數
+
+    @property
+    def indexed_bytes(self) -> int:
+        return min((len(self.counts) - 1) * self.block, len(self.data))
+
+    @property
+    def complete(self) -> bool:
+        return self.indexed_bytes >= len(self.data)
+
+    @property
+    def line_count(self) -> int:
+        """ 已知的行數(建立完成前只算到已索引的部分) """
+        return self.counts[-1] + 1
+
+    def build(self, check: Callable[[], None]|None = None, report: Callable[[float], None]|None = None):
+        """ 建立(或繼續建立)索引 每段之間呼叫check(可取消)與report(進度0~1) """
+        data, block = self.data, self.block
+        count = self.counts[-1]
+        position = self.indexed_bytes
+        while position < len(data):
+            if check is not None: check()
+            scan = bytes(data[position:position + _SCAN_SIZE])
+            for start in range(0, len(scan), block):
+                count += scan.count(b"\n", start, start + block)
+                self.counts.append(count)
+            position += len(scan)
+            if report is not None: report(position / len(data))
+
+    def line_start(self, line: int) -> int:
+        """ 第line行(0起算)的起始位元組偏移 超出已索引的範圍時IndexError """
+        if line <= 0: return 0
+        if line > self.counts[-1]: raise IndexError(f"line {line} is not indexed yet")
+        index = bisect.bisect_left(self.counts, line) - 1 # counts[index] < line <= counts[index+1]
+        position = index * self.block
+        for _ in range(line - self.counts[index]):
+            position = self.data.find(b"\n", position) + 1
+        return position
+
+    def line_of(self, offset: int) -> int:
+        """ offset所在的行(0起算) 超出已索引的範圍時從已索引處往後數 """
+        index = min(offset // self.block, len(self.counts) - 1)
+        position, count = index * self.block, self.counts[index]
+        while position < offset:
+            end = min(offset, position + _SCAN_SIZE)
+            count += bytes(self.data[position:end]).count(b"\n")
+            position = end
+        return count
+
+def find_bytes(data: bytes|memoryview, needle: bytes, start: int = 0, end: int|None = None, backward: bool = False,
+               ignore_case: bool = False, check: Callable[[], None]|None = None, window: int = _SCAN_SIZE) -> int:
+    """ 在data[start:end](bytes/mmap)中分段尋找needle 不複製整份資料 回傳位元組偏移 找不到時-1
+    backward時回傳最後一個 ignore_case只忽略ASCII大小寫 每段之間呼叫check(可取消) """
+    end = len(data) if end is None else min(end, len(data))
+    if not needle: return -1
+    overlap = len(needle) - 1 # 跨段的結果
+    pattern = re.compile(re.escape(needle), re.IGNORECASE) if ignore_case else None
+    def search(low: int, high: int) -> int:
+        if pattern is None: return data.rfind(needle, low, high) if backward else data.find(needle, low, high)
+        if not backward:
+            match = pattern.search(data, low, high) # type: ignore[arg-type]
+            return -1 if match is None else match.start()
+        found, match = -1, pattern.search(data, low, high) # type: ignore[arg-type]
+        while match is not None: # 同rfind 可重疊
+            found = match.start()
+            match = pattern.search(data, found + 1, high) # type: ignore[arg-type]
+        return found
+    if not backward:
+        for low in range(start, end, window):
+            if check is not None: check()
+            found = search(low, min(low + window + overlap, end))
+            if found >= 0: return found
+        return -1
+    for high in range(end, start, -window):
+        if check is not None: check()
+        found = search(max(start, high - window - overlap), high)
+        if found >= 0: return found
+    return -1
+
+_ASTRAL = re.compile("[\U00010000-\U0010ffff]") # UTF-16中佔兩個單位的字元
+
+@functools.lru_cache(maxsize=64)
+def compile_pattern(pattern: str, flags: int = 0) -> re.Pattern[str]:
+    """ 編譯正規表示式 依(pattern, flags)快取 超過時淘汰最久沒用的 """
+    return re.compile(pattern, flags)
+
+def search_pattern(text: str, case_sensitive: bool = True, regex: bool = False, whole_word: bool = False) -> re.Pattern[str]:
+    """ 尋找欄的條件 -> pattern 純文字時跳脫 whole_word: 前後不能緊鄰文字字元 regex的^$對應行首行尾 無效的regex時re.error """
+    source = text if regex else re.escape(text)
+    if whole_word: source = rf"(?<!\w)(?:{source})(?!\w)"
+    return compile_pattern(source, (0 if case_sensitive else re.IGNORECASE) | (re.MULTILINE if regex else 0))
+
+def match_at(text: str, pattern: re.Pattern[str], start: int, end: int) -> re.Match[str]|None:
+    """ 一行text中[start, end)(UTF-16位置)正好是pattern的結果時回傳match(取代時展開反向參照) 否則None """
+    wide = [position + i for i, position in enumerate(match.start() for match in _ASTRAL.finditer(text))]
+    start, end = start - bisect.bisect_left(wide, start), end - bisect.bisect_left(wide, end)
+    match = pattern.match(text, start)
+    return match if match is not None and match.end() == end > start else None
+
+def search_line(text: str, pattern: re.Pattern[str], start: int, end: int, backward: bool = False) -> tuple[int, int]|None:
+    """ 在一行(段落)text中找完全落在[start, end)(UTF-16位置)的第一個(backward: 最後一個)非空結果 回傳UTF-16的起訖 """
+    astral = [match.start() for match in _ASTRAL.finditer(text)]
+    wide = [position + i for i, position in enumerate(astral)] # 這些字元在UTF-16中的位置
+    low, high = start - bisect.bisect_left(wide, start), end - bisect.bisect_left(wide, end)
+    found = None
+    for match in pattern.finditer(text, low, high): # 同iter_matches
+        if match.end() > match.start():
+            found = match
+            if not backward: break
+    if found is None: return None
+    first, last = found.span()
+    return first + bisect.bisect_left(astral, first), last + bisect.bisect_left(astral, last)
+
+def iter_matches(text: str, pattern: re.Pattern[str], start: int = 0, end: int|None = None) -> Iterator[re.Match[str]]:
+    """ text[start:end]中pattern的結果 不重疊(同finditer) 空的結果不算
+    結果不跨行(同QTextDocument.find逐段落搜尋): 通常一次掃過 只有碰到跨行的結果時 那一行改為單獨搜尋 """
+    end = len(text) if end is None else end
+    low = start
+    while low <= end:
+        for match in pattern.finditer(text, low, end):
+            first, last = match.span()
+            if first == last: continue
+            if text.find("\n", first, last) < 0:
+                yield match
+                low = last
+                continue
+            # 跨行: 這一行單獨搜尋 再從下一行繼續
+            line_end = text.find("\n", first)
+            for match in pattern.finditer(text, max(low, text.rfind("\n", 0, first) + 1), line_end):
+                if match.end() > match.start(): yield match
+            low = line_end + 1
+            break
+        else: return
+
+def _iter_spans(text: str, pattern: re.Pattern[str], offset: int = 0,
+                check: Callable[[], None]|None = None) -> Iterator[tuple[list[re.Match[str]], list[int], list[int]]]:
+    """ 分段(在換行處)搜尋text(文件中從offset開始的一段) 每段產生([match], [起點], [終點]) 位置為文件中的UTF-16位置
+    每段之前呼叫check(可取消) """
+    position = 0
+    while position < len(text):
+        if check is not None: check()
+        end = text.find("\n", position + _TEXT_SEGMENT) + 1 or len(text)
+        astral = [match.start() for match in _ASTRAL.finditer(text, position, end)] # 之前有幾個這種字元 位置就要加幾
+        matches = list(iter_matches(text, pattern, position, end))
+        base = offset - position
+        if astral:
+            starts = [base + match.start() + bisect.bisect_left(astral, match.start()) for match in matches]
+            stops = [base + match.end() + bisect.bisect_left(astral, match.end()) for match in matches]
+        else:
+            starts = [base + match.start() for match in matches]
+            stops = [base + match.end() for match in matches]
+        yield matches, starts, stops
+        offset += end - position + len(astral)
+        position = end
+
+def replace_all(text: str, pattern: re.Pattern[str], template: str, offset: int = 0, length: int = 0,
+                expand: bool = False) -> tuple[str, "MatchIndex", list[str]]:
+    """ 一次掃過text(長度為length的文件中從offset開始的一段) 取代所有結果(同MatchIndex.scan)
+    回傳(取代後的text, 取代前的結果, 每個結果取代成的文字) expand: template中的反向參照(\\1 \\g<name>)展開成結果的內容 無效時re.error """
+    expand = expand and "\\" in template # 沒有反向參照時不必逐個展開
+    index = MatchIndex(length)
+    bounds: list[int] = [0] # 結果之間的文字: text[bounds[2i]:bounds[2i+1]]
+    replacements: list[str] = []
+    for matches, starts, stops in _iter_spans(text, pattern, offset):
+        index.starts.extend(starts)
+        index.ends.extend(stops)
+        bounds += [position for match in matches for position in match.span()]
+        replacements += [match.expand(template) for match in matches] if expand else [template] * len(matches)
+    bounds.append(len(text))
+    index.gap = len(index.starts)
+    kept = [text[bounds[i]:bounds[i + 1]] for i in range(0, len(bounds), 2)]
+    if not expand: return template.join(kept), index, replacements
+    parts = [kept[0]]
+    for replacement, part in zip(replacements, kept[1:]): parts += [replacement, part]
+    return "".join(parts), index, replacements
+
+class MatchIndex:
+    """ 一次搜尋的所有結果 起訖位置(UTF-16單位 同QTextDocument)存成排序好的陣列
+    目前是第幾個/下一個/上一個都以二分搜尋 不必移動游標走過整份文件
+    文件變更時以replace換掉變更的那段 gap之後的位置存成相對於文件結尾(負數) 之後的結果不必逐一平移
+    連續在同一處編輯只需移動少量結果(同gap buffer) """
+    def __init__(self, length: int = 0):
+        self.starts = array("q")
+        self.ends = array("q")
+        self.length = length # 文件長度
+        self.gap = 0         # 之前的位置是絕對位置 之後的相對於文件結尾
+
+    @classmethod
+    def scan(cls, text: str, pattern: re.Pattern[str], offset: int = 0, length: int = 0,
+             check: Callable[[], None]|None = None, report: Callable[[int], None]|None = None) -> "MatchIndex":
+        """ 以pattern搜尋text(長度為length的文件中從offset開始的一段) 規則見iter_matches
+        分段(在換行處)搜尋 每段之前呼叫check(可取消) 之後呼叫report(目前的結果數) """
+        index = cls(length)
+        for _, starts, stops in _iter_spans(text, pattern, offset, check):
+            index.starts.extend(starts)
+            index.ends.extend(stops)
+            if report is not None: report(len(index.starts))
+        index.gap = len(index.starts)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def span(self, i: int) -> tuple[int, int]:
+        shift = self.length if i >= self.gap else 0
+        return self.starts[i] + shift, self.ends[i] + shift
+
+    def _first_at(self, position: int) -> int:
+        """ 第一個起點>=position的結果 沒有時len """
+        if self.gap and self.starts[self.gap - 1] >= position: return bisect.bisect_left(self.starts, position, 0, self.gap)
+        return bisect.bisect_left(self.starts, position - self.length, self.gap)
+
+    def _move_gap(self, gap: int):
+        starts, ends, length = self.starts, self.ends, self.length
+        for i in range(gap, self.gap):
+            starts[i] -= length
+            ends[i] -= length
+        for i in range(self.gap, gap):
+            starts[i] += length
+            ends[i] += length
+        self.gap = gap
+
+    def replace(self, start: int, end: int, delta: int, other: "MatchIndex"):
+        """ 文件中舊的[start, end)這段改寫後長度變化delta: 移除起點在這段的結果 換成other(這段重新搜尋的結果 新的位置)
+        之後的結果跟著平移 """
+        i, j = self._first_at(start), self._first_at(end)
+        self._move_gap(i)
+        self.starts[i:j] = other.starts[:other.gap]
+        self.ends[i:j] = other.ends[:other.gap]
+        self.gap = i + other.gap
+        self.length += delta
+
+    def index_of(self, start: int, end: int) -> int:
+        """ 起訖為(start, end)的結果是第幾個(0起算) 不是結果時-1 """
+        i = self._first_at(start)
+        return i if i < len(self.starts) and self.span(i) == (start, end) else -1
+
+    def next_after(self, position: int) -> int:
+        """ 第一個起點>=position的結果 沒有時回到第一個 """
+        i = self._first_at(position)
+        return i if i < len(self.starts) else 0
+
+    def prev_before(self, position: int) -> int:
+        """ 最後一個起點<position的結果 沒有時回到最後一個 """
+        i = self._first_at(position) - 1
+        return i if i >= 0 else len(self.starts) - 1
@@ -0,0 +1,52 @@
+from .yoJournal import Op
+import codecs
+
+# 分頁與Find in Files共用的文字處理: 普通檔案的編碼判斷/解碼 UTF-16位置 日誌重播
+ENCODING_SAMPLE_SIZE = 64 * 1024 # 判斷編碼時解碼的樣本大小
+BOMS = ((codecs.BOM_UTF32_LE, "utf-32"), (codecs.BOM_UTF32_BE, "utf-32"), (codecs.BOM_UTF8, "utf-8-sig"),
+        (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16")) # UTF-32LE的BOM以UTF-16LE的BOM開頭 要先比對
+
+def utf16_len(text: str) -> int:
+    """ 文字在QTextDocument中佔的位置數(UTF-16單位) """
+    return len(text.encode("utf-16-le", "surrogatepass")) // 2
+
+def detect_encoding(sample: bytes, complete: bool, encodings: tuple[str, ...]) -> str:
+    """ 由BOM或開頭的樣本判斷編碼(依序嘗試encodings) 只以增量解碼器解碼樣本(complete=False時結尾被切斷的字元不算錯) """
+    for bom, name in BOMS:
+        if sample.startswith(bom): return name
+    for name in encodings:
+        try: codecs.getincrementaldecoder(name)().decode(sample, final=complete)
+        except UnicodeDecodeError: continue
+        return name
+    return "latin-1"
+
+def encoding_candidates(detected: str, encodings: tuple[str, ...]) -> tuple[str, ...]:
+    """ 依序嘗試的編碼 樣本之後才出現不符的位元組時 改用之後的編碼 最後是latin-1(不會失敗) """
+    if detected in encodings: return (*encodings[encodings.index(detected):], "latin-1")
+    return (detected, "latin-1")
+
+def decode_plain(data: bytes, encodings: tuple[str, ...]) -> tuple[str, str]:
+    """ 解碼普通檔案 回傳(文字, 編碼) 換行統一為\\n(同文字模式的open) 通常只解碼一次 """
+    sample = data[:ENCODING_SAMPLE_SIZE]
+    for name in encoding_candidates(detect_encoding(sample, len(sample) == len(data), encodings), encodings):
+        try: text = str(data, name)
+        except UnicodeDecodeError: continue
+        return text.replace("\r\n", "\n").replace("\r", "\n"), name
+    raise RuntimeError("latin-1 should decode anything")
+
+def check_journal(length: int, records: list[tuple[list[Op], int]]):
+    """ 重播前驗證日誌的每筆操作都在範圍內且長度相符(不會只套用一半) 不符時ValueError length: base的UTF-16長度 """
+    for ops, expected in records:
+        for position, removed, text in ops:
+            if position > length: raise ValueError("日誌與檔案內容不符")
+            length += utf16_len(text) - min(removed, length - position)
+        if length != expected: raise ValueError("日誌與檔案內容不符")
+
+def replay_journal(text: str, records: list[tuple[list[Op], int]]) -> str:
+    """ 套用日誌的操作到文字(位置與長度為UTF-16單位) 不符時ValueError """
+    data = bytearray(text.encode("utf-16-le", "surrogatepass"))
+    check_journal(len(data) // 2, records)
+    for ops, _ in records:
+        for position, removed, inserted in ops:
+            data[2 * position:2 * min(position + removed, len(data) // 2)] = inserted.encode("utf-16-le", "surrogatepass")
+    return data.decode("utf-16-le", "surrogatepass")